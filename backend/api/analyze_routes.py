@@ -4,21 +4,33 @@ Analysis API Routes - Handle product lifecycle analysis
 from flask import Blueprint, request, jsonify, Response
 import sys
 import os
-from datetime import datetime
 # Add backend directory to path
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, backend_dir)
 from services.azure_ai_service import AzureAIService
-from services.excel_service import split_products_into_chunks
-from services.analysis_logger import log_analysis_results, log_analysis_results_json, log_chunk_result
+from services.analysis_logger import AnalysisRunLog
+from services.chunk_controller import get_chunk_controller
+from services.chunk_planner import ChunkPlan, DEFAULT_CRITICALITY_WEIGHTS
+from services.llm_worker_pool import get_llm_worker_pool, lane_for
+from services.write_behind_service import WriteBehindRun
+from services.metrics_service import CRITICAL_RESULTS_SECONDS, SSE_CONNECTIONS, track_in_flight
+from services.tracing_service import set_run_id, stage_timing, stream_in_span, traced_task
 import json
+import time
+import threading
 import concurrent.futures
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from database.part_key import product_part_key
 
 analyze_bp = Blueprint('analyze', __name__)
 azure_ai_service = None  # Lazy initialization to avoid startup crashes
 
-CHUNK_SIZE = 10
+# Seconds to wait for write-behind persistence to catch up once analysis is done
+PERSIST_FLUSH_TIMEOUT = 30
+
+# Runs in progress by run id, so clients can raise the priority of rows they are viewing
+_active_runners: Dict[str, '_ChunkRunner'] = {}
+_active_runners_lock = threading.Lock()
 
 def _should_analyze_product(product: Dict[str, Any]) -> bool:
     """
@@ -47,6 +59,161 @@ def _create_skipped_result(product: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+class _ChunkRunner:
+    """
+    Cut products into chunks as workers free up, and queue them on the process-wide
+    LLM worker pool, up to the chunk controller's concurrency limit at a time. Chunks
+    come from a ChunkPlan (deduplicated, critical products first, grouped by
+    manufacturer, within a token budget) at the controller's chunk size. Each finished
+    chunk's duration and fallback outcome is fed back to the controller.
+    """
+
+    def __init__(
+        self,
+        products: List[Dict[str, Any]],
+        agent: str,
+        call: Callable[[List[Dict[str, Any]], Optional[str]], Any],
+        is_fallback: Callable[[Any], bool],
+        criticality_weights: Optional[Dict[str, float]] = None
+    ):
+        self.agent = agent
+        self.controller = get_chunk_controller(agent)
+        self.call = call
+        self.is_fallback = is_fallback
+        self.conversation_id = None  # Passed to chunks submitted after it is known
+        self.plan = ChunkPlan(products, agent, weights=criticality_weights)
+        self.lane = lane_for(self.plan.unique_products)
+        self._submitted = 0
+        self._critical_pending = self.plan.critical_products
+
+    def estimated_total_chunks(self) -> int:
+        """
+        Chunks submitted so far plus those the remaining products need at the
+        current chunk size (one more before the small first chunk is cut).
+        """
+        estimate = self._submitted + self.plan.estimate_chunks(self.controller.chunk_size)
+        if self._submitted == 0 and self.plan.remaining() > self.controller.first_chunk_size():
+            estimate += 1
+        return estimate
+
+    def _timed_call(self, chunk: List[Dict[str, Any]], conversation_id: Optional[str]) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        result = self.call(chunk, conversation_id)
+        return result, time.perf_counter() - start
+
+    def run(self, run_id: Optional[str] = None):
+        """
+        With a run_id, the run accepts priority boosts (POST /api/analyze/priority)
+        until it ends. Chunks still queued when the run is closed early (e.g. the
+        client disconnects) are cancelled.
+
+        Yields:
+            ('start', chunk_idx, chunk, priority) when a chunk is submitted,
+            ('done', chunk_idx, chunk, result, error) when it finishes (in completion order), and
+            ('critical_done', seconds) once every critical product's chunk has finished
+        """
+        if run_id:
+            with _active_runners_lock:
+                _active_runners[run_id] = self
+        start = time.perf_counter()
+        in_flight = {}
+        try:
+            with get_llm_worker_pool().open_flow(run_id or f"{self.agent}_{id(self):x}", self.lane) as flow:
+                while self.plan.remaining() or in_flight:
+                    while self.plan.remaining() and len(in_flight) < self.controller.concurrency:
+                        size = self.controller.first_chunk_size() if self._submitted == 0 else self.controller.chunk_size
+                        chunk, priority = self.plan.next_chunk(size)
+                        if not chunk:
+                            break
+                        self._submitted += 1
+                        future = flow.submit(
+                            self.agent, len(chunk), traced_task(self._timed_call), chunk, self.conversation_id
+                        )
+                        in_flight[future] = (self._submitted, chunk)
+                        yield ('start', self._submitted, chunk, priority)
+
+                    done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        chunk_idx, chunk = in_flight.pop(future)
+                        try:
+                            result, seconds = future.result()
+                        except Exception as e:
+                            yield ('done', chunk_idx, chunk, None, e)
+                        else:
+                            self.controller.record_chunk(len(chunk), seconds, self.is_fallback(result))
+                            yield ('done', chunk_idx, chunk, result, None)
+
+                        if self._critical_pending:
+                            self._critical_pending -= self.plan.critical_count(chunk)
+                            if self._critical_pending <= 0:
+                                self._critical_pending = 0
+                                elapsed = time.perf_counter() - start
+                                CRITICAL_RESULTS_SECONDS.observe(elapsed, (self.agent,))
+                                yield ('critical_done', elapsed)
+        finally:
+            if run_id:
+                with _active_runners_lock:
+                    _active_runners.pop(run_id, None)
+
+    def boost(self, part_keys: List[str]) -> int:
+        """
+        Move the products with these part keys ahead of all chunks not yet submitted.
+        """
+        return self.plan.boost(part_keys)
+
+
+def _collect_stream(stream) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+    """
+    Drain a chunk's event stream in a worker thread.
+
+    Returns:
+        Tuple of (JSON event strings to forward, the parsed "result" event or None)
+    """
+    events = []
+    result_event = None
+    for stream_data in stream:
+        events.append(stream_data)
+        try:
+            stream_obj = json.loads(stream_data)
+        except ValueError:
+            continue
+        if stream_obj.get('type') == 'result' and stream_obj.get('data'):
+            result_event = stream_obj
+    return events, result_event
+
+
+def _parse_criticality_weights(value: Any) -> Optional[Dict[str, float]]:
+    """
+    Per-request criticality weights ({"will_failure_stop_machine": 5, ...});
+    None (the CRITICALITY_WEIGHTS setting) if not given.
+
+    Raises:
+        ValueError: If the value is not an object of known fields to numbers
+    """
+    if value is None:
+        return None
+    if not isinstance(value, dict):
+        raise ValueError("criticality must be an object of field weights")
+    weights = {}
+    for field, weight in value.items():
+        if field not in DEFAULT_CRITICALITY_WEIGHTS:
+            raise ValueError(f"Unknown criticality field {field!r} (expected one of {', '.join(DEFAULT_CRITICALITY_WEIGHTS)})")
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+            raise ValueError(f"Criticality weight of {field!r} must be a number")
+        weights[field] = float(weight)
+    return weights
+
+
+def _is_fallback_result(result: Dict[str, Any]) -> bool:
+    parsed_json = result.get('parsed_json') if result else None
+    return not parsed_json or bool(parsed_json.get('fallback'))
+
+
+def _is_fallback_stream(collected: Tuple[List[str], Optional[Dict[str, Any]]]) -> bool:
+    result_event = collected[1]
+    return result_event is None or bool(result_event['data'].get('fallback'))
+
+
 def get_azure_ai_service():
     """
     Get or create AzureAIService instance with lazy initialization.
@@ -78,7 +245,9 @@ def analyze_products():
                 },
                 ...
             ],
-            "stream": false  // optional, default false
+            "stream": false,  // optional, default false
+            "persist": false,  // optional: update saved parts with results as chunks complete
+            "criticality": {"will_failure_stop_machine": 3, ...}  // optional: scheduling weights
         }
         
     Response (non-streaming):
@@ -94,11 +263,18 @@ def analyze_products():
                 },
                 ...
             ],
-            "total_analyzed": 10
+            "total_analyzed": 10,
+            "run_id": "analysis_20250101_120000_a1b2c3",  // record id in logs/runs.jsonl
+            "persistence": {...}  // only with persist: true
         }
         
     Response (streaming):
-        Server-Sent Events (SSE) stream with JSON objects
+        Server-Sent Events (SSE) stream with JSON objects. With persist: true a
+        "persistence" event (persisted/pending rows, lag_seconds) follows each
+        chunk_complete, and a final one with "final": true follows complete.
+        Critical products (by the criticality weights) are analyzed first; a
+        "critical_complete" event follows once all of them have results. The run_id
+        in the start event can be passed to /api/analyze/priority.
     """
     try:
         data = request.json or {}
@@ -110,11 +286,17 @@ def analyze_products():
         
         if not isinstance(products, list):
             return jsonify({"error": "Products must be a list"}), 400
+
+        try:
+            criticality_weights = _parse_criticality_weights(data.get('criticality'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        persist_run = WriteBehindRun('analysis') if data.get('persist') else None
         
         # If streaming requested, use streaming endpoint
         if stream:
             return Response(
-                _stream_analysis(products),
+                stream_in_span(_stream_analysis(products, persist_run, criticality_weights), 'analysis.stream'),
                 mimetype='text/event-stream',
                 headers={
                     'Cache-Control': 'no-cache',
@@ -130,6 +312,8 @@ def analyze_products():
         # Create results for skipped products (no AI analysis)
         skipped_results = [_create_skipped_result(p) for p in products_to_skip]
         all_results = skipped_results.copy()
+        run_log = AnalysisRunLog("analysis", total_products=len(products))
+        set_run_id(run_log.run_id)
         
         # If there are products to analyze, process them
         if products_to_analyze:
@@ -141,112 +325,66 @@ def analyze_products():
                     "error": "Azure AI service is not available. Please ensure Azure Service Principal credentials are configured (AZURE_TENANT_ID, AZURE_CLIENT_ID, AZURE_CLIENT_SECRET)."
                 }), 503
             
-            # Split into chunks for parallel processing
-            chunks = split_products_into_chunks(products_to_analyze, chunk_size=CHUNK_SIZE)
-            conversation_id = None
-            
-            # Initialize log file for chunk-by-chunk logging
-            chunk_log_path = None
-            
-            # Process chunks in parallel using ThreadPoolExecutor
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(chunks), 5)) as executor:
-                future_to_chunk = {
-                    executor.submit(analyze_service.analyze_product_chunk, chunk, conversation_id): (idx, chunk)
-                    for idx, chunk in enumerate(chunks, 1)
-                }
-                
-                for future in concurrent.futures.as_completed(future_to_chunk):
-                    chunk_idx, chunk = future_to_chunk[future]
-                    try:
-                        result = future.result()
-                        
-                        # Log each chunk result (success or error)
-                        chunk_log_path = log_chunk_result(
-                            chunk_index=chunk_idx,
-                            chunk_result=result,
-                            chunk_products=chunk,
-                            analysis_type="analysis",
-                            log_file_path=chunk_log_path
-                        )
-                        
-                        if result['success'] and result.get('parsed_json'):
-                            parsed_json = result['parsed_json']
-                            if isinstance(parsed_json, dict) and 'results' in parsed_json:
-                                all_results.extend(parsed_json['results'])
-                            # Update conversation_id for next chunk (if available)
-                            if result.get('conversation_id'):
-                                conversation_id = result['conversation_id']
-                        else:
-                            # Log error result
-                            error_result = {
-                                'success': False,
-                                'error': result.get('error', 'Unknown error'),
-                                'parsed_json': None
-                            }
-                            chunk_log_path = log_chunk_result(
-                                chunk_index=chunk_idx,
-                                chunk_result=error_result,
-                                chunk_products=chunk,
-                                analysis_type="analysis",
-                                log_file_path=chunk_log_path
-                            )
-                    except Exception as e:
-                        # Log exception for this chunk
-                        error_result = {
-                            'success': False,
-                            'error': str(e),
-                            'parsed_json': None
-                        }
-                        chunk_log_path = log_chunk_result(
-                            chunk_index=chunk_idx,
-                            chunk_result=error_result,
-                            chunk_products=chunk,
-                            analysis_type="analysis",
-                            log_file_path=chunk_log_path
-                        )
-        
-        # Finalize chunk log and create summary log
-        try:
-            # Add summary to chunk log if it exists
-            if chunk_log_path:
-                with open(chunk_log_path, 'a', encoding='utf-8') as f:
-                    f.write(f"\n{'=' * 80}\n")
-                    f.write(f"FINAL SUMMARY\n")
-                    f.write(f"{'=' * 80}\n")
-                    f.write(f"Total Products Analyzed: {len(products_to_analyze)}\n")
-                    f.write(f"Total Products Skipped: {len(products_to_skip)}\n")
-                    f.write(f"Total Results: {len(all_results)}\n")
-                    f.write(f"Completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"{'=' * 80}\n")
-                print(f"Chunk-by-chunk analysis log: {chunk_log_path}")
-            
-            # Also create summary log file
-            summary_log_path = log_analysis_results(
-                results=all_results,
-                analysis_type="analysis",
-                total_analyzed=len(products_to_analyze),
-                total_skipped=len(products_to_skip)
+            # Run chunks in parallel, sized and throttled by the chunk controller
+            runner = _ChunkRunner(
+                products_to_analyze, 'analysis', analyze_service.analyze_product_chunk, _is_fallback_result,
+                criticality_weights
             )
-            # Also log as JSON for programmatic access
-            json_log_path = log_analysis_results_json(
-                results=all_results,
-                analysis_type="analysis",
-                total_analyzed=len(products_to_analyze),
-                total_skipped=len(products_to_skip)
-            )
-            if summary_log_path:
-                print(f"Summary analysis log: {summary_log_path}")
-            if json_log_path:
-                print(f"Analysis results (JSON) logged to: {json_log_path}")
-        except Exception as e:
-            print(f"Warning: Failed to log analysis results: {e}")
+            for event in runner.run(run_log.run_id):
+                if event[0] != 'done':
+                    continue
+                _, chunk_idx, chunk, result, error = event
+                if error is not None:
+                    # Log exception for this chunk
+                    error_result = {
+                        'success': False,
+                        'error': str(error),
+                        'parsed_json': None
+                    }
+                    run_log.log_chunk(chunk_idx, error_result, chunk)
+                elif result['success'] and result.get('parsed_json'):
+                    parsed_json = result['parsed_json']
+                    if isinstance(parsed_json, dict) and 'results' in parsed_json:
+                        # Copy results to duplicate parts that weren't sent to the agent
+                        chunk_pairs = runner.plan.pair(parsed_json['results'], chunk)
+                        chunk_results = [paired for paired, _ in chunk_pairs]
+                        result = {**result, 'parsed_json': {**parsed_json, 'results': chunk_results}}
+                        all_results.extend(chunk_results)
+                        # Fallback results ("Review", low confidence) must not replace saved ones
+                        if persist_run and not _is_fallback_result(result):
+                            persist_run.submit(chunk_pairs)
+                    # Log each chunk result (success or error)
+                    run_log.log_chunk(chunk_idx, result, chunk)
+                    # Update conversation_id for later chunks (if available)
+                    if result.get('conversation_id'):
+                        runner.conversation_id = result['conversation_id']
+                else:
+                    # Log error result
+                    error_result = {
+                        'success': False,
+                        'error': result.get('error', 'Unknown error'),
+                        'parsed_json': None
+                    }
+                    run_log.log_chunk(chunk_idx, error_result, chunk)
+        
+        # Log the run summary (written in the background)
+        run_log.complete(
+            total_results=len(all_results),
+            total_analyzed=len(products_to_analyze),
+            total_skipped=len(products_to_skip),
+            skipped_results=skipped_results
+        )
         
-        return jsonify({
+        response_data = {
             "success": True,
             "results": all_results,
             "total_analyzed": len(products_to_analyze),
-            "total_skipped": len(products_to_skip)
-        })
+            "total_skipped": len(products_to_skip),
+            "run_id": run_log.run_id
+        }
+        if persist_run:
+            response_data["persistence"] = persist_run.wait(PERSIST_FLUSH_TIMEOUT)
+        return jsonify(response_data)
         
     except Exception as e:
         return jsonify({
@@ -255,12 +393,19 @@ def analyze_products():
         }), 500
 
 
-def _stream_analysis(products: List[Dict[str, Any]]):
+@track_in_flight(SSE_CONNECTIONS, ('analyze',))
+def _stream_analysis(
+    products: List[Dict[str, Any]],
+    persist_run: Optional[WriteBehindRun] = None,
+    criticality_weights: Optional[Dict[str, float]] = None
+):
     """
     Stream analysis results using Server-Sent Events
     
     Args:
         products: List of products to analyze
+        persist_run: Write-behind run that persists each chunk's results (optional)
+        criticality_weights: Scheduling weights overriding CRITICALITY_WEIGHTS (optional)
         
     Yields:
         SSE-formatted strings
@@ -284,114 +429,161 @@ def _stream_analysis(products: List[Dict[str, Any]]):
             yield f"data: {json.dumps({'type': 'complete', 'results': all_results, 'total_analyzed': total_to_analyze, 'total_skipped': total_skipped})}\n\n"
             return
         
-        # Split products that need analysis into chunks
-        chunks = split_products_into_chunks(products_to_analyze, chunk_size=CHUNK_SIZE)
-        total_chunks = len(chunks)
-        
-        # Send initial progress
-        yield f"data: {json.dumps({'type': 'start', 'total_chunks': total_chunks, 'total_products': total_products, 'total_to_analyze': total_to_analyze, 'total_skipped': total_skipped})}\n\n"
-        
-        conversation_id = None
-
         # Get Azure AI service lazily (only when needed)
         analyze_service = get_azure_ai_service()
         if analyze_service is None:
+            yield f"data: {json.dumps({'type': 'start', 'total_chunks': 0, 'total_products': total_products, 'total_to_analyze': total_to_analyze, 'total_skipped': total_skipped})}\n\n"
             error_msg = "Azure AI service is not available. Please ensure Azure Service Principal credentials are configured (AZURE_TENANT_ID, AZURE_CLIENT_ID, AZURE_CLIENT_SECRET)."
             yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
             return
 
-        # Initialize log file for chunk-by-chunk logging
-        chunk_log_path = None
+        # Chunks are cut as workers free up, sized by the chunk controller
+        runner = _ChunkRunner(
+            products_to_analyze,
+            'analysis',
+            lambda chunk, conversation_id: _collect_stream(
+                analyze_service.analyze_product_chunk_streaming(chunk, conversation_id)
+            ),
+            _is_fallback_stream,
+            criticality_weights
+        )
 
-        # Process chunks sequentially for streaming (can be parallelized with more complex logic)
-        for idx, chunk in enumerate(chunks):
-            # Send chunk progress
-            yield f"data: {json.dumps({'type': 'chunk_start', 'chunk': idx + 1, 'total_chunks': total_chunks, 'products_in_chunk': len(chunk)})}\n\n"
-            
+        # Structured log of this run, written in the background
+        run_log = AnalysisRunLog("analysis", total_products=total_products)
+        set_run_id(run_log.run_id)
+        
+        # Send initial progress (total_chunks is an estimate; chunk sizes adapt during the run)
+        yield f"data: {json.dumps({'type': 'start', 'run_id': run_log.run_id, 'total_chunks': runner.estimated_total_chunks(), 'total_products': total_products, 'total_to_analyze': total_to_analyze, 'total_skipped': total_skipped, 'total_duplicates': runner.plan.duplicate_products, 'total_critical': runner.plan.critical_products, 'lane': runner.lane})}\n\n"
+        yield f"data: {json.dumps({'type': 'controller', **runner.controller.snapshot()})}\n\n"
+        controller_version = runner.controller.version
+
+        # Chunks run concurrently, critical products first; results stream in completion order
+        for event in runner.run(run_log.run_id):
+            if event[0] == 'start':
+                _, chunk_idx, chunk, priority = event
+                yield f"data: {json.dumps({'type': 'chunk_start', 'chunk': chunk_idx, 'total_chunks': runner.estimated_total_chunks(), 'products_in_chunk': len(chunk), 'priority': priority})}\n\n"
+                continue
+            if event[0] == 'critical_done':
+                yield f"data: {json.dumps({'type': 'critical_complete', 'total_critical': runner.plan.critical_products, 'seconds': round(event[1], 3)})}\n\n"
+                continue
+
+            _, chunk_idx, chunk, collected, error = event
             chunk_result = {'success': False, 'parsed_json': None, 'error': None}
-            chunk_results_data = []
             
-            try:
-                # Analyze chunk
-                for stream_data in analyze_service.analyze_product_chunk_streaming(chunk, conversation_id):
-                    yield f"data: {stream_data}\n\n"
-                    
-                    # Parse the stream data to extract results
-                    try:
-                        stream_obj = json.loads(stream_data)
-                        if stream_obj.get('type') == 'result' and stream_obj.get('data'):
-                            chunk_results_data = stream_obj['data'].get('results', [])
-                            all_results.extend(chunk_results_data)
-                            chunk_result = {
-                                'success': True,
-                                'parsed_json': {'results': chunk_results_data},
-                                'error': None
-                            }
-                            if stream_obj.get('conversation_id'):
-                                conversation_id = stream_obj['conversation_id']
-                    except:
-                        pass
-            except Exception as e:
+            if error is not None:
                 chunk_result = {
                     'success': False,
                     'parsed_json': None,
-                    'error': str(e)
+                    'error': str(error)
                 }
+            else:
+                stream_events, result_event = collected
+                for stream_data in stream_events:
+                    yield f"data: {stream_data}\n\n"
+                if result_event:
+                    chunk_results_data = result_event['data'].get('results', [])
+                    # Copy results to duplicate parts that weren't sent to the agent
+                    chunk_pairs = runner.plan.pair(chunk_results_data, chunk)
+                    fanned_out = [paired for paired, _ in chunk_pairs]
+                    if len(fanned_out) > len(chunk_results_data):
+                        yield f"data: {json.dumps({'type': 'result', 'duplicates': True, 'data': {'results': fanned_out[len(chunk_results_data):]}})}\n\n"
+                    chunk_results_data = fanned_out
+                    all_results.extend(chunk_results_data)
+                    # Fallback results ("Review", low confidence) must not replace saved ones
+                    if persist_run and not _is_fallback_stream(collected):
+                        persist_run.submit(chunk_pairs)
+                    chunk_result = {
+                        'success': True,
+                        'parsed_json': {'results': chunk_results_data},
+                        'error': None
+                    }
+                    if result_event.get('conversation_id'):
+                        runner.conversation_id = result_event['conversation_id']
             
             # Log each chunk result (success or error)
-            chunk_log_path = log_chunk_result(
-                chunk_index=idx + 1,
-                chunk_result=chunk_result,
-                chunk_products=chunk,
-                analysis_type="analysis",
-                log_file_path=chunk_log_path
-            )
+            run_log.log_chunk(chunk_idx, chunk_result, chunk)
             
             # Send chunk complete
-            yield f"data: {json.dumps({'type': 'chunk_complete', 'chunk': idx + 1, 'total_chunks': total_chunks})}\n\n"
+            yield f"data: {json.dumps({'type': 'chunk_complete', 'chunk': chunk_idx, 'total_chunks': runner.estimated_total_chunks()})}\n\n"
+            if persist_run:
+                yield f"data: {json.dumps({'type': 'persistence', **persist_run.status()})}\n\n"
+            if runner.controller.version != controller_version:
+                controller_version = runner.controller.version
+                yield f"data: {json.dumps({'type': 'controller', **runner.controller.snapshot()})}\n\n"
         
         # Send final results
-        yield f"data: {json.dumps({'type': 'complete', 'results': all_results, 'total_analyzed': total_to_analyze, 'total_skipped': total_skipped})}\n\n"
-        
-        # Finalize chunk log and create summary log
-        try:
-            # Add summary to chunk log if it exists
-            if chunk_log_path:
-                with open(chunk_log_path, 'a', encoding='utf-8') as f:
-                    f.write(f"\n{'=' * 80}\n")
-                    f.write(f"FINAL SUMMARY\n")
-                    f.write(f"{'=' * 80}\n")
-                    f.write(f"Total Products Analyzed: {total_to_analyze}\n")
-                    f.write(f"Total Products Skipped: {total_skipped}\n")
-                    f.write(f"Total Results: {len(all_results)}\n")
-                    f.write(f"Completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"{'=' * 80}\n")
-                print(f"Chunk-by-chunk analysis log: {chunk_log_path}")
-            
-            # Also create summary log file
-            summary_log_path = log_analysis_results(
-                results=all_results,
-                analysis_type="analysis",
-                total_analyzed=total_to_analyze,
-                total_skipped=total_skipped
-            )
-            # Also log as JSON for programmatic access
-            json_log_path = log_analysis_results_json(
-                results=all_results,
-                analysis_type="analysis",
-                total_analyzed=total_to_analyze,
-                total_skipped=total_skipped
-            )
-            if summary_log_path:
-                print(f"Summary analysis log: {summary_log_path}")
-            if json_log_path:
-                print(f"Analysis results (JSON) logged to: {json_log_path}")
-        except Exception as e:
-            print(f"Warning: Failed to log analysis results: {e}")
+        yield f"data: {json.dumps({'type': 'complete', 'results': all_results, 'total_analyzed': total_to_analyze, 'total_skipped': total_skipped, 'run_id': run_log.run_id, 'timing': stage_timing()})}\n\n"
+        if persist_run:
+            yield f"data: {json.dumps({'type': 'persistence', 'final': True, **persist_run.wait(PERSIST_FLUSH_TIMEOUT)})}\n\n"
+        
+        # Log the run summary (written in the background)
+        run_log.complete(
+            total_results=len(all_results),
+            total_analyzed=total_to_analyze,
+            total_skipped=total_skipped,
+            skipped_results=skipped_results
+        )
         
     except Exception as e:
         yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
+@analyze_bp.route('/analyze/priority', methods=['POST'])
+def raise_priority():
+    """
+    Raise the priority of rows the client is viewing in a running analysis or
+    replacement search. Their chunks are sent next, ahead of critical products.
+    POST /api/analyze/priority
+    
+    Request:
+        {
+            "run_id": "analysis_20250101_120000_a1b2c3",  // from the stream's start event
+            "products": [
+                {
+                    "manufacturer": "BANNER",
+                    "part_number": "45136"
+                },
+                ...
+            ]
+        }
+        
+    Response:
+        {
+            "success": true,
+            "boosted": 3  // products moved ahead (rows already sent are not counted)
+        }
+    """
+    try:
+        data = request.json or {}
+        run_id = data.get('run_id')
+        products = data.get('products', [])
+        
+        if not run_id:
+            return jsonify({"error": "No run_id provided"}), 400
+        
+        if not isinstance(products, list):
+            return jsonify({"error": "Products must be a list"}), 400
+        
+        with _active_runners_lock:
+            runner = _active_runners.get(run_id)
+        if runner is None:
+            return jsonify({
+                "success": False,
+                "error": f"Run {run_id} is not in progress"
+            }), 404
+        
+        part_keys = [product_part_key(p) for p in products if isinstance(p, dict)]
+        return jsonify({
+            "success": True,
+            "boosted": runner.boost(part_keys)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
 @analyze_bp.route('/find_replacements', methods=['POST'])
 def find_replacements():
     """
@@ -406,11 +598,14 @@ def find_replacements():
                     "part_number": "45136"
                 },
                 ...
-            ]
+            ],
+            "persist": false,  // optional: update saved parts with replacements as chunks complete
+            "criticality": {"will_failure_stop_machine": 3, ...}  // optional: scheduling weights
         }
         
     Response:
-        Server-Sent Events (SSE) stream with JSON objects
+        Server-Sent Events (SSE) stream with JSON objects (plus "persistence"
+        events with persist: true, and critical-first scheduling as for /api/analyze)
     """
     try:
         data = request.json or {}
@@ -421,10 +616,16 @@ def find_replacements():
         
         if not isinstance(products, list):
             return jsonify({"error": "Products must be a list"}), 400
+
+        try:
+            criticality_weights = _parse_criticality_weights(data.get('criticality'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        persist_run = WriteBehindRun('replacements') if data.get('persist') else None
         
         # Return streaming response
         return Response(
-            _stream_find_replacements(products),
+            stream_in_span(_stream_find_replacements(products, persist_run, criticality_weights), 'replacements.stream'),
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache',
@@ -440,120 +641,114 @@ def find_replacements():
         }), 500
 
 
-def _stream_find_replacements(products: List[Dict[str, Any]]):
+@track_in_flight(SSE_CONNECTIONS, ('find_replacements',))
+def _stream_find_replacements(
+    products: List[Dict[str, Any]],
+    persist_run: Optional[WriteBehindRun] = None,
+    criticality_weights: Optional[Dict[str, float]] = None
+):
     """
     Stream replacement finding results using Server-Sent Events
     
     Args:
         products: List of products to find replacements for
+        persist_run: Write-behind run that persists each chunk's results (optional)
+        criticality_weights: Scheduling weights overriding CRITICALITY_WEIGHTS (optional)
     Yields:
         SSE-formatted strings
     """
     try:
-        # Split into chunks
-        chunks = split_products_into_chunks(products, chunk_size=CHUNK_SIZE)
-        total_chunks = len(chunks)
-        
-        # Send initial progress
-        yield f"data: {json.dumps({'type': 'start', 'total_chunks': total_chunks, 'total_products': len(products)})}\n\n"
-        
         all_results = []
-        conversation_id = None
         
         # Get Azure AI service lazily (only when needed)
         replacement_service = get_azure_ai_service()
         if replacement_service is None:
+            yield f"data: {json.dumps({'type': 'start', 'total_chunks': 0, 'total_products': len(products)})}\n\n"
             error_msg = "Azure AI service is not available. Please ensure Azure Service Principal credentials are configured (AZURE_TENANT_ID, AZURE_CLIENT_ID, AZURE_CLIENT_SECRET)."
             yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
             return
         
-        # Initialize log file for chunk-by-chunk logging
-        chunk_log_path = None
+        # Chunks are cut as workers free up, sized by the chunk controller
+        runner = _ChunkRunner(
+            products,
+            'replacement',
+            lambda chunk, conversation_id: _collect_stream(
+                replacement_service.find_replacement_chunk_streaming(chunk, conversation_id)
+            ),
+            _is_fallback_stream,
+            criticality_weights
+        )
         
-        # Process chunks sequentially for streaming
-        for idx, chunk in enumerate(chunks):
-            # Send chunk progress
-            yield f"data: {json.dumps({'type': 'chunk_start', 'chunk': idx + 1, 'total_chunks': total_chunks, 'products_in_chunk': len(chunk)})}\n\n"
-            
+        # Structured log of this run, written in the background
+        run_log = AnalysisRunLog("replacements", total_products=len(products))
+        set_run_id(run_log.run_id)
+        
+        # Send initial progress (total_chunks is an estimate; chunk sizes adapt during the run)
+        yield f"data: {json.dumps({'type': 'start', 'run_id': run_log.run_id, 'total_chunks': runner.estimated_total_chunks(), 'total_products': len(products), 'total_duplicates': runner.plan.duplicate_products, 'total_critical': runner.plan.critical_products, 'lane': runner.lane})}\n\n"
+        yield f"data: {json.dumps({'type': 'controller', **runner.controller.snapshot()})}\n\n"
+        controller_version = runner.controller.version
+        
+        # Chunks run concurrently, critical products first; results stream in completion order
+        for event in runner.run(run_log.run_id):
+            if event[0] == 'start':
+                _, chunk_idx, chunk, priority = event
+                yield f"data: {json.dumps({'type': 'chunk_start', 'chunk': chunk_idx, 'total_chunks': runner.estimated_total_chunks(), 'products_in_chunk': len(chunk), 'priority': priority})}\n\n"
+                continue
+            if event[0] == 'critical_done':
+                yield f"data: {json.dumps({'type': 'critical_complete', 'total_critical': runner.plan.critical_products, 'seconds': round(event[1], 3)})}\n\n"
+                continue
+
+            _, chunk_idx, chunk, collected, error = event
             chunk_result = {'success': False, 'parsed_json': None, 'error': None}
-            chunk_results_data = []
             
-            try:
-                # Find replacements for chunk using Azure AI
-                for stream_data in replacement_service.find_replacement_chunk_streaming(chunk, conversation_id):
-                    yield f"data: {stream_data}\n\n"
-                    
-                    # Parse the stream data to extract results
-                    try:
-                        stream_obj = json.loads(stream_data)
-                        if stream_obj.get('type') == 'result' and stream_obj.get('data'):
-                            chunk_results_data = stream_obj['data'].get('results', [])
-                            all_results.extend(chunk_results_data)
-                            chunk_result = {
-                                'success': True,
-                                'parsed_json': {'results': chunk_results_data},
-                                'error': None
-                            }
-                            if stream_obj.get('conversation_id'):
-                                conversation_id = stream_obj['conversation_id']
-                    except:
-                        pass
-            except Exception as e:
+            if error is not None:
                 chunk_result = {
                     'success': False,
                     'parsed_json': None,
-                    'error': str(e)
+                    'error': str(error)
                 }
+            else:
+                stream_events, result_event = collected
+                for stream_data in stream_events:
+                    yield f"data: {stream_data}\n\n"
+                if result_event:
+                    chunk_results_data = result_event['data'].get('results', [])
+                    # Copy results to duplicate parts that weren't sent to the agent
+                    chunk_pairs = runner.plan.pair(chunk_results_data, chunk)
+                    fanned_out = [paired for paired, _ in chunk_pairs]
+                    if len(fanned_out) > len(chunk_results_data):
+                        yield f"data: {json.dumps({'type': 'result', 'duplicates': True, 'data': {'results': fanned_out[len(chunk_results_data):]}})}\n\n"
+                    chunk_results_data = fanned_out
+                    all_results.extend(chunk_results_data)
+                    # Fallback results ("Review", low confidence) must not replace saved ones
+                    if persist_run and not _is_fallback_stream(collected):
+                        persist_run.submit(chunk_pairs)
+                    chunk_result = {
+                        'success': True,
+                        'parsed_json': {'results': chunk_results_data},
+                        'error': None
+                    }
+                    if result_event.get('conversation_id'):
+                        runner.conversation_id = result_event['conversation_id']
             
             # Log each chunk result (success or error)
-            chunk_log_path = log_chunk_result(
-                chunk_index=idx + 1,
-                chunk_result=chunk_result,
-                chunk_products=chunk,
-                analysis_type="replacements",
-                log_file_path=chunk_log_path
-            )
+            run_log.log_chunk(chunk_idx, chunk_result, chunk)
             
             # Send chunk complete
-            yield f"data: {json.dumps({'type': 'chunk_complete', 'chunk': idx + 1, 'total_chunks': total_chunks})}\n\n"
+            yield f"data: {json.dumps({'type': 'chunk_complete', 'chunk': chunk_idx, 'total_chunks': runner.estimated_total_chunks()})}\n\n"
+            if persist_run:
+                yield f"data: {json.dumps({'type': 'persistence', **persist_run.status()})}\n\n"
+            if runner.controller.version != controller_version:
+                controller_version = runner.controller.version
+                yield f"data: {json.dumps({'type': 'controller', **runner.controller.snapshot()})}\n\n"
         
         # Send final results
-        yield f"data: {json.dumps({'type': 'complete', 'results': all_results, 'total_analyzed': len(all_results)})}\n\n"
+        yield f"data: {json.dumps({'type': 'complete', 'results': all_results, 'total_analyzed': len(all_results), 'run_id': run_log.run_id, 'timing': stage_timing()})}\n\n"
+        if persist_run:
+            yield f"data: {json.dumps({'type': 'persistence', 'final': True, **persist_run.wait(PERSIST_FLUSH_TIMEOUT)})}\n\n"
         
-        # Finalize chunk log and create summary log
-        try:
-            # Add summary to chunk log if it exists
-            if chunk_log_path:
-                with open(chunk_log_path, 'a', encoding='utf-8') as f:
-                    f.write(f"\n{'=' * 80}\n")
-                    f.write(f"FINAL SUMMARY\n")
-                    f.write(f"{'=' * 80}\n")
-                    f.write(f"Total Products Analyzed: {len(all_results)}\n")
-                    f.write(f"Total Results: {len(all_results)}\n")
-                    f.write(f"Completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"{'=' * 80}\n")
-                print(f"Chunk-by-chunk replacement finding log: {chunk_log_path}")
-            
-            # Also create summary log file
-            summary_log_path = log_analysis_results(
-                results=all_results,
-                analysis_type="replacements",
-                total_analyzed=len(all_results),
-                total_skipped=0
-            )
-            # Also log as JSON for programmatic access
-            json_log_path = log_analysis_results_json(
-                results=all_results,
-                analysis_type="replacements",
-                total_analyzed=len(all_results),
-                total_skipped=0
-            )
-            if summary_log_path:
-                print(f"Summary replacement finding log: {summary_log_path}")
-            if json_log_path:
-                print(f"Replacement finding results (JSON) logged to: {json_log_path}")
-        except Exception as e:
-            print(f"Warning: Failed to log replacement finding results: {e}")
+        # Log the run summary (written in the background)
+        run_log.complete(total_results=len(all_results), total_analyzed=len(all_results))
         
     except Exception as e:
         yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
\ No newline at end of file
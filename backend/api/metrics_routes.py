@@ -0,0 +1,32 @@
+"""
+Metrics API Routes - Prometheus-style metrics for the analysis pipeline
+"""
+from flask import Blueprint, Response
+import sys
+import os
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.metrics_service import render_prometheus
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Get process metrics in the Prometheus text exposition format
+    GET /api/metrics
+
+    Covers LLM call and chunk latency per agent, retries, parsed vs fallback chunks,
+    token usage, in-flight chunks, Excel parse durations, database statement
+    durations per endpoint, open SSE streams, save transaction contention and
+    write-behind persistence.
+    """
+    return Response(
+        render_prometheus(),
+        mimetype='text/plain; version=0.0.4',
+        headers={'Cache-Control': 'no-store'}
+    )
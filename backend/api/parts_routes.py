@@ -1,18 +1,27 @@
 """
 Parts API Routes - Handle fetching parts from database
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 import sys
 import os
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
 # Add backend directory to path
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, backend_dir)
 
+from services.cache_service import get_machine_summaries, invalidate_for_parts, get_data_version, response_cache
+from services.json_service import dumps
+from services.risk_service import (
+    DEFAULT_RISK_WEIGHTS, DEFAULT_STATUS_FACTORS, get_risk_factors, top_risks
+)
+
 try:
+    from sqlalchemy import select, func, case, or_, update, DateTime
     from database.db_config import get_db_session
-    from database.models import Part, Machine, MachinePart
+    from database.models import Part, Machine, MachinePart, DeletedRecord
+    from database.part_key import product_part_key
     DB_AVAILABLE = True
 except ImportError:
     DB_AVAILABLE = False
@@ -31,9 +40,14 @@ def get_all_parts():
         - ai_status: Filter by AI status (optional)
         - machine_id: Filter by machine ID (optional)
         - search: Search term for part number, manufacturer, description (optional)
-        - limit: Limit number of results (optional, default: 1000)
+        - fields: Comma-separated part fields to return, e.g. the visible columns (optional, default: all)
+        - limit: Limit number of results (optional, default: 1000, no default when streaming)
         - offset: Offset for pagination (optional, default: 0)
     
+    Headers:
+        - Accept: application/x-ndjson streams one JSON part per line followed by
+          a trailer line {"trailer": true, "success": true, "count": N, ...}
+    
     Response:
         {
             "success": true,
@@ -76,8 +90,18 @@ def get_all_parts():
         ai_status = request.args.get('ai_status', '').strip()
         machine_id = request.args.get('machine_id', '').strip()
         search = request.args.get('search', '').strip()
+        fields, include_machines = _parse_fields(request.args.get('fields', ''))
         limit = int(request.args.get('limit', 1000))
         offset = int(request.args.get('offset', 0))
+        stream = _wants_ndjson()
+        
+        # Serve unchanged data from the response cache (304 if the client has it)
+        cache_key = _response_cache_key()
+        if not stream:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return _conditional_json_response(cached)
+        data_version = get_data_version()
         
         # Get database session (will try to initialize if needed)
         try:
@@ -97,72 +121,40 @@ def get_all_parts():
                 }
             }), 503
         
+        # Opt-in NDJSON streaming; the generator owns and closes the session
+        if stream:
+            stream_limit = int(request.args['limit']) if request.args.get('limit') else None
+            return Response(
+                _stream_parts_ndjson(session, fields, include_machines, ai_status, machine_id, search, stream_limit, offset),
+                mimetype='application/x-ndjson',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+        
         try:
-            # Start with base query
-            query = session.query(Part)
-            
-            # Apply filters
-            if ai_status:
-                query = query.filter(Part.ai_status == ai_status)
-            
-            if machine_id:
-                # Filter parts that are associated with this machine
-                # Use distinct() to avoid duplicates when a part has multiple machine associations
-                query = query.join(MachinePart).filter(
-                    MachinePart.machine_id == int(machine_id)
-                ).distinct()
-            
-            if search:
-                # Search across multiple fields
-                search_term = f"%{search}%"
-                query = query.filter(
-                    (Part.part_manufacturer.like(search_term)) |
-                    (Part.manufacturer_part_number.like(search_term)) |
-                    (Part.part_description.like(search_term)) |
-                    (Part.notes.like(search_term)) |
-                    (Part.notes_by_ai.like(search_term))
-                )
+            # Select plain column tuples (no ORM identity map / instrumentation)
+            conditions = _part_filter_conditions(ai_status, machine_id, search)
             
             # Get total count before pagination
-            total = query.count()
+            total = session.execute(
+                select(func.count()).select_from(Part.__table__).where(*conditions)
+            ).scalar()
             
-            # Apply pagination
-            parts = query.offset(offset).limit(limit).all()
+            columns = [Part.__table__.c[field] for field in fields]
+            rows = session.execute(
+                select(*columns).where(*conditions).order_by(Part.id).offset(offset).limit(limit)
+            ).all()
+            parts_data = [dict(zip(fields, row)) for row in rows]
             
-            # Convert to dictionaries with machine information
-            parts_data = []
-            for part in parts:
-                part_dict = _part_to_dict(part)
-                
-                # Get associated machines
-                machine_parts = session.query(MachinePart).filter(
-                    MachinePart.part_id == part.id
-                ).all()
-                
-                machines_data = []
-                for mp in machine_parts:
-                    machine = session.query(Machine).filter(
-                        Machine.id == mp.machine_id
-                    ).first()
-                    
-                    if machine:
-                        machines_data.append({
-                            "id": machine.id,
-                            "equipment_id": machine.equipment_id,
-                            "equipment_alias": machine.equipment_alias,
-                            "machine_description": machine.machine_description,
-                            "plant": machine.plant,
-                            "group_responsibility": machine.group_responsibility,
-                            "quantity": float(mp.quantity) if mp.quantity else 1.0,
-                            "cspl_line_number": mp.cspl_line_number,
-                            "original_order": mp.original_order,
-                            "parent_folder": mp.parent_folder
-                        })
-                
-                part_dict["machines"] = machines_data
-                parts_data.append(part_dict)
+            # Attach associated machines with one query for the whole page
+            if include_machines:
+                machines_by_part = _load_machines_for_parts(session, [part["id"] for part in parts_data])
+                for part_dict in parts_data:
+                    part_dict["machines"] = machines_by_part.get(part_dict["id"], [])
             
-            return jsonify({
+            payload = {
                 "success": True,
                 "parts": parts_data,
                 "total": total,
@@ -173,7 +165,392 @@ def get_all_parts():
                     "machine_id": int(machine_id) if machine_id else None,
                     "search": search if search else None
                 }
-            })
+            }
+            return _conditional_json_response(response_cache.set(cache_key, data_version, dumps(payload)))
+            
+        finally:
+            session.close()
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+def _response_cache_key():
+    """
+    Build a response cache key from the path and the normalized query parameters.
+    """
+    params = tuple(sorted(
+        (key, value.strip())
+        for key, value in request.args.items(multi=True)
+        if value.strip()
+    ))
+    return (request.path, params)
+
+
+def _conditional_json_response(entry: Dict[str, Any]) -> Response:
+    """
+    Build a JSON response from a response cache entry with ETag/Last-Modified,
+    answering 304 Not Modified when the client's copy is current.
+    """
+    response = Response(entry["body"], mimetype='application/json')
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# Rows fetched per server-side cursor batch when streaming NDJSON
+STREAM_BATCH_SIZE = 500
+
+
+def _wants_ndjson() -> bool:
+    """
+    Check whether the client asked for an NDJSON stream via the Accept header.
+    """
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def _stream_parts_ndjson(
+    session,
+    fields: List[str],
+    include_machines: bool,
+    ai_status: str,
+    machine_id: str,
+    search: str,
+    limit: Optional[int],
+    offset: int
+):
+    """
+    Stream parts as NDJSON, one part per line plus a trailer line.
+    
+    Rows are read through a server-side cursor in STREAM_BATCH_SIZE batches on a
+    dedicated connection, so memory stays flat regardless of the result size.
+    Machine associations are loaded per batch on the session's own connection.
+    
+    Yields:
+        UTF-8 encoded NDJSON lines
+    """
+    count = 0
+    trailer = {
+        "trailer": True,
+        "success": True,
+        "offset": offset,
+        "limit": limit,
+        "filters_applied": {
+            "ai_status": ai_status if ai_status else None,
+            "machine_id": int(machine_id) if machine_id else None,
+            "search": search if search else None
+        }
+    }
+    
+    try:
+        conditions = _part_filter_conditions(ai_status, machine_id, search)
+        stmt = select(*[Part.__table__.c[field] for field in fields]).where(*conditions).order_by(Part.id).offset(offset)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        
+        with session.get_bind().connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(stmt)
+            for batch in result.partitions():
+                parts_batch = [dict(zip(fields, row)) for row in batch]
+                if include_machines:
+                    machines_by_part = _load_machines_for_parts(session, [part["id"] for part in parts_batch])
+                    for part_dict in parts_batch:
+                        part_dict["machines"] = machines_by_part.get(part_dict["id"], [])
+                
+                count += len(parts_batch)
+                yield b"".join(dumps(part_dict) + b"\n" for part_dict in parts_batch)
+    
+    except Exception as e:
+        trailer["success"] = False
+        trailer["error"] = str(e)
+    finally:
+        session.close()
+    
+    trailer["count"] = count
+    yield dumps(trailer) + b"\n"
+
+
+# Part columns returned by the read endpoints, in response order
+PART_FIELDS = (
+    'id',
+    'part_manufacturer',
+    'manufacturer_part_number',
+    'part_description',
+    'part_number_ai_modified',
+    'suggested_supplier',
+    'supplier_part_number',
+    'gore_stock_number',
+    'is_part_likely_to_fail',
+    'will_failures_stop_machine',
+    'stocking_decision',
+    'min_qty_to_stock',
+    'part_preplacement_line_number',
+    'notes',
+    'ai_status',
+    'notes_by_ai',
+    'ai_confidence',
+    'ai_confidence_confirmed',
+    'recommended_replacement',
+    'replacement_manufacturer',
+    'replacement_price',
+    'replacement_currency',
+    'replacement_source_type',
+    'replacement_source_url',
+    'replacement_notes',
+    'replacement_confidence',
+    'will_notes',
+    'nejat_notes',
+    'kc_notes',
+    'ricky_notes',
+    'stephanie_notes',
+    'pit_notes',
+    'initial_email_communication',
+    'follow_up_email_communication_date',
+    'created_at',
+    'updated_at',
+)
+
+# Field keys that are served from the per-part "machines" array
+MACHINE_FIELDS = {
+    'machines',
+    'equipment_id',
+    'machine_equipment_number',
+    'equipment_alias',
+    'machine_description',
+    'plant',
+    'group_responsibility',
+    'quantity',
+    'qty_on_machine',
+    'cspl_line_number',
+    'original_order',
+    'parent_folder',
+}
+
+
+def _parse_fields(fields_param: str):
+    """
+    Parse the fields= projection.
+    
+    Returns:
+        Tuple of (part fields to select, whether to include the machines array).
+        "id" is always selected; unknown keys are ignored.
+    """
+    requested = [field.strip() for field in fields_param.split(',') if field.strip()]
+    if not requested:
+        return list(PART_FIELDS), True
+    
+    requested_set = set(requested)
+    fields = [field for field in PART_FIELDS if field == 'id' or field in requested_set]
+    include_machines = bool(requested_set & MACHINE_FIELDS)
+    return fields, include_machines
+
+
+def _part_filter_conditions(ai_status: str, machine_id: str, search: str) -> List[Any]:
+    """
+    Build WHERE conditions for the parts listing filters.
+    """
+    conditions = []
+    
+    if ai_status:
+        conditions.append(Part.ai_status == ai_status)
+    
+    if machine_id:
+        # Semi-join so parts linked to the machine are returned once
+        conditions.append(Part.id.in_(
+            select(MachinePart.part_id).where(MachinePart.machine_id == int(machine_id))
+        ))
+    
+    if search:
+        # Search across multiple fields
+        search_term = f"%{search}%"
+        conditions.append(or_(
+            Part.part_manufacturer.like(search_term),
+            Part.manufacturer_part_number.like(search_term),
+            Part.part_description.like(search_term),
+            Part.notes.like(search_term),
+            Part.notes_by_ai.like(search_term)
+        ))
+    
+    return conditions
+
+
+def _load_machines_for_parts(session, part_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Load machine associations for a set of parts with a single join query.
+    
+    Returns:
+        Dictionary of part id to list of machine dictionaries
+    """
+    machines_by_part: Dict[int, List[Dict[str, Any]]] = {}
+    if not part_ids:
+        return machines_by_part
+    
+    rows = session.execute(
+        select(
+            MachinePart.part_id,
+            Machine.id,
+            Machine.equipment_id,
+            Machine.equipment_alias,
+            Machine.machine_description,
+            Machine.plant,
+            Machine.group_responsibility,
+            MachinePart.quantity,
+            MachinePart.cspl_line_number,
+            MachinePart.original_order,
+            MachinePart.parent_folder
+        ).join(Machine, Machine.id == MachinePart.machine_id)
+        .where(MachinePart.part_id.in_(part_ids))
+        .order_by(MachinePart.part_id, MachinePart.id)
+    ).all()
+    
+    for row in rows:
+        machines_by_part.setdefault(row[0], []).append({
+            "id": row[1],
+            "equipment_id": row[2],
+            "equipment_alias": row[3],
+            "machine_description": row[4],
+            "plant": row[5],
+            "group_responsibility": row[6],
+            "quantity": float(row[7]) if row[7] else 1.0,
+            "cspl_line_number": row[8],
+            "original_order": row[9],
+            "parent_folder": row[10]
+        })
+    
+    return machines_by_part
+
+
+# updated_at columns are TIMESTAMPs with one-second resolution: re-send the boundary
+# second so rows written in the same second as the previous watermark aren't missed
+CHANGE_FEED_OVERLAP = timedelta(seconds=1)
+
+# updated_at and deleted_at are stamped before commit, so a row may become visible after
+# a watermark later than its stamp. next_since trails the database clock by this margin
+# (longer than a save transaction) so such rows are sent on the next call.
+CHANGE_FEED_COMMIT_LAG = timedelta(seconds=int(os.getenv('CHANGE_FEED_COMMIT_LAG_SECONDS', 60)))
+
+# Columns returned for changed machines and machine links
+CHANGE_FEED_MACHINE_FIELDS = (
+    'id',
+    'equipment_id',
+    'equipment_alias',
+    'machine_description',
+    'plant',
+    'group_responsibility',
+    'eam_equipment_id',
+    'created_at',
+    'updated_at',
+)
+
+CHANGE_FEED_LINK_FIELDS = (
+    'id',
+    'machine_id',
+    'part_id',
+    'quantity',
+    'cspl_line_number',
+    'original_order',
+    'parent_folder',
+    'created_at',
+    'updated_at',
+)
+
+
+@parts_bp.route('/parts/changes', methods=['GET'])
+def get_parts_changes():
+    """
+    Get parts, machines and machine links changed since a watermark, plus deletions
+    GET /api/parts/changes?since=<next_since from the previous call>
+    
+    Query Parameters:
+        - since: Watermark returned as next_since by the previous call (ISO datetime).
+                 Omit for a full snapshot to start syncing from.
+        - fields: Comma-separated part fields (same as GET /api/parts)
+    
+    Response:
+        {
+            "success": true,
+            "since": "2024-01-01T10:00:00",
+            "next_since": "2024-01-01T10:05:00",
+            "parts": [...],
+            "machines": [...],
+            "machine_parts": [...],
+            "deleted": {"parts": [3], "machines": [], "machine_parts": [7]}
+        }
+    
+    Rows from transactions that commit within CHANGE_FEED_COMMIT_LAG of being
+    stamped are returned at least once. next_since trails the database clock by
+    that margin, so rows changed in the last minute are sent again on the next
+    call and clients should upsert by id.
+    """
+    if not DB_AVAILABLE:
+        return jsonify({
+            "success": False,
+            "error": "Database not available. Please check database configuration."
+        }), 503
+    
+    since_param = request.args.get('since', '').strip()
+    since = None
+    if since_param:
+        try:
+            since = datetime.fromisoformat(since_param.replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": f"Invalid since value: {since_param}. Expected an ISO datetime."
+            }), 400
+    
+    fields, _ = _parse_fields(request.args.get('fields', ''))
+    
+    try:
+        try:
+            session = get_db_session()
+        except RuntimeError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 503
+        
+        try:
+            # Read the watermark from the database clock that stamps updated_at,
+            # minus the margin for transactions still committing
+            next_since = session.execute(
+                select(func.current_timestamp(type_=DateTime()))
+            ).scalar()
+            if next_since is not None:
+                next_since -= CHANGE_FEED_COMMIT_LAG
+            lower_bound = since - CHANGE_FEED_OVERLAP if since else None
+            
+            parts_data = _select_changed(session, Part.__table__, fields, lower_bound)
+            machines_data = _select_changed(session, Machine.__table__, CHANGE_FEED_MACHINE_FIELDS, lower_bound)
+            links_data = _select_changed(session, MachinePart.__table__, CHANGE_FEED_LINK_FIELDS, lower_bound)
+            for link in links_data:
+                link["quantity"] = float(link["quantity"]) if link["quantity"] else 1.0
+            
+            deleted = {"parts": [], "machines": [], "machine_parts": []}
+            if lower_bound is not None:
+                rows = session.execute(
+                    select(DeletedRecord.table_name, DeletedRecord.record_id)
+                    .where(DeletedRecord.deleted_at >= lower_bound)
+                    .order_by(DeletedRecord.id)
+                ).all()
+                for table_name, record_id in rows:
+                    if table_name in deleted:
+                        deleted[table_name].append(record_id)
+            
+            payload = {
+                "success": True,
+                "since": since.isoformat() if since else None,
+                "next_since": next_since.isoformat() if next_since else None,
+                "parts": parts_data,
+                "machines": machines_data,
+                "machine_parts": links_data,
+                "deleted": deleted
+            }
+            return Response(dumps(payload), mimetype='application/json', headers={'Cache-Control': 'no-store'})
             
         finally:
             session.close()
@@ -185,6 +562,32 @@ def get_all_parts():
         }), 500
 
 
+def _select_changed(session, table, fields, lower_bound: Optional[datetime]) -> List[Dict[str, Any]]:
+    """
+    Select rows of a table whose updated_at is at or after lower_bound (all rows when None),
+    using the updated_at index.
+    """
+    statement = select(*[table.c[field] for field in fields])
+    if lower_bound is not None:
+        statement = statement.where(table.c.updated_at >= lower_bound)
+    rows = session.execute(statement.order_by(table.c.updated_at, table.c.id)).all()
+    return [dict(zip(fields, row)) for row in rows]
+
+
+# Machine columns returned by GET /api/parts/machines (plus parts_count)
+MACHINE_LIST_FIELDS = (
+    'id',
+    'equipment_id',
+    'equipment_alias',
+    'machine_description',
+    'plant',
+    'group_responsibility',
+    'eam_equipment_id',
+    'created_at',
+    'updated_at',
+)
+
+
 @parts_bp.route('/parts/machines', methods=['GET'])
 def get_all_machines():
     """
@@ -214,6 +617,12 @@ def get_all_machines():
         }), 503
     
     try:
+        cache_key = _response_cache_key()
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _conditional_json_response(cached)
+        data_version = get_data_version()
+        
         # Get database session (will try to initialize if needed)
         try:
             session = get_db_session()
@@ -226,15 +635,102 @@ def get_all_machines():
             }), 503
         
         try:
-            machines = session.query(Machine).all()
+            # Select plain column tuples (no ORM identity map / instrumentation)
+            machines = Machine.__table__
+            rows = session.execute(
+                select(*[machines.c[field] for field in MACHINE_LIST_FIELDS]).order_by(machines.c.id)
+            ).all()
+            summaries = get_machine_summaries(lambda ids: _load_machine_summaries(session, ids))
+            
+            machines_data = []
+            for row in rows:
+                machine_dict = dict(zip(MACHINE_LIST_FIELDS, row))
+                summary = summaries.get(machine_dict["id"])
+                machine_dict["parts_count"] = summary["parts_count"] if summary else 0
+                machines_data.append(machine_dict)
+            
+            payload = {
+                "success": True,
+                "machines": machines_data,
+                "total": len(machines_data)
+            }
+            return _conditional_json_response(response_cache.set(cache_key, data_version, dumps(payload)))
+            
+        finally:
+            session.close()
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@parts_bp.route('/parts/machines/summary', methods=['GET'])
+def get_machines_summary():
+    """
+    Get per-machine part summaries for the machines overview
+    GET /api/parts/machines/summary
+    
+    Query Parameters:
+        - plant: Filter by plant (optional)
+    
+    Response:
+        {
+            "success": true,
+            "machines": [
+                {
+                    "id": 1,
+                    "equipment_id": "...",
+                    "equipment_alias": "...",
+                    "plant": "...",
+                    "parts_count": 10,
+                    "status_counts": {"Active": 7, "Review": 2, "Not Analyzed": 1},
+                    "status_units": {"Active": 12.0, "Review": 2.0, "Not Analyzed": 1.0},
+                    "obsolete_count": 0,
+                    "critical_count": 3,
+                    "without_replacement_count": 10
+                }
+            ],
+            "total": 5
+        }
+    """
+    if not DB_AVAILABLE:
+        return jsonify({
+            "success": False,
+            "error": "Database not available. Please check database configuration."
+        }), 503
+    
+    try:
+        plant = request.args.get('plant', '').strip()
+        
+        cache_key = _response_cache_key()
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _conditional_json_response(cached)
+        data_version = get_data_version()
+        
+        # Get database session (will try to initialize if needed)
+        try:
+            session = get_db_session()
+        except RuntimeError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "machines": [],
+                "total": 0
+            }), 503
+        
+        try:
+            query = session.query(Machine)
+            if plant:
+                query = query.filter(Machine.plant == plant)
+            machines = query.all()
+            summaries = get_machine_summaries(lambda ids: _load_machine_summaries(session, ids))
             
             machines_data = []
             for machine in machines:
-                # Count parts for this machine
-                parts_count = session.query(MachinePart).filter(
-                    MachinePart.machine_id == machine.id
-                ).count()
-                
+                summary = summaries.get(machine.id) or _empty_machine_summary()
                 machines_data.append({
                     "id": machine.id,
                     "equipment_id": machine.equipment_id,
@@ -242,20 +738,308 @@ def get_all_machines():
                     "machine_description": machine.machine_description,
                     "plant": machine.plant,
                     "group_responsibility": machine.group_responsibility,
-                    "eam_equipment_id": machine.eam_equipment_id,
-                    "parts_count": parts_count,
-                    "created_at": machine.created_at.isoformat() if machine.created_at else None,
-                    "updated_at": machine.updated_at.isoformat() if machine.updated_at else None
+                    **summary
                 })
             
-            return jsonify({
+            payload = {
                 "success": True,
                 "machines": machines_data,
                 "total": len(machines_data)
+            }
+            return _conditional_json_response(response_cache.set(cache_key, data_version, dumps(payload)))
+            
+        finally:
+            session.close()
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+def _empty_machine_summary() -> Dict[str, Any]:
+    return {
+        "parts_count": 0,
+        "status_counts": {},
+        "status_units": {},
+        "obsolete_count": 0,
+        "critical_count": 0,
+        "without_replacement_count": 0
+    }
+
+
+def _load_machine_summaries(session, machine_ids: Optional[List[int]] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    Compute part summaries for machines with a single grouped query.
+    
+    Args:
+        session: Database session
+        machine_ids: Restrict to these machines (None computes all machines)
+        
+    Returns:
+        Dictionary of machine id to summary
+    """
+    is_obsolete = case((Part.ai_status.like('%Obsolete%'), 1), else_=0)
+    stops_machine = case((func.lower(func.trim(Part.will_failures_stop_machine)) == 'yes', 1), else_=0)
+    lacks_replacement = case(
+        (or_(Part.recommended_replacement.is_(None), func.trim(Part.recommended_replacement) == ''), 1),
+        else_=0
+    )
+    
+    query = session.query(
+        MachinePart.machine_id,
+        Part.ai_status,
+        func.count(MachinePart.id),
+        func.sum(func.coalesce(MachinePart.quantity, 1)),
+        func.sum(is_obsolete),
+        func.sum(stops_machine),
+        func.sum(lacks_replacement)
+    ).join(Part, Part.id == MachinePart.part_id)
+    
+    if machine_ids is not None:
+        if not machine_ids:
+            return {}
+        query = query.filter(MachinePart.machine_id.in_(machine_ids))
+    
+    summaries = {}
+    rows = query.group_by(MachinePart.machine_id, Part.ai_status).all()
+    for machine_id, ai_status, count, units, obsolete, critical, without_replacement in rows:
+        summary = summaries.setdefault(machine_id, _empty_machine_summary())
+        status_key = ai_status or "Not Analyzed"
+        summary["status_counts"][status_key] = summary["status_counts"].get(status_key, 0) + int(count)
+        summary["status_units"][status_key] = summary["status_units"].get(status_key, 0.0) + float(units or 0)
+        summary["parts_count"] += int(count)
+        summary["obsolete_count"] += int(obsolete or 0)
+        summary["critical_count"] += int(critical or 0)
+        summary["without_replacement_count"] += int(without_replacement or 0)
+    
+    return summaries
+
+
+@parts_bp.route('/parts/exposure', methods=['GET'])
+def get_fleet_exposure():
+    """
+    Get the plants and machines depending on parts with a given status, with unit totals
+    GET /api/parts/exposure
+    
+    Query Parameters:
+        - status: Status to report on, matched case-insensitively as a substring of
+                  ai_status so "Obsolete" matches "🔴 Obsolete" (default: Obsolete;
+                  "all" reports every status)
+        - plant: Filter by plant (optional)
+    
+    Response:
+        {
+            "success": true,
+            "status": "Obsolete",
+            "totals": {"plants": 2, "machines": 5, "parts_count": 14, "units": 31.0},
+            "plants": [
+                {
+                    "plant": "...",
+                    "machines_count": 3,
+                    "parts_count": 9,
+                    "units": 20.0,
+                    "machines": [
+                        {
+                            "id": 1,
+                            "equipment_id": "...",
+                            "equipment_alias": "...",
+                            "parts_count": 4,
+                            "units": 8.0,
+                            "statuses": {"🔴 Obsolete": {"parts_count": 4, "units": 8.0}}
+                        }
+                    ]
+                }
+            ]
+        }
+    
+    parts_count counts part/machine links; units sums machine_parts.quantity.
+    Plants and machines are ordered by units, highest first.
+    """
+    if not DB_AVAILABLE:
+        return jsonify({
+            "success": False,
+            "error": "Database not available. Please check database configuration."
+        }), 503
+    
+    try:
+        status = request.args.get('status', '').strip() or 'Obsolete'
+        plant_filter = request.args.get('plant', '').strip()
+        
+        cache_key = _response_cache_key()
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _conditional_json_response(cached)
+        data_version = get_data_version()
+        
+        # Get database session (will try to initialize if needed)
+        try:
+            session = get_db_session()
+        except RuntimeError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "plants": []
+            }), 503
+        
+        try:
+            # Per-machine status counts and units come from the incrementally refreshed summaries
+            summaries = get_machine_summaries(lambda ids: _load_machine_summaries(session, ids))
+            statement = select(Machine.id, Machine.equipment_id, Machine.equipment_alias, Machine.plant)
+            if plant_filter:
+                statement = statement.where(Machine.plant == plant_filter)
+            machines = session.execute(statement).all()
+        finally:
+            session.close()
+        
+        match_all = status.lower() == 'all'
+        status_term = status.lower()
+        plants: Dict[Optional[str], Dict[str, Any]] = {}
+        for machine_id, equipment_id, equipment_alias, plant in machines:
+            summary = summaries.get(machine_id)
+            if not summary:
+                continue
+            
+            statuses = {}
+            for status_key, count in summary["status_counts"].items():
+                if match_all or status_term in status_key.lower():
+                    statuses[status_key] = {
+                        "parts_count": count,
+                        "units": summary["status_units"].get(status_key, 0.0)
+                    }
+            if not statuses:
+                continue
+            
+            machine_entry = {
+                "id": machine_id,
+                "equipment_id": equipment_id,
+                "equipment_alias": equipment_alias,
+                "parts_count": sum(entry["parts_count"] for entry in statuses.values()),
+                "units": sum(entry["units"] for entry in statuses.values()),
+                "statuses": statuses
+            }
+            plant_entry = plants.setdefault(plant, {
+                "plant": plant,
+                "machines_count": 0,
+                "parts_count": 0,
+                "units": 0.0,
+                "machines": []
             })
+            plant_entry["machines_count"] += 1
+            plant_entry["parts_count"] += machine_entry["parts_count"]
+            plant_entry["units"] += machine_entry["units"]
+            plant_entry["machines"].append(machine_entry)
+        
+        plants_data = sorted(plants.values(), key=lambda entry: entry["units"], reverse=True)
+        for plant_entry in plants_data:
+            plant_entry["machines"].sort(key=lambda entry: entry["units"], reverse=True)
+        
+        payload = {
+            "success": True,
+            "status": status,
+            "totals": {
+                "plants": len(plants_data),
+                "machines": sum(entry["machines_count"] for entry in plants_data),
+                "parts_count": sum(entry["parts_count"] for entry in plants_data),
+                "units": sum(entry["units"] for entry in plants_data)
+            },
+            "plants": plants_data
+        }
+        return _conditional_json_response(response_cache.set(cache_key, data_version, dumps(payload)))
             
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@parts_bp.route('/parts/risk', methods=['GET'])
+def get_parts_risk():
+    """
+    Rank parts by obsolescence risk across the fleet
+    GET /api/parts/risk
+    
+    Score = status factor x weighted mean of the part factors, scaled to 0..100.
+    Factors: stops_machine, likely_to_fail, exposure (units across machines),
+    stock_need (stocked spares, by min_qty_to_stock) and no_replacement.
+    
+    Query Parameters:
+        - limit: Number of parts to return (default: 50, max: 1000)
+        - min_score: Only rank parts scoring above this value (default: 0)
+        - weight_<factor>: Override a factor weight, e.g. weight_exposure=0.5
+        - status_<status>: Override a status factor (obsolete, review, not_analyzed, active)
+    
+    Response:
+        {
+            "success": true,
+            "weights": {...},
+            "status_factors": {...},
+            "total": 120,
+            "parts": [
+                {
+                    "id": 1,
+                    "part_manufacturer": "...",
+                    "manufacturer_part_number": "...",
+                    "part_description": "...",
+                    "ai_status": "🔴 Obsolete",
+                    "machines_count": 4,
+                    "units": 9.0,
+                    "score": 87.5,
+                    "breakdown": {"stops_machine": 30.0, "likely_to_fail": 20.0, ...}
+                }
+            ]
+        }
+    """
+    if not DB_AVAILABLE:
+        return jsonify({
+            "success": False,
+            "error": "Database not available. Please check database configuration."
+        }), 503
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+        min_score = float(request.args.get('min_score', 0))
+        weights = _parse_risk_overrides('weight_', DEFAULT_RISK_WEIGHTS)
+        status_factors = _parse_risk_overrides('status_', DEFAULT_STATUS_FACTORS)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid parameter: {e}"
+        }), 400
+    
+    try:
+        cache_key = _response_cache_key()
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _conditional_json_response(cached)
+        data_version = get_data_version()
+        
+        # Get database session (will try to initialize if needed)
+        try:
+            session = get_db_session()
+        except RuntimeError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "parts": []
+            }), 503
+        
+        try:
+            factors = get_risk_factors(lambda: _load_risk_rows(session))
         finally:
             session.close()
+        
+        total, parts_data = top_risks(factors, limit, weights, status_factors, min_score)
+        payload = {
+            "success": True,
+            "weights": weights,
+            "status_factors": status_factors,
+            "total": total,
+            "parts": parts_data
+        }
+        return _conditional_json_response(response_cache.set(cache_key, data_version, dumps(payload)))
             
     except Exception as e:
         return jsonify({
@@ -264,48 +1048,200 @@ def get_all_machines():
         }), 500
 
 
-def _part_to_dict(part: Part) -> Dict[str, Any]:
+def _parse_risk_overrides(prefix: str, defaults: Dict[str, float]) -> Dict[str, float]:
     """
-    Convert a Part SQLAlchemy object to a dictionary.
+    Read <prefix><name>=<value> query parameters over the default weights.
     """
-    return {
-        "id": part.id,
-        "part_manufacturer": part.part_manufacturer,
-        "manufacturer_part_number": part.manufacturer_part_number,
-        "part_description": part.part_description,
-        "part_number_ai_modified": part.part_number_ai_modified,
-        "suggested_supplier": part.suggested_supplier,
-        "supplier_part_number": part.supplier_part_number,
-        "gore_stock_number": part.gore_stock_number,
-        "is_part_likely_to_fail": part.is_part_likely_to_fail,
-        "will_failures_stop_machine": part.will_failures_stop_machine,
-        "stocking_decision": part.stocking_decision,
-        "min_qty_to_stock": float(part.min_qty_to_stock) if part.min_qty_to_stock else None,
-        "part_preplacement_line_number": part.part_preplacement_line_number,
-        "notes": part.notes,
-        "ai_status": part.ai_status,
-        "notes_by_ai": part.notes_by_ai,
-        "ai_confidence": part.ai_confidence,
-        "ai_confidence_confirmed": part.ai_confidence_confirmed,
-        "recommended_replacement": part.recommended_replacement,
-        "replacement_manufacturer": part.replacement_manufacturer,
-        "replacement_price": float(part.replacement_price) if part.replacement_price else None,
-        "replacement_currency": part.replacement_currency,
-        "replacement_source_type": part.replacement_source_type,
-        "replacement_source_url": part.replacement_source_url,
-        "replacement_notes": part.replacement_notes,
-        "replacement_confidence": part.replacement_confidence,
-        "will_notes": part.will_notes,
-        "nejat_notes": part.nejat_notes,
-        "kc_notes": part.kc_notes,
-        "ricky_notes": part.ricky_notes,
-        "stephanie_notes": part.stephanie_notes,
-        "pit_notes": part.pit_notes,
-        "initial_email_communication": part.initial_email_communication,
-        "follow_up_email_communication_date": part.follow_up_email_communication_date.isoformat() if part.follow_up_email_communication_date else None,
-        "created_at": part.created_at.isoformat() if part.created_at else None,
-        "updated_at": part.updated_at.isoformat() if part.updated_at else None
-    }
+    values = dict(defaults)
+    for name in defaults:
+        raw = request.args.get(prefix + name, '').strip()
+        if not raw:
+            continue
+        value = float(raw)
+        if value < 0:
+            raise ValueError(f"{prefix}{name} must not be negative")
+        values[name] = value
+    return values
+
+
+def _load_risk_rows(session) -> List[Any]:
+    """
+    Load the columns used for risk scoring for every part, with machine counts
+    and summed quantities from one grouped subquery.
+    """
+    usage = select(
+        MachinePart.part_id,
+        func.count(MachinePart.id).label('machines_count'),
+        func.sum(func.coalesce(MachinePart.quantity, 1)).label('units')
+    ).group_by(MachinePart.part_id).subquery()
+    
+    return session.execute(
+        select(
+            Part.id,
+            Part.part_manufacturer,
+            Part.manufacturer_part_number,
+            Part.part_description,
+            Part.ai_status,
+            Part.will_failures_stop_machine,
+            Part.is_part_likely_to_fail,
+            Part.stocking_decision,
+            Part.min_qty_to_stock,
+            Part.recommended_replacement,
+            usage.c.machines_count,
+            usage.c.units
+        ).outerjoin(usage, usage.c.part_id == Part.id)
+    ).all()
+
+
+# Stored fields returned for each product found by POST /api/parts/lookup
+LOOKUP_FIELDS = (
+    'id',
+    'ai_status',
+    'ai_confidence',
+    'ai_confidence_confirmed',
+    'notes_by_ai',
+    'recommended_replacement',
+    'replacement_manufacturer',
+    'replacement_price',
+    'replacement_currency',
+    'replacement_source_type',
+    'replacement_source_url',
+    'replacement_notes',
+    'replacement_confidence',
+    'updated_at',
+)
+
+# Part keys per IN query
+LOOKUP_BATCH_SIZE = 1000
+
+
+@parts_bp.route('/parts/lookup', methods=['POST'])
+def lookup_parts():
+    """
+    Look up the stored lifecycle status of uploaded products before analysis
+    POST /api/parts/lookup
+    
+    Products are matched on the normalized part key with batched IN queries on
+    the unique part_key index. updated_at is the time the part was last written.
+    
+    Request:
+        {
+            "products": [
+                {"part_manufacturer": "...", "manufacturer_part_number": "...", ...},
+                ...
+            ],
+            "max_age_days": 90  // optional: results older than this are reported as stale
+        }
+    
+    Response:
+        {
+            "success": true,
+            "results": [
+                {
+                    "index": 0,
+                    "found": true,
+                    "stale": false,
+                    "part": {"id": 1, "ai_status": "Active", "ai_confidence": "High", ..., "updated_at": "..."}
+                },
+                {"index": 1, "found": false, "stale": false, "part": null}
+            ],
+            "summary": {"total": 2, "known": 1, "unknown": 1, "stale": 0}
+        }
+    
+    A product is "known" when it is found with an ai_status; products that are
+    unknown or stale should still be sent to /api/analyze.
+    """
+    if not DB_AVAILABLE:
+        return jsonify({
+            "success": False,
+            "error": "Database not available. Please check database configuration."
+        }), 503
+    
+    try:
+        data = request.json or {}
+        products = data.get('products', [])
+        
+        if not isinstance(products, list):
+            return jsonify({
+                "success": False,
+                "error": "Products must be a list"
+            }), 400
+        
+        max_age_days = data.get('max_age_days')
+        try:
+            max_age = timedelta(days=float(max_age_days)) if max_age_days not in (None, '') else None
+        except (TypeError, ValueError):
+            return jsonify({
+                "success": False,
+                "error": f"Invalid max_age_days: {max_age_days}"
+            }), 400
+        
+        keys = [product_part_key(product) if isinstance(product, dict) else '' for product in products]
+        unique_keys = list({key for key in keys if key})
+        
+        try:
+            session = get_db_session()
+        except RuntimeError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 503
+        
+        try:
+            columns = [Part.__table__.c[field] for field in LOOKUP_FIELDS]
+            parts_by_key: Dict[str, Dict[str, Any]] = {}
+            for start in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+                rows = session.execute(
+                    select(Part.part_key, *columns)
+                    .where(Part.part_key.in_(unique_keys[start:start + LOOKUP_BATCH_SIZE]))
+                ).all()
+                for row in rows:
+                    parts_by_key[row[0]] = dict(zip(LOOKUP_FIELDS, row[1:]))
+            
+            stale_before = None
+            if max_age is not None:
+                # Compare on the database clock that stamps updated_at
+                now = session.execute(select(func.current_timestamp(type_=DateTime()))).scalar()
+                stale_before = now - max_age
+        finally:
+            session.close()
+        
+        results = []
+        known = stale_count = 0
+        for index, key in enumerate(keys):
+            part = parts_by_key.get(key) if key else None
+            found = part is not None
+            stale = bool(
+                found and stale_before is not None
+                and (part["updated_at"] is None or part["updated_at"] < stale_before)
+            )
+            if found and part["ai_status"] and not stale:
+                known += 1
+            if stale:
+                stale_count += 1
+            results.append({
+                "index": index,
+                "found": found,
+                "stale": stale,
+                "part": part
+            })
+        
+        return Response(dumps({
+            "success": True,
+            "results": results,
+            "summary": {
+                "total": len(results),
+                "known": known,
+                "unknown": len(results) - known - stale_count,
+                "stale": stale_count
+            }
+        }), mimetype='application/json')
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
 
 
 @parts_bp.route('/parts/update', methods=['POST'])
@@ -314,6 +1250,9 @@ def update_parts():
     Update parts with replacement information
     POST /api/parts/update
     
+    All ids are resolved with one IN query and the rows are written with a
+    single executemany UPDATE, so large batches keep the transaction short.
+    
     Request:
         {
             "parts": [
@@ -336,7 +1275,8 @@ def update_parts():
         {
             "success": true,
             "updated": 5,
-            "errors": []
+            "errors": ["Part with id 7 not found"],
+            "failed_ids": [7]
         }
     """
     if not DB_AVAILABLE:
@@ -361,49 +1301,42 @@ def update_parts():
                 "error": "Parts must be a list"
             }), 400
         
+        # Validate every row before touching the database
+        updates_by_id, errors, failed_ids = _validate_part_updates(parts_data)
+        
         session = get_db_session()
-        updated_count = 0
-        errors = []
         
         try:
-            for part_data in parts_data:
-                part_id = part_data.get('id')
-                if not part_id:
-                    errors.append(f"Part missing 'id' field: {part_data}")
-                    continue
-                
-                # Find the part
-                part = session.query(Part).filter(Part.id == part_id).first()
-                if not part:
-                    errors.append(f"Part with id {part_id} not found")
-                    continue
-                
-                # Update replacement fields
-                if 'recommended_replacement' in part_data:
-                    part.recommended_replacement = part_data.get('recommended_replacement')
-                if 'replacement_manufacturer' in part_data:
-                    part.replacement_manufacturer = part_data.get('replacement_manufacturer')
-                if 'replacement_price' in part_data:
-                    part.replacement_price = part_data.get('replacement_price')
-                if 'replacement_currency' in part_data:
-                    part.replacement_currency = part_data.get('replacement_currency')
-                if 'replacement_source_type' in part_data:
-                    part.replacement_source_type = part_data.get('replacement_source_type')
-                if 'replacement_source_url' in part_data:
-                    part.replacement_source_url = part_data.get('replacement_source_url')
-                if 'replacement_notes' in part_data:
-                    part.replacement_notes = part_data.get('replacement_notes')
-                if 'replacement_confidence' in part_data:
-                    part.replacement_confidence = part_data.get('replacement_confidence')
+            updated_ids = []
+            if updates_by_id:
+                existing_ids = {
+                    row[0] for row in session.query(Part.id).filter(
+                        Part.id.in_(list(updates_by_id.keys()))
+                    ).all()
+                }
+                for part_id in updates_by_id:
+                    if part_id not in existing_ids:
+                        errors.append(f"Part with id {part_id} not found")
+                        failed_ids.append(part_id)
                 
-                updated_count += 1
+                # Clearing content_hash makes the next /api/save diff these rows column by column
+                mappings = [
+                    {"id": part_id, **fields, "content_hash": None}
+                    for part_id, fields in updates_by_id.items()
+                    if part_id in existing_ids
+                ]
+                if mappings:
+                    session.execute(update(Part), mappings)
+                updated_ids = [part_id for part_id in updates_by_id if part_id in existing_ids]
             
             session.commit()
+            invalidate_for_parts(session, updated_ids)
             
             return jsonify({
                 "success": True,
-                "updated": updated_count,
-                "errors": errors
+                "updated": len(updated_ids),
+                "errors": errors,
+                "failed_ids": failed_ids
             })
             
         except Exception as e:
@@ -418,3 +1351,75 @@ def update_parts():
             "error": str(e)
         }), 500
 
+
+# Fields that POST /api/parts/update is allowed to write
+PART_UPDATE_FIELDS = (
+    'recommended_replacement',
+    'replacement_manufacturer',
+    'replacement_price',
+    'replacement_currency',
+    'replacement_source_type',
+    'replacement_source_url',
+    'replacement_notes',
+    'replacement_confidence',
+)
+
+
+def _validate_part_updates(parts_data: List[Any]):
+    """
+    Validate update rows against PART_UPDATE_FIELDS.
+    
+    Returns:
+        Tuple of ({part_id: {field: value}}, error messages, failed ids).
+        Rows repeating an id are merged, later values win. An id with any
+        invalid row, or with no field to update, is rejected as a whole and
+        listed once in failed ids.
+    """
+    updates_by_id: Dict[int, Dict[str, Any]] = {}
+    errors = []
+    failed_ids = []
+    
+    for part_data in parts_data:
+        if not isinstance(part_data, dict):
+            errors.append(f"Part entry must be an object: {part_data}")
+            continue
+        
+        part_id = part_data.get('id')
+        if not part_id:
+            errors.append(f"Part missing 'id' field: {part_data}")
+            continue
+        try:
+            part_id = int(part_id)
+        except (ValueError, TypeError):
+            errors.append(f"Part id {part_id!r} is not an integer")
+            continue
+        
+        unknown_fields = sorted(key for key in part_data if key != 'id' and key not in PART_UPDATE_FIELDS)
+        if unknown_fields:
+            errors.append(f"Part with id {part_id} has fields that cannot be updated: {', '.join(unknown_fields)}")
+            failed_ids.append(part_id)
+            continue
+        
+        fields = {key: part_data[key] for key in PART_UPDATE_FIELDS if key in part_data}
+        if fields.get('replacement_price') is not None:
+            try:
+                fields['replacement_price'] = float(fields['replacement_price'])
+            except (ValueError, TypeError):
+                errors.append(f"Part with id {part_id} has invalid replacement_price: {fields['replacement_price']!r}")
+                failed_ids.append(part_id)
+                continue
+        
+        updates_by_id.setdefault(part_id, {}).update(fields)
+    
+    # An id whose rows name no field would be counted as updated without an UPDATE
+    for part_id, fields in updates_by_id.items():
+        if not fields and part_id not in failed_ids:
+            errors.append(f"Part with id {part_id} has no fields to update")
+            failed_ids.append(part_id)
+    
+    # One outcome per id: its valid rows are not applied without the rejected ones
+    failed_ids = list(dict.fromkeys(failed_ids))
+    for part_id in failed_ids:
+        updates_by_id.pop(part_id, None)
+    
+    return updates_by_id, errors, failed_ids
@@ -0,0 +1,93 @@
+"""
+Profiles API Routes - List and download request profiles captured by the profiling hooks
+"""
+from flask import Blueprint, jsonify, send_file
+import sys
+import os
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.json_service import json_response
+from services.profiling_service import (
+    PROFILE_KINDS,
+    get_profile_path,
+    is_authorized,
+    list_profiles,
+    profiling_enabled
+)
+
+profiles_bp = Blueprint('profiles', __name__)
+
+
+def _check_access():
+    if not profiling_enabled():
+        return jsonify({"success": False, "error": "Profiling is disabled (set PROFILE_REQUESTS or PROFILE_TOKEN)"}), 404
+    if not is_authorized():
+        return jsonify({"success": False, "error": "X-Profile header with the profiling token is required"}), 403
+    return None
+
+
+@profiles_bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """
+    List captured request profiles, newest first
+    GET /api/profiles
+
+    Response:
+        {
+            "success": true,
+            "profiles": [
+                {
+                    "profile_id": "profile_20250101_120000_a1b2c3",
+                    "method": "POST",
+                    "path": "/api/excel/upload",
+                    "status_code": 200,
+                    "started_at": "2025-01-01T12:00:00.000",
+                    "duration_seconds": 2.431,
+                    "cpu_samples": 452,
+                    "sample_interval_ms": 5.0,
+                    "memory_growth_bytes": 1048576,
+                    "memory_peak_bytes": 52428800
+                },
+                ...
+            ]
+        }
+    """
+    denied = _check_access()
+    if denied:
+        return denied
+    try:
+        return json_response({
+            "success": True,
+            "profiles": list_profiles()
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@profiles_bp.route('/profiles/<profile_id>/<kind>', methods=['GET'])
+def download_profile(profile_id: str, kind: str):
+    """
+    Download a profile file
+    GET /api/profiles/<profile_id>/<kind>
+
+    kind is "folded" (collapsed stacks for flamegraph.pl or speedscope),
+    "alloc" (top allocation sites) or "json" (summary).
+    """
+    denied = _check_access()
+    if denied:
+        return denied
+    path = get_profile_path(profile_id, kind)
+    if path is None:
+        return jsonify({"success": False, "error": f"Profile {profile_id} ({kind}) not found"}), 404
+    return send_file(
+        path,
+        mimetype=PROFILE_KINDS[kind][1],
+        as_attachment=True,
+        download_name=os.path.basename(path)
+    )
@@ -0,0 +1,127 @@
+"""
+Runs API Routes - Browse past analysis and replacement runs from the run log index
+"""
+from flask import Blueprint, request, jsonify
+import sys
+import os
+
+# Add backend directory to path
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
+
+from services.analysis_logger import get_run_history
+from services.json_service import json_response
+
+runs_bp = Blueprint('runs', __name__)
+
+
+@runs_bp.route('/runs', methods=['GET'])
+def list_runs():
+    """
+    List past runs, newest first
+    GET /api/runs?limit=50&offset=0&analysis_type=analysis
+
+    Query Parameters:
+        - limit: Number of runs to return (default: 50, max: 500)
+        - offset: Offset for pagination (default: 0)
+        - analysis_type: "analysis" or "replacements" (optional)
+
+    Response:
+        {
+            "success": true,
+            "runs": [
+                {
+                    "run_id": "analysis_20250101_120000_a1b2c3",
+                    "analysis_type": "analysis",
+                    "status": "completed",  // running, completed or incomplete (server stopped mid-run)
+                    "started_at": "2025-01-01T12:00:00.000",
+                    "completed_at": "2025-01-01T12:03:10.512",
+                    "total_products": 120,
+                    "total_analyzed": 100,
+                    "total_skipped": 20,
+                    "total_results": 120,
+                    "chunks": 10,
+                    "chunks_failed": 0,
+                    "duration_seconds": 190.5
+                },
+                ...
+            ],
+            "total": 240,
+            "limit": 50,
+            "offset": 0
+        }
+    """
+    try:
+        try:
+            limit = max(1, min(int(request.args.get('limit', 50)), 500))
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({"success": False, "error": "limit and offset must be integers"}), 400
+        analysis_type = request.args.get('analysis_type', '').strip() or None
+
+        total, runs = get_run_history().list_runs(limit=limit, offset=offset, analysis_type=analysis_type)
+        return json_response({
+            "success": True,
+            "runs": runs,
+            "total": total,
+            "limit": limit,
+            "offset": offset
+        })
+
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@runs_bp.route('/runs/<run_id>', methods=['GET'])
+def get_run(run_id: str):
+    """
+    Get a run's summary and results, read from its indexed spans in the run log
+    GET /api/runs/<run_id>
+
+    Response:
+        {
+            "success": true,
+            "run": {...},  // summary as in GET /api/runs
+            "results": [...],  // analyzed results in chunk order, then skipped products
+            "errors": [
+                {"chunk": 3, "error": "...", "failed_products": [{"manufacturer": "...", "part_number": "..."}]}
+            ]
+        }
+    """
+    try:
+        history = get_run_history()
+        run = history.get_run(run_id)
+        records = history.read_records(run_id) if run else None
+        if records is None:
+            return jsonify({"success": False, "error": f"Run {run_id} not found"}), 404
+
+        results = []
+        skipped_results = []
+        errors = []
+        for record in records:
+            if record.get('type') == 'chunk':
+                results.extend(record.get('results') or [])
+                if not record.get('success'):
+                    errors.append({
+                        "chunk": record.get('chunk'),
+                        "error": record.get('error'),
+                        "failed_products": record.get('failed_products', [])
+                    })
+            elif record.get('type') == 'complete':
+                skipped_results = record.get('skipped_results') or []
+
+        return json_response({
+            "success": True,
+            "run": run,
+            "results": results + skipped_results,
+            "errors": errors
+        })
+
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
@@ -12,9 +12,15 @@ import traceback
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, backend_dir)
 
+from services.cache_service import invalidate_for_parts
+from services.retry_service import run_in_transaction, get_contention_metrics
+from services.tracing_service import span
+
 try:
     from database.db_config import get_db_session
     from database.models import Machine, Part, MachinePart, AnalysisLog
+    from database.part_key import make_part_key
+    from database.content_hash import PART_CONTENT_FIELDS, canonical_value, part_content_hash
     DB_AVAILABLE = True
 except ImportError:
     DB_AVAILABLE = False
@@ -22,6 +28,9 @@ except ImportError:
 
 save_bp = Blueprint('save', __name__)
 
+# Part keys saved per transaction; short transactions keep lock hold times low
+SAVE_BATCH_SIZE = 200
+
 
 @save_bp.route('/save', methods=['POST'])
 def save_data():
@@ -59,9 +68,20 @@ def save_data():
             "machine_id": 1,
             "parts_saved": 10,
             "parts_updated": 2,
+            "parts_unchanged": 0,
             "machine_parts_linked": 10,
-            "log_id": 5  // if create_log is true
+            "machine_parts_updated": 0,
+            "machine_parts_unchanged": 0,
+            "log_id": 5,  // if create_log is true
+            "retries": 0  // transactions retried after lock contention
         }
+        
+    Parts are saved in batches that commit on their own. If a batch fails, the
+    500 response carries the counts of the batches committed before it and
+    their keys in "committed_part_keys".
+    
+    Products whose manufacturer or part number has no letters or digits (so no
+    part key) fail the request with 400, listing their indexes in "invalid_rows".
     """
     if not DB_AVAILABLE:
         return jsonify({
@@ -81,6 +101,27 @@ def save_data():
         if not isinstance(products, list):
             return jsonify({"success": False, "error": "Products must be a list"}), 400
         
+        # Group products by part key; a manufacturer or part number without
+        # letters or digits has no key and is rejected rather than dropped
+        products_by_key: Dict[str, List[Dict[str, Any]]] = {}
+        unkeyed_rows = []
+        for index, product_data in enumerate(products):
+            part_manufacturer = product_data.get('part_manufacturer') or product_data.get('manufacturer', '')
+            manufacturer_part_number = product_data.get('manufacturer_part_number') or product_data.get('part_number', '')
+            if not part_manufacturer or not manufacturer_part_number:
+                continue  # Skip products without required fields
+            part_key = make_part_key(part_manufacturer, manufacturer_part_number)
+            if part_key:
+                products_by_key.setdefault(part_key, []).append(product_data)
+            else:
+                unkeyed_rows.append(index)
+        if unkeyed_rows:
+            return jsonify({
+                "success": False,
+                "error": "Manufacturer or part number has no letters or digits",
+                "invalid_rows": unkeyed_rows
+            }), 400
+        
         # Get database session (will try to initialize if needed)
         try:
             session = get_db_session()
@@ -94,121 +135,68 @@ def save_data():
             }), 503
         
         try:
-            # Step 1: Create or update Machine
-            machine = None
-            equipment_id = general_info.get('eam_equipment_id') or general_info.get('equipment_id')
+            retry_stats = {"retries": 0}
             
+            # Step 1: Create or update Machine (its own short transaction)
+            machine_id = None
+            machine_changed = False
+            equipment_id = general_info.get('eam_equipment_id') or general_info.get('equipment_id')
             if equipment_id:
-                # Try to find existing machine
-                machine = session.query(Machine).filter(
-                    Machine.equipment_id == equipment_id
-                ).first()
-                
-                if machine:
-                    # Update existing machine
-                    machine.equipment_alias = general_info.get('alias') or machine.equipment_alias
-                    machine.machine_description = general_info.get('equipment_description') or machine.machine_description
-                    machine.plant = general_info.get('plant') or machine.plant
-                    machine.group_responsibility = general_info.get('group_responsible') or machine.group_responsibility
-                else:
-                    # Create new machine
-                    machine = Machine(
-                        equipment_id=equipment_id,
-                        equipment_alias=general_info.get('alias'),
-                        machine_description=general_info.get('equipment_description'),
-                        plant=general_info.get('plant'),
-                        group_responsibility=general_info.get('group_responsible'),
-                        eam_equipment_id=equipment_id
+                with span('save.machine', equipment_id=equipment_id):
+                    machine_id, machine_changed = run_in_transaction(
+                        session, lambda s: _save_machine(s, equipment_id, general_info),
+                        stats=retry_stats
                     )
-                    session.add(machine)
-                    session.flush()  # Get machine.id
             
-            # Step 2: Create or update Parts and link to Machine
-            parts_saved = 0
-            parts_updated = 0
-            machine_parts_linked = 0
-            machine_parts_updated = 0
+            # Step 2: Save in part key order, so concurrent saves take row and
+            # unique-index locks in the same order
+            sorted_keys = sorted(products_by_key)
             
-            # Track machine-part links we've processed in this transaction to avoid duplicates
-            processed_links = set()
+            # Step 3: Save parts and machine links in short batched transactions,
+            # each retried on deadlocks, lock timeouts and unique-key races
+            totals = {
+                "parts_saved": 0,
+                "parts_updated": 0,
+                "parts_unchanged": 0,
+                "machine_parts_linked": 0,
+                "machine_parts_updated": 0,
+                "machine_parts_unchanged": 0
+            }
+            changed_part_ids = set()
+            links_changed = False
+            committed_keys: List[str] = []
             
-            for product_data in products:
-                part_manufacturer = product_data.get('part_manufacturer') or product_data.get('manufacturer', '')
-                manufacturer_part_number = product_data.get('manufacturer_part_number') or product_data.get('part_number', '')
-                
-                if not part_manufacturer or not manufacturer_part_number:
-                    continue  # Skip products without required fields
-                
-                # Try to find existing part
-                part = session.query(Part).filter(
-                    Part.part_manufacturer == part_manufacturer,
-                    Part.manufacturer_part_number == manufacturer_part_number
-                ).first()
-                
-                if part:
-                    # Update existing part with new data
-                    parts_updated += 1
-                    _update_part_from_product(part, product_data)
-                else:
-                    # Create new part
-                    part = Part(
-                        part_manufacturer=part_manufacturer,
-                        manufacturer_part_number=manufacturer_part_number
-                    )
-                    _update_part_from_product(part, product_data)
-                    session.add(part)
-                    parts_saved += 1
-                    session.flush()  # Get part.id
-                
-                # Step 3: Link part to machine if machine exists
-                if machine and part.id:
-                    # Create a unique key for this machine-part combination
-                    link_key = (machine.id, part.id)
-                    
-                    # Skip if we've already processed this link in this transaction
-                    if link_key in processed_links:
-                        continue
-                    
-                    # Check if link already exists in database
-                    existing_link = session.query(MachinePart).filter(
-                        MachinePart.machine_id == machine.id,
-                        MachinePart.part_id == part.id
-                    ).first()
-                    
-                    if existing_link:
-                        # Update existing link with new data
-                        qty_str = product_data.get('qty_on_machine', '1')
-                        try:
-                            qty = float(qty_str) if qty_str else 1.0
-                        except (ValueError, TypeError):
-                            qty = 1.0
-                        
-                        existing_link.quantity = qty
-                        existing_link.cspl_line_number = product_data.get('cspl_line_number') or existing_link.cspl_line_number
-                        existing_link.original_order = product_data.get('original_order') or existing_link.original_order
-                        existing_link.parent_folder = product_data.get('parent_folder') or existing_link.parent_folder
-                        machine_parts_updated += 1
-                    else:
-                        # Create new link
-                        qty_str = product_data.get('qty_on_machine', '1')
-                        try:
-                            qty = float(qty_str) if qty_str else 1.0
-                        except (ValueError, TypeError):
-                            qty = 1.0
-                        
-                        machine_part = MachinePart(
-                            machine_id=machine.id,
-                            part_id=part.id,
-                            quantity=qty,
-                            cspl_line_number=product_data.get('cspl_line_number'),
-                            original_order=product_data.get('original_order'),
-                            parent_folder=product_data.get('parent_folder')
+            try:
+                for batch_start in range(0, len(sorted_keys), SAVE_BATCH_SIZE):
+                    batch_keys = sorted_keys[batch_start:batch_start + SAVE_BATCH_SIZE]
+                    with span('save.parts_batch', part_keys=len(batch_keys)):
+                        counts, batch_changed_ids, batch_links_changed = run_in_transaction(
+                            session, lambda s: _save_parts_batch(s, machine_id, batch_keys, products_by_key),
+                            stats=retry_stats
                         )
-                        session.add(machine_part)
-                        machine_parts_linked += 1
-                    
-                    # Mark this link as processed
-                    processed_links.add(link_key)
+                    for name, value in counts.items():
+                        totals[name] += value
+                    changed_part_ids.update(batch_changed_ids)
+                    links_changed = links_changed or batch_links_changed
+                    committed_keys.extend(batch_keys)
+            except Exception as e:
+                # Earlier batches stay committed: report what was saved
+                traceback.print_exc()
+                return jsonify({
+                    "success": False,
+                    "error": str(e),
+                    "machine_id": machine_id,
+                    **totals,
+                    "committed_part_keys": committed_keys,
+                    "retries": retry_stats["retries"]
+                }), 500
+            finally:
+                # Refresh cached summaries of every machine using the changed parts,
+                # including batches committed before a failure
+                machine_changed = machine_id is not None and (machine_changed or links_changed)
+                if changed_part_ids or machine_changed:
+                    with span('save.invalidate_cache', parts=len(changed_part_ids)):
+                        invalidate_for_parts(session, changed_part_ids, [machine_id] if machine_changed else None)
             
             # Step 4: Create analysis log if requested
             log_id = None
@@ -218,32 +206,30 @@ def save_data():
                     user_agent = request.headers.get('User-Agent', '')
                     ip_address = request.remote_addr or ''
                     
-                    analysis_log = AnalysisLog(
-                        analysis_type='product_analysis',
-                        status='completed',
-                        input_data={'products': products[:10]},  # Store first 10 for reference
-                        output_data={'total_products': len(products)},
-                        products_count=len(products),
-                        user_agent=user_agent[:500],  # Limit length
-                        ip_address=ip_address
-                    )
-                    session.add(analysis_log)
-                    session.flush()
-                    log_id = analysis_log.id
+                    def create_analysis_log(s):
+                        analysis_log = AnalysisLog(
+                            analysis_type='product_analysis',
+                            status='completed',
+                            input_data={'products': products[:10]},  # Store first 10 for reference
+                            output_data={'total_products': len(products)},
+                            products_count=len(products),
+                            user_agent=user_agent[:500],  # Limit length
+                            ip_address=ip_address
+                        )
+                        s.add(analysis_log)
+                        s.flush()
+                        return analysis_log.id
+                    
+                    log_id = run_in_transaction(session, create_analysis_log, stats=retry_stats)
                 except Exception as e:
                     print(f"Warning: Could not create analysis log: {e}")
             
-            # Commit all changes
-            session.commit()
-            
             return jsonify({
                 "success": True,
-                "machine_id": machine.id if machine else None,
-                "parts_saved": parts_saved,
-                "parts_updated": parts_updated,
-                "machine_parts_linked": machine_parts_linked,
-                "machine_parts_updated": machine_parts_updated,
-                "log_id": log_id
+                "machine_id": machine_id,
+                **totals,
+                "log_id": log_id,
+                "retries": retry_stats["retries"]
             })
             
         except Exception as e:
@@ -261,100 +247,249 @@ def save_data():
         }), 500
 
 
-def _update_part_from_product(part: Part, product_data: Dict[str, Any]):
+@save_bp.route('/save/metrics', methods=['GET'])
+def get_save_metrics():
+    """
+    Get transaction and lock contention counters for this process
+    GET /api/save/metrics
+    
+    Response:
+        {
+            "success": true,
+            "metrics": {
+                "transactions": 120,
+                "retries": 3,
+                "deadlocks": 1,
+                "lock_timeouts": 0,
+                "integrity_conflicts": 2,
+                "failures": 0,
+                "retry_wait_seconds": 0.42
+            }
+        }
     """
-    Update a Part object with data from a product dictionary.
-    Handles all fields including AI analysis and replacement data.
+    return jsonify({
+        "success": True,
+        "metrics": get_contention_metrics()
+    })
+
+
+def _save_machine(session, equipment_id: str, general_info: Dict[str, Any]):
     """
-    # Basic part information
-    if 'part_description' in product_data:
-        part.part_description = product_data.get('part_description')
-    if 'part_number_ai_modified' in product_data:
-        part.part_number_ai_modified = product_data.get('part_number_ai_modified')
-    if 'suggested_supplier' in product_data:
-        part.suggested_supplier = product_data.get('suggested_supplier')
-    if 'supplier_part_number' in product_data:
-        part.supplier_part_number = product_data.get('supplier_part_number')
-    if 'gore_stock_number' in product_data:
-        part.gore_stock_number = product_data.get('gore_stock_number')
-    if 'is_part_likely_to_fail' in product_data:
-        part.is_part_likely_to_fail = product_data.get('is_part_likely_to_fail')
-    if 'will_failures_stop_machine' in product_data:
-        part.will_failures_stop_machine = product_data.get('will_failures_stop_machine')
-    if 'stocking_decision' in product_data:
-        part.stocking_decision = product_data.get('stocking_decision')
-    if 'min_qty_to_stock' in product_data:
-        min_qty = product_data.get('min_qty_to_stock')
-        if min_qty:
-            try:
-                part.min_qty_to_stock = float(min_qty)
-            except (ValueError, TypeError):
-                pass
-    if 'part_preplacement_line_number' in product_data:
-        part.part_preplacement_line_number = product_data.get('part_preplacement_line_number')
-    if 'notes' in product_data:
-        part.notes = product_data.get('notes')
+    Create or update the machine of a save.
     
-    # AI Analysis Fields - only update if explicitly provided in product_data
-    # For products with missing/no stocking_decision, these will be None/empty
-    # This ensures skipped products are saved without AI data
-    if 'ai_status' in product_data:
-        # Set the value (can be None for skipped products)
-        part.ai_status = product_data.get('ai_status')
-    if 'notes_by_ai' in product_data:
-        part.notes_by_ai = product_data.get('notes_by_ai')
-    if 'ai_confidence' in product_data:
-        part.ai_confidence = product_data.get('ai_confidence')
-    if 'ai_confidence_confirmed' in product_data:
-        part.ai_confidence_confirmed = product_data.get('ai_confidence_confirmed')
+    Returns:
+        Tuple of (machine id, whether anything changed)
+    """
+    machine = session.query(Machine).filter(
+        Machine.equipment_id == equipment_id
+    ).first()
     
-    # Replacement Information
-    if 'recommended_replacement' in product_data:
-        part.recommended_replacement = product_data.get('recommended_replacement')
-    if 'replacement_manufacturer' in product_data:
-        part.replacement_manufacturer = product_data.get('replacement_manufacturer')
-    if 'replacement_price' in product_data:
-        price = product_data.get('replacement_price')
-        if price is not None:
-            try:
-                part.replacement_price = float(price)
-            except (ValueError, TypeError):
-                pass
-    if 'replacement_currency' in product_data:
-        part.replacement_currency = product_data.get('replacement_currency')
-    if 'replacement_source_type' in product_data:
-        part.replacement_source_type = product_data.get('replacement_source_type')
-    if 'replacement_source_url' in product_data:
-        part.replacement_source_url = product_data.get('replacement_source_url')
-    if 'replacement_notes' in product_data:
-        part.replacement_notes = product_data.get('replacement_notes')
-    if 'replacement_confidence' in product_data:
-        part.replacement_confidence = product_data.get('replacement_confidence')
+    if not machine:
+        machine = Machine(
+            equipment_id=equipment_id,
+            equipment_alias=general_info.get('alias'),
+            machine_description=general_info.get('equipment_description'),
+            plant=general_info.get('plant'),
+            group_responsibility=general_info.get('group_responsible'),
+            eam_equipment_id=equipment_id
+        )
+        session.add(machine)
+        session.flush()  # Get machine.id
+        return machine.id, True
+    
+    # Update only the machine fields that changed
+    machine_changed = False
+    machine_values = {
+        "equipment_alias": general_info.get('alias') or machine.equipment_alias,
+        "machine_description": general_info.get('equipment_description') or machine.machine_description,
+        "plant": general_info.get('plant') or machine.plant,
+        "group_responsibility": general_info.get('group_responsible') or machine.group_responsibility
+    }
+    for field, value in machine_values.items():
+        if getattr(machine, field) != value:
+            setattr(machine, field, value)
+            machine_changed = True
+    return machine.id, machine_changed
+
+
+def _save_parts_batch(
+    session,
+    machine_id: Optional[int],
+    part_keys: List[str],
+    products_by_key: Dict[str, List[Dict[str, Any]]]
+):
+    """
+    Save one batch of parts (in part key order) and link them to the machine.
+    Runs inside run_in_transaction, so it must be safe to re-run after a rollback.
+    
+    Returns:
+        Tuple of (counts, ids of parts that changed, whether any link changed)
+    """
+    counts = {
+        "parts_saved": 0,
+        "parts_updated": 0,
+        "parts_unchanged": 0,
+        "machine_parts_linked": 0,
+        "machine_parts_updated": 0,
+        "machine_parts_unchanged": 0
+    }
+    changed_part_ids = set()
+    links_changed = False
     
-    # Team Notes
-    if 'will_notes' in product_data:
-        part.will_notes = product_data.get('will_notes')
-    if 'nejat_notes' in product_data:
-        part.nejat_notes = product_data.get('nejat_notes')
-    if 'kc_notes' in product_data:
-        part.kc_notes = product_data.get('kc_notes')
-    if 'ricky_notes' in product_data:
-        part.ricky_notes = product_data.get('ricky_notes')
-    if 'stephanie_notes' in product_data:
-        part.stephanie_notes = product_data.get('stephanie_notes')
-    if 'pit_notes' in product_data:
-        part.pit_notes = product_data.get('pit_notes')
+    # Load the batch's existing parts with one query
+    parts_by_key = {
+        part.part_key: part
+        for part in session.query(Part).filter(Part.part_key.in_(part_keys)).all()
+    }
+    
+    new_parts = []
+    for part_key in part_keys:
+        part = parts_by_key.get(part_key)
+        # Products repeating a part are merged in upload order (later values win) and
+        # compared once, so re-saving an unchanged sheet writes nothing
+        part_values = {}
+        for product_data in products_by_key[part_key]:
+            part_values.update(_product_part_values(product_data))
+        if part is None:
+            product_data = products_by_key[part_key][0]
+            part = Part(
+                part_manufacturer=product_data.get('part_manufacturer') or product_data.get('manufacturer', ''),
+                manufacturer_part_number=product_data.get('manufacturer_part_number') or product_data.get('part_number', ''),
+                part_key=part_key,
+                content_hash=part_content_hash(part_values),
+                **part_values
+            )
+            session.add(part)
+            new_parts.append(part)
+            parts_by_key[part_key] = part
+            counts["parts_saved"] += 1
+        elif _apply_part_values(part, part_values):
+            # Write only the columns that changed (nothing if the content hash matches)
+            counts["parts_updated"] += 1
+            changed_part_ids.add(part.id)
+        else:
+            counts["parts_unchanged"] += 1
+    
+    # Insert new parts in key order, getting their ids for the links
+    session.flush()
+    changed_part_ids.update(part.id for part in new_parts)
+    
+    if machine_id is None:
+        return counts, changed_part_ids, links_changed
+    
+    links_by_part_id = {
+        link.part_id: link
+        for link in session.query(MachinePart).filter(
+            MachinePart.machine_id == machine_id,
+            MachinePart.part_id.in_([part.id for part in parts_by_key.values()])
+        ).all()
+    }
+    
+    for part_key in part_keys:
+        part = parts_by_key[part_key]
+        # The first product of a part defines its link
+        product_data = products_by_key[part_key][0]
+        
+        qty_str = product_data.get('qty_on_machine', '1')
+        try:
+            qty = float(qty_str) if qty_str else 1.0
+        except (ValueError, TypeError):
+            qty = 1.0
+        
+        existing_link = links_by_part_id.get(part.id)
+        if existing_link:
+            # Update only the link fields that changed
+            link_values = {
+                "quantity": qty,
+                "cspl_line_number": product_data.get('cspl_line_number') or existing_link.cspl_line_number,
+                "original_order": product_data.get('original_order') or existing_link.original_order,
+                "parent_folder": product_data.get('parent_folder') or existing_link.parent_folder
+            }
+            link_changed = False
+            for field, value in link_values.items():
+                if canonical_value(getattr(existing_link, field)) != canonical_value(value):
+                    setattr(existing_link, field, value)
+                    link_changed = True
+            if link_changed:
+                counts["machine_parts_updated"] += 1
+                links_changed = True
+            else:
+                counts["machine_parts_unchanged"] += 1
+        else:
+            session.add(MachinePart(
+                machine_id=machine_id,
+                part_id=part.id,
+                quantity=qty,
+                cspl_line_number=product_data.get('cspl_line_number'),
+                original_order=product_data.get('original_order'),
+                parent_folder=product_data.get('parent_folder')
+            ))
+            counts["machine_parts_linked"] += 1
+            links_changed = True
     
-    # Communication
-    if 'initial_email_communication' in product_data:
-        part.initial_email_communication = product_data.get('initial_email_communication')
-    if 'follow_up_email_communication_date' in product_data:
-        date_str = product_data.get('follow_up_email_communication_date')
-        if date_str:
+    return counts, changed_part_ids, links_changed
+
+
+def _product_part_values(product_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract the part column values a product dictionary sets.
+    Only fields present in product_data are returned; numbers and dates that
+    fail to parse are left out, so the stored value is kept.
+    """
+    values = {}
+    for field in PART_CONTENT_FIELDS:
+        if field not in product_data:
+            continue
+        value = product_data.get(field)
+        
+        if field == 'min_qty_to_stock':
+            # Empty minimum quantities keep the stored value
+            if not value:
+                continue
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                continue
+        elif field == 'replacement_price':
+            if value is None:
+                continue
             try:
-                # Try to parse date string
-                part.follow_up_email_communication_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+                value = float(value)
             except (ValueError, TypeError):
-                # If parsing fails, store as string in notes or skip
-                pass
+                continue
+        elif field == 'follow_up_email_communication_date':
+            if not value:
+                continue
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').date()
+            except (ValueError, TypeError):
+                continue
+        
+        # AI fields can be None for products skipped from analysis
+        values[field] = value
+    return values
 
+
+def _apply_part_values(part: Part, values: Dict[str, Any]) -> bool:
+    """
+    Apply product values to a Part, writing only columns whose value changes.
+    The stored content hash lets unchanged rows be skipped without comparing columns.
+    
+    Returns:
+        True if any column changed
+    """
+    current = {field: getattr(part, field) for field in PART_CONTENT_FIELDS}
+    merged = {**current, **values}
+    content_hash = part_content_hash(merged)
+    if part.content_hash is not None and part.content_hash == content_hash:
+        return False
+    
+    changed = False
+    for field, value in values.items():
+        if canonical_value(current[field]) != canonical_value(value):
+            setattr(part, field, value)
+            changed = True
+    if part.content_hash != content_hash:
+        part.content_hash = content_hash
+        changed = True
+    return changed
@@ -28,7 +28,15 @@ log_info("AZURE_CLIENT_SECRET: {}", 'SET' if os.getenv('AZURE_CLIENT_SECRET') el
 log_info("=" * 80)
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['Server-Timing', 'X-Run-Id', 'X-Profile-Id'])
+
+# Per-request trace spans, Server-Timing and X-Run-Id headers
+from services.tracing_service import init_tracing
+init_tracing(app)
+
+# Opt-in request profiling (PROFILE_REQUESTS / PROFILE_TOKEN)
+from services.profiling_service import init_profiling
+init_profiling(app)
 
 # Track database initialization status
 db_initialized = False
@@ -109,11 +117,17 @@ from api.excel_routes import excel_bp
 from api.analyze_routes import analyze_bp
 from api.save_routes import save_bp
 from api.parts_routes import parts_bp
+from api.runs_routes import runs_bp
+from api.metrics_routes import metrics_bp
+from api.profiles_routes import profiles_bp
 
 app.register_blueprint(excel_bp, url_prefix='/api/excel')
 app.register_blueprint(analyze_bp, url_prefix='/api')
 app.register_blueprint(save_bp, url_prefix='/api')
 app.register_blueprint(parts_bp, url_prefix='/api')
+app.register_blueprint(runs_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp, url_prefix='/api')
+app.register_blueprint(profiles_bp, url_prefix='/api')
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=False)
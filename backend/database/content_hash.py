@@ -0,0 +1,82 @@
+"""
+Part Content Hash
+Fingerprint of the part fields written by POST /api/save, stored in parts.content_hash
+so re-saving an unchanged row can be skipped without writing it.
+
+Writers that change these fields outside /api/save must set content_hash to NULL;
+a NULL hash never matches, so the next save falls back to a column-by-column diff.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional
+
+
+# Part columns written from a saved product, in hash order
+PART_CONTENT_FIELDS = (
+    'part_description',
+    'part_number_ai_modified',
+    'suggested_supplier',
+    'supplier_part_number',
+    'gore_stock_number',
+    'is_part_likely_to_fail',
+    'will_failures_stop_machine',
+    'stocking_decision',
+    'min_qty_to_stock',
+    'part_preplacement_line_number',
+    'notes',
+    'ai_status',
+    'notes_by_ai',
+    'ai_confidence',
+    'ai_confidence_confirmed',
+    'recommended_replacement',
+    'replacement_manufacturer',
+    'replacement_price',
+    'replacement_currency',
+    'replacement_source_type',
+    'replacement_source_url',
+    'replacement_notes',
+    'replacement_confidence',
+    'will_notes',
+    'nejat_notes',
+    'kc_notes',
+    'ricky_notes',
+    'stephanie_notes',
+    'pit_notes',
+    'initial_email_communication',
+    'follow_up_email_communication_date',
+)
+
+
+def canonical_value(value: Any) -> Optional[str]:
+    """
+    Canonical form of a column value, so a value read back from the database
+    compares equal to the one that was written (DECIMAL(10,2) numbers, dates).
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (int, float, Decimal)):
+        try:
+            return format(Decimal(str(value)).quantize(Decimal('0.01')), 'f')
+        except InvalidOperation:
+            return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def part_content_hash(values: Dict[str, Any]) -> str:
+    """
+    Hash the content fields of a part.
+
+    Args:
+        values: Column values keyed by name (missing fields count as NULL)
+
+    Returns:
+        SHA-1 hex digest
+    """
+    canonical = [canonical_value(values.get(field)) for field in PART_CONTENT_FIELDS]
+    return hashlib.sha1(json.dumps(canonical, ensure_ascii=False).encode('utf-8')).hexdigest()
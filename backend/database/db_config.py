@@ -1,16 +1,31 @@
 """
 Database Configuration and Connection
 """
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, event
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.exc import OperationalError
 import os
+import sys
+import time
 from dotenv import load_dotenv
-import pymysql
+
+try:
+    import pymysql
+except ImportError:
+    # Only required for the MySQL backend
+    pymysql = None
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.metrics_service import DB_QUERY_SECONDS, current_endpoint
+from services.tracing_service import record_stage
 
 load_dotenv()
 
+# Database backend: "mysql" (default) or "sqlite" (embedded, used by the desktop build)
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').strip().lower()
+
 # Database connection configuration
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_PORT = os.getenv('DB_PORT', '3306')
@@ -26,6 +41,134 @@ BASE_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT
 DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset={DB_CHARSET}"
 
 
+def get_sqlite_path() -> str:
+    """
+    Get the SQLite database file path.
+    Uses DB_SQLITE_PATH if set, otherwise a file next to the exe (packaged) or in the backend directory.
+    """
+    sqlite_path = os.getenv('DB_SQLITE_PATH', '')
+    if sqlite_path:
+        return os.path.abspath(sqlite_path)
+
+    if getattr(sys, 'frozen', False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_dir, 'data', f'{DB_NAME}.db')
+
+
+# SQLite pragmas applied to every new connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # Readers don't block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",  # Safe with WAL, avoids an fsync per commit
+    "PRAGMA foreign_keys=ON",  # Needed for ON DELETE CASCADE on machine_parts
+    "PRAGMA busy_timeout=5000",  # Wait for the write lock instead of failing
+    "PRAGMA cache_size=-64000",  # 64 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped reads
+)
+
+
+def is_sqlite() -> bool:
+    """
+    Check whether the embedded SQLite backend is configured.
+    """
+    return DB_BACKEND == 'sqlite'
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def _create_sqlite_engine():
+    """
+    Create the engine for the embedded SQLite backend (WAL mode, tuned pragmas).
+    """
+    sqlite_path = get_sqlite_path()
+    os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
+
+    sqlite_engine = create_engine(
+        f"sqlite:///{sqlite_path}",
+        poolclass=QueuePool,
+        pool_size=10,
+        max_overflow=20,
+        echo=False,  # Set to True for SQL query logging
+        connect_args={
+            'check_same_thread': False,  # Connections are shared across Flask worker threads
+            'timeout': 5
+        }
+    )
+    event.listen(sqlite_engine, 'connect', _set_sqlite_pragmas)
+    _instrument_engine(sqlite_engine)
+    return sqlite_engine
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        DB_QUERY_SECONDS.observe(elapsed, (current_endpoint(),))
+        record_stage('db', elapsed)
+
+
+def _instrument_engine(db_engine):
+    """
+    Time every statement for GET /api/metrics (labelled with the API endpoint running it)
+    and the "db" stage of the request trace.
+    """
+    event.listen(db_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(db_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def upsert_statement(table, rows, index_elements, update_columns):
+    """
+    Build a dialect-specific INSERT ... upsert statement.
+    MySQL uses ON DUPLICATE KEY UPDATE, SQLite uses ON CONFLICT (...) DO UPDATE.
+
+    Args:
+        table: SQLAlchemy Table to insert into
+        rows: List of row dictionaries
+        index_elements: Columns of the unique key that detects conflicts (SQLite only)
+        update_columns: Columns to overwrite when the row already exists
+
+    Columns with a SQL onupdate (updated_at) are refreshed on conflict as well,
+    since upserts don't apply onupdate defaults on their own.
+
+    Returns:
+        Executable insert statement
+    """
+    touched = {
+        column.name: column.onupdate.arg
+        for column in table.columns
+        if column.onupdate is not None and column.onupdate.is_clause_element
+        and column.name not in update_columns
+    }
+
+    if is_sqlite():
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={**{column: stmt.excluded[column] for column in update_columns}, **touched}
+        )
+
+    from sqlalchemy.dialects.mysql import insert as mysql_insert
+    stmt = mysql_insert(table).values(rows)
+    return stmt.on_duplicate_key_update(
+        {**{column: stmt.inserted[column] for column in update_columns}, **touched}
+    )
+
+
 def create_database_if_not_exists():
     """
     Create the database if it doesn't exist.
@@ -97,35 +240,25 @@ def get_db_session():
 
 def init_db():
     """
-    Initialize database - create database and all tables if they don't exist.
+    Initialize database - connect, create the database if it doesn't exist and
+    apply pending schema migrations (see migrations.py).
     Automatically creates database and tables on first run.
     Returns True if successful, False if initialization failed (non-critical).
     This function is idempotent - safe to call multiple times.
     """
     global engine, SessionLocal
     
-    # If already initialized, just verify connection
+    # Already initialized - pool_pre_ping revalidates connections on checkout
     if engine is not None and SessionLocal is not None:
-        try:
-            with engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
-            return True
-        except Exception:
-            # Connection lost, reset and reinitialize
-            engine = None
-            SessionLocal = None
+        return True
+    
+    if is_sqlite():
+        return _init_sqlite_db()
     
     try:
-        # Step 1: Create database if it doesn't exist
-        print(f"Connecting to MySQL server at {DB_HOST}:{DB_PORT}...")
-        db_created = create_database_if_not_exists()
-        if not db_created:
-            print("Skipping database initialization - MySQL server not available.")
-            return False
-        
-        # Step 2: Create engine with connection pooling
+        # Step 1: Create engine with connection pooling
         try:
-            print(f"Creating database engine for database '{DB_NAME}'...")
+            print(f"Connecting to MySQL database '{DB_NAME}' at {DB_HOST}:{DB_PORT}...")
             engine = create_engine(
                 DATABASE_URL,
                 poolclass=QueuePool,
@@ -138,11 +271,22 @@ def init_db():
                     'connect_timeout': 5  # Reduced timeout
                 }
             )
+            _instrument_engine(engine)
             
-            # Test the connection
-            print("Testing database connection...")
-            with engine.connect() as conn:
-                conn.execute(text("SELECT 1"))
+            # Test the connection; create the database only when it doesn't exist yet
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            except OperationalError as e:
+                if not _is_unknown_database_error(e):
+                    raise
+                engine.dispose()
+                if not create_database_if_not_exists():
+                    print("Skipping database initialization - MySQL server not available.")
+                    engine = None
+                    return False
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
             print("[OK] Database connection successful!")
             
             # Update SessionLocal to use the new engine
@@ -163,11 +307,10 @@ def init_db():
             SessionLocal = None
             return False
         
-        # Step 3: Create all tables if they don't exist
+        # Step 2: Apply pending schema migrations (one version read when current)
         if engine is not None:
-            print("Creating database tables if they don't exist...")
-            from .models import Base
-            Base.metadata.create_all(bind=engine)
+            from .migrations import run_migrations
+            run_migrations(engine)
             print("[OK] Database and tables initialized successfully!")
             return True
         else:
@@ -187,6 +330,44 @@ def init_db():
         return False
 
 
+def _is_unknown_database_error(error: OperationalError) -> bool:
+    """
+    Check whether a connection failed because DB_NAME doesn't exist (MySQL error 1049).
+    """
+    args = getattr(error.orig, 'args', ())
+    return bool(args) and args[0] == 1049
+
+
+def _init_sqlite_db():
+    """
+    Initialize the embedded SQLite backend - no server, no connect timeouts.
+    Returns True if successful, False if initialization failed (non-critical).
+    """
+    global engine, SessionLocal
+    
+    try:
+        print(f"Opening SQLite database at {get_sqlite_path()}...")
+        engine = _create_sqlite_engine()
+        SessionLocal = scoped_session(sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=engine
+        ))
+        
+        from .migrations import run_migrations
+        run_migrations(engine)
+        print("[OK] SQLite database and tables initialized successfully!")
+        return True
+    except Exception as e:
+        import traceback
+        print(f"[ERROR] Error initializing SQLite database: {e}")
+        print(traceback.format_exc())
+        print("  Database features will be unavailable.")
+        engine = None
+        SessionLocal = None
+        return False
+
+
 def close_db():
     """
     Close database connections.
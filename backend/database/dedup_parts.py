@@ -0,0 +1,302 @@
+"""
+Part Deduplication Tool
+Backfills parts.part_key and merges parts that share a normalized key,
+re-pointing their machine_parts links to the surviving row.
+
+Usage:
+    python -m database.dedup_parts            # merge duplicates
+    python -m database.dedup_parts --dry-run  # report only
+"""
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import MetaData, Table, select, update, delete, func, bindparam
+from sqlalchemy.engine import Connection
+
+from .models import MachinePart, DeletedRecord
+from .part_key import make_part_key
+
+# Rows per executemany batch
+BATCH_SIZE = 1000
+
+# Columns never copied between duplicates
+_IDENTITY_COLUMNS = {'id', 'part_key', 'part_manufacturer', 'manufacturer_part_number', 'created_at', 'updated_at', 'content_hash'}
+
+
+def _live_parts_table(conn: Connection) -> Table:
+    """
+    Reflect the parts table as it exists in the database. Migrations call this
+    tool before later migrations add their columns, so the model can't be used.
+    """
+    return Table('parts', MetaData(), autoload_with=conn)
+
+
+def backfill_part_keys(conn: Connection) -> int:
+    """
+    Compute part_key for every part that doesn't have one yet.
+
+    Returns:
+        Number of parts updated
+    """
+    parts = _live_parts_table(conn)
+    rows = conn.execute(
+        select(parts.c.id, parts.c.part_manufacturer, parts.c.manufacturer_part_number)
+        .where(parts.c.part_key.is_(None))
+    ).all()
+
+    mappings = [
+        {"b_id": row[0], "b_part_key": make_part_key(row[1], row[2]) or None}
+        for row in rows
+    ]
+    # Keep updated_at as is: it decides which duplicate survives a merge
+    stmt = update(parts).where(parts.c.id == bindparam('b_id')).values(
+        part_key=bindparam('b_part_key'),
+        updated_at=parts.c.updated_at
+    )
+    for start in range(0, len(mappings), BATCH_SIZE):
+        conn.execute(stmt, mappings[start:start + BATCH_SIZE])
+    return len(mappings)
+
+
+def record_deletions(conn: Connection, table_name: str, record_ids: List[int]):
+    """
+    Write tombstones for deleted rows so change feed clients can drop them.
+    """
+    rows = [{"table_name": table_name, "record_id": record_id} for record_id in record_ids]
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(DeletedRecord.__table__.insert(), rows[start:start + BATCH_SIZE])
+
+
+def merge_duplicate_parts(conn: Connection, dry_run: bool = False, record_tombstones: bool = True) -> Dict[str, Any]:
+    """
+    Merge parts sharing the same part_key.
+
+    The most recently updated row survives and inherits any field it is missing
+    from the duplicates. Links of removed rows are re-pointed to the survivor,
+    or dropped when the survivor is already linked to that machine.
+
+    Args:
+        conn: Connection (the caller owns the transaction)
+        dry_run: Only report what would be merged
+        record_tombstones: Write deleted_records rows for removed parts and links
+
+    Returns:
+        Statistics: duplicate_groups, parts_removed, links_repointed, links_dropped
+    """
+    parts = _live_parts_table(conn)
+
+    duplicate_keys = [
+        row[0] for row in conn.execute(
+            select(parts.c.part_key)
+            .where(parts.c.part_key.isnot(None))
+            .group_by(parts.c.part_key)
+            .having(func.count() > 1)
+        ).all()
+    ]
+
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for start in range(0, len(duplicate_keys), BATCH_SIZE):
+        rows = conn.execute(
+            select(parts)
+            .where(parts.c.part_key.in_(duplicate_keys[start:start + BATCH_SIZE]))
+            .order_by(parts.c.part_key, parts.c.updated_at.desc(), parts.c.id.desc())
+        ).mappings().all()
+        for row in rows:
+            groups.setdefault(row['part_key'], []).append(dict(row))
+
+    return _merge_groups(conn, parts, groups, dry_run, record_tombstones)
+
+
+def rekey_parts(conn: Connection, record_tombstones: bool = True) -> Dict[str, Any]:
+    """
+    Recompute part_key for every part after the normalization in part_key.py changed,
+    merging parts whose new keys collide.
+
+    Args:
+        conn: Connection (the caller owns the transaction)
+        record_tombstones: Write deleted_records rows for removed parts and links
+
+    Returns:
+        Statistics: parts_rekeyed plus the merge_duplicate_parts statistics
+    """
+    parts = _live_parts_table(conn)
+    rows = conn.execute(
+        select(parts.c.id, parts.c.part_manufacturer, parts.c.manufacturer_part_number, parts.c.part_key)
+    ).all()
+
+    new_keys: Dict[int, Optional[str]] = {}
+    holders: Dict[str, int] = {}
+    for part_id, manufacturer, part_number, old_key in rows:
+        new_key = make_part_key(manufacturer, part_number) or None
+        if new_key != old_key:
+            new_keys[part_id] = new_key
+        elif old_key is not None:
+            holders[old_key] = part_id
+
+    # Clear the old keys first, so reassigning them doesn't trip unique_part_key
+    changed_ids = list(new_keys)
+    clear = update(parts).where(parts.c.id.in_(bindparam('b_ids', expanding=True))).values(
+        part_key=None, updated_at=parts.c.updated_at
+    )
+    for start in range(0, len(changed_ids), BATCH_SIZE):
+        conn.execute(clear, {"b_ids": changed_ids[start:start + BATCH_SIZE]})
+
+    # Keys claimed by a single part are assigned; the others are merged into one part
+    claims: Dict[str, List[int]] = {}
+    for part_id, new_key in new_keys.items():
+        if new_key is not None:
+            claims.setdefault(new_key, []).append(part_id)
+    assignments = []
+    colliding: Dict[int, str] = {}
+    for new_key, part_ids in claims.items():
+        if len(part_ids) == 1 and new_key not in holders:
+            assignments.append({"b_id": part_ids[0], "b_part_key": new_key})
+            continue
+        for part_id in part_ids + ([holders[new_key]] if new_key in holders else []):
+            colliding[part_id] = new_key
+
+    # Keep updated_at as is: it decides which duplicate survives a merge
+    assign = update(parts).where(parts.c.id == bindparam('b_id')).values(
+        part_key=bindparam('b_part_key'),
+        updated_at=parts.c.updated_at
+    )
+    for start in range(0, len(assignments), BATCH_SIZE):
+        conn.execute(assign, assignments[start:start + BATCH_SIZE])
+
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    colliding_ids = list(colliding)
+    for start in range(0, len(colliding_ids), BATCH_SIZE):
+        for row in conn.execute(
+            select(parts).where(parts.c.id.in_(colliding_ids[start:start + BATCH_SIZE]))
+        ).mappings().all():
+            groups.setdefault(colliding[row['id']], []).append(dict(row))
+    # Most recently updated first, as merge_duplicate_parts orders them
+    for group in groups.values():
+        group.sort(key=lambda row: (row['updated_at'] is not None, row['updated_at'] or 0, row['id']), reverse=True)
+
+    stats = _merge_groups(conn, parts, groups, False, record_tombstones)
+    stats["parts_rekeyed"] = len(new_keys)
+    return stats
+
+
+def _merge_groups(
+    conn: Connection,
+    parts: Table,
+    groups: Dict[str, List[Dict[str, Any]]],
+    dry_run: bool,
+    record_tombstones: bool
+) -> Dict[str, Any]:
+    """
+    Merge each group of parts into its first row, which ends up with the group's key.
+    Groups list their rows most recently updated first.
+    """
+    links = MachinePart.__table__
+    stats = {"duplicate_groups": 0, "parts_removed": 0, "links_repointed": 0, "links_dropped": 0}
+    if not groups:
+        return stats
+
+    survivor_updates = []
+    removed_to_survivor: Dict[int, int] = {}
+    for part_key, group in groups.items():
+        survivor, duplicates = group[0], group[1:]
+        stats["duplicate_groups"] += 1
+
+        fills = {}
+        for column, value in survivor.items():
+            if column in _IDENTITY_COLUMNS or value not in (None, ''):
+                continue
+            for duplicate in duplicates:
+                if duplicate.get(column) not in (None, ''):
+                    fills[column] = duplicate[column]
+                    break
+        if fills and 'content_hash' in parts.c:
+            fills['content_hash'] = None
+        if survivor['part_key'] != part_key:
+            fills['part_key'] = part_key
+        if fills:
+            survivor_updates.append((survivor['id'], fills))
+
+        for duplicate in duplicates:
+            removed_to_survivor[duplicate['id']] = survivor['id']
+
+    # Re-point or drop the links of removed parts
+    involved_ids = list(removed_to_survivor.keys()) + list(set(removed_to_survivor.values()))
+    linked_machines: Dict[int, set] = {}
+    link_rows = []
+    for start in range(0, len(involved_ids), BATCH_SIZE):
+        link_rows.extend(conn.execute(
+            select(links.c.id, links.c.machine_id, links.c.part_id)
+            .where(links.c.part_id.in_(involved_ids[start:start + BATCH_SIZE]))
+            .order_by(links.c.id)
+        ).all())
+    for link_id, machine_id, part_id in link_rows:
+        if part_id not in removed_to_survivor:
+            linked_machines.setdefault(part_id, set()).add(machine_id)
+
+    repoints = []
+    dropped_link_ids = []
+    for link_id, machine_id, part_id in link_rows:
+        survivor_id = removed_to_survivor.get(part_id)
+        if survivor_id is None:
+            continue
+        survivor_machines = linked_machines.setdefault(survivor_id, set())
+        if machine_id in survivor_machines:
+            dropped_link_ids.append(link_id)
+        else:
+            survivor_machines.add(machine_id)
+            repoints.append({"b_id": link_id, "b_part_id": survivor_id})
+
+    stats["parts_removed"] = len(removed_to_survivor)
+    stats["links_repointed"] = len(repoints)
+    stats["links_dropped"] = len(dropped_link_ids)
+    if dry_run:
+        return stats
+
+    if repoints:
+        stmt = update(links).where(links.c.id == bindparam('b_id')).values(part_id=bindparam('b_part_id'))
+        for start in range(0, len(repoints), BATCH_SIZE):
+            conn.execute(stmt, repoints[start:start + BATCH_SIZE])
+
+    for start in range(0, len(dropped_link_ids), BATCH_SIZE):
+        conn.execute(delete(links).where(links.c.id.in_(dropped_link_ids[start:start + BATCH_SIZE])))
+
+    removed_ids = list(removed_to_survivor.keys())
+    for start in range(0, len(removed_ids), BATCH_SIZE):
+        conn.execute(delete(parts).where(parts.c.id.in_(removed_ids[start:start + BATCH_SIZE])))
+
+    # After the removed rows are gone, since the survivor may take over their key
+    for survivor_id, fills in survivor_updates:
+        conn.execute(
+            update(parts).where(parts.c.id == survivor_id).values(updated_at=func.current_timestamp(), **fills)
+        )
+
+    if record_tombstones:
+        record_deletions(conn, 'machine_parts', dropped_link_ids)
+        record_deletions(conn, 'parts', removed_ids)
+
+    return stats
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from database import db_config
+
+    dry_run = '--dry-run' in sys.argv
+    if not db_config.init_db():
+        print("Database not available.")
+        sys.exit(1)
+
+    with db_config.engine.connect() as conn:
+        backfilled = backfill_part_keys(conn)
+        result = merge_duplicate_parts(conn, dry_run=dry_run)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+
+    print(f"Part keys backfilled: {backfilled}")
+    print(f"Duplicate groups: {result['duplicate_groups']}")
+    print(f"Parts {'to remove' if dry_run else 'removed'}: {result['parts_removed']}")
+    print(f"Links {'to re-point' if dry_run else 're-pointed'}: {result['links_repointed']}")
+    print(f"Links {'to drop' if dry_run else 'dropped'}: {result['links_dropped']}")
@@ -0,0 +1,158 @@
+"""
+Versioned Schema Migrations
+The applied version is stored in a single row of the schema_version table.
+Startup reads that row once and skips all DDL when the schema is current.
+
+To change the schema, update models.py and append a migration to MIGRATIONS.
+Migrations after the initial one must be idempotent (use the *_if_missing helpers),
+because a fresh database gets the full current schema from migration 1.
+Data migrations must not query through the models of tables that later migrations
+alter, since the models describe the latest schema; reflect the live table instead.
+"""
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+
+def _migration_initial_schema(conn: Connection):
+    """Create all tables from the models (no-op for tables that already exist)."""
+    from .models import Base
+    Base.metadata.create_all(bind=conn)
+
+
+def _migration_part_key(conn: Connection):
+    """Add the normalized part key, merge existing duplicates, then enforce uniqueness."""
+    from .dedup_parts import backfill_part_keys, merge_duplicate_parts
+    add_column_if_missing(conn, 'parts', 'part_key', 'VARCHAR(512) NULL')
+    backfill_part_keys(conn)
+    # deleted_records doesn't exist yet at this version
+    stats = merge_duplicate_parts(conn, record_tombstones=False)
+    if stats["parts_removed"]:
+        print(f"  Merged {stats['parts_removed']} duplicate parts into {stats['duplicate_groups']} rows")
+    create_index_if_missing(conn, 'unique_part_key', 'parts', ['part_key'], unique=True)
+
+
+def _migration_change_feed(conn: Connection):
+    """Index updated_at for the change feed and add the deleted_records tombstone table."""
+    from .models import DeletedRecord
+    create_index_if_missing(conn, 'idx_parts_updated_at', 'parts', ['updated_at'])
+    create_index_if_missing(conn, 'idx_machines_updated_at', 'machines', ['updated_at'])
+    create_index_if_missing(conn, 'idx_machine_parts_updated_at', 'machine_parts', ['updated_at'])
+    DeletedRecord.__table__.create(bind=conn, checkfirst=True)
+
+
+def _migration_content_hash(conn: Connection):
+    """Add the content hash used to skip unchanged rows on save (filled on the next save)."""
+    add_column_if_missing(conn, 'parts', 'content_hash', 'VARCHAR(40) NULL')
+
+
+def _migration_unicode_part_key(conn: Connection):
+    """Recompute part keys with Unicode-aware normalization and merge parts that now collide."""
+    from .dedup_parts import rekey_parts
+    if conn.dialect.name in ('mysql', 'mariadb'):
+        # Keys now differ by accents, which utf8mb4_unicode_ci would treat as equal
+        conn.execute(text("ALTER TABLE parts MODIFY part_key VARCHAR(512) COLLATE utf8mb4_bin NULL"))
+    stats = rekey_parts(conn)
+    if stats["parts_removed"]:
+        print(f"  Merged {stats['parts_removed']} duplicate parts into {stats['duplicate_groups']} rows")
+
+
+# Ordered list of (version, description, migration function)
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Initial schema", _migration_initial_schema),
+    (2, "Normalized part key", _migration_part_key),
+    (3, "Change feed indexes and tombstones", _migration_change_feed),
+    (4, "Part content hash", _migration_content_hash),
+    (5, "Unicode-aware part keys", _migration_unicode_part_key),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def add_column_if_missing(conn: Connection, table_name: str, column_name: str, column_ddl: str):
+    """
+    Add a column unless it already exists.
+
+    Args:
+        conn: Connection inside the migration transaction
+        table_name: Table to alter
+        column_name: Column name
+        column_ddl: Column type and options, e.g. "VARCHAR(255) NULL"
+    """
+    existing = {column['name'] for column in inspect(conn).get_columns(table_name)}
+    if column_name not in existing:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}"))
+
+
+def create_index_if_missing(conn: Connection, index_name: str, table_name: str, columns: List[str], unique: bool = False):
+    """
+    Create an index unless one with the same name already exists.
+    """
+    existing = {index['name'] for index in inspect(conn).get_indexes(table_name)}
+    existing.update(
+        constraint['name'] for constraint in inspect(conn).get_unique_constraints(table_name)
+    )
+    if index_name not in existing:
+        unique_sql = "UNIQUE " if unique else ""
+        conn.execute(text(
+            f"CREATE {unique_sql}INDEX {index_name} ON {table_name} ({', '.join(columns)})"
+        ))
+
+
+def get_schema_version(conn: Connection) -> Optional[int]:
+    """
+    Read the applied schema version.
+
+    Returns:
+        Version number, or None if the schema_version table doesn't exist yet
+    """
+    try:
+        return conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar() or 0
+    except SQLAlchemyError:
+        conn.rollback()
+        return None
+
+
+def _set_schema_version(conn: Connection, version: int):
+    updated = conn.execute(
+        text("UPDATE schema_version SET version = :version WHERE id = 1"),
+        {"version": version}
+    ).rowcount
+    if not updated:
+        conn.execute(
+            text("INSERT INTO schema_version (id, version) VALUES (1, :version)"),
+            {"version": version}
+        )
+
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Bring the database schema up to LATEST_VERSION.
+    Does a single version read and no DDL when the schema is already current.
+
+    Args:
+        engine: Database engine
+
+    Returns:
+        The schema version after migrating
+    """
+    with engine.connect() as conn:
+        current_version = get_schema_version(conn)
+
+    if current_version is not None and current_version >= LATEST_VERSION:
+        return current_version
+
+    current_version = current_version or 0
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        print(f"Applying schema migration {version}: {description}...")
+        with engine.begin() as conn:
+            migrate(conn)
+            _set_schema_version(conn, version)
+        current_version = version
+
+    print(f"[OK] Database schema is at version {current_version}")
+    return current_version
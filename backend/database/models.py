@@ -9,12 +9,29 @@ from sqlalchemy.sql import func
 Base = declarative_base()
 
 
+def CaseInsensitiveString(length: int):
+    """
+    String type that compares case-insensitively on every backend.
+    MySQL tables use utf8mb4_unicode_ci; SQLite gets the NOCASE collation so
+    unique keys and lookups behave the same.
+    """
+    return String(length).with_variant(String(length, collation='NOCASE'), 'sqlite')
+
+
+def BinaryString(length: int):
+    """
+    String type compared byte for byte on MySQL, for values that are already
+    normalized (utf8mb4_unicode_ci would equate "MÜLLER" and "MULLER").
+    """
+    return String(length).with_variant(String(length, collation='utf8mb4_bin'), 'mysql', 'mariadb')
+
+
 class Machine(Base):
     """Machine/Equipment Model"""
     __tablename__ = 'machines'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    equipment_id = Column(String(255), nullable=False, unique=True, comment='Unique equipment identifier')
+    equipment_id = Column(CaseInsensitiveString(255), nullable=False, unique=True, comment='Unique equipment identifier')
     equipment_alias = Column(String(255), comment='Equipment alias/name')
     machine_description = Column(Text, comment='Machine description')
     plant = Column(String(255), comment='Plant location')
@@ -26,6 +43,10 @@ class Machine(Base):
     # Relationship: Many-to-Many with Parts
     parts = relationship('Part', secondary='machine_parts', back_populates='machines', lazy='dynamic')
 
+    __table_args__ = (
+        Index('idx_machines_updated_at', 'updated_at'),
+    )
+
     def __repr__(self):
         return f"<Machine(equipment_id='{self.equipment_id}', alias='{self.equipment_alias}')>"
 
@@ -36,8 +57,10 @@ class Part(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     # Basic Part Information
-    part_manufacturer = Column(String(255), nullable=False, comment='Part manufacturer name')
-    manufacturer_part_number = Column(String(255), nullable=False, comment='Manufacturer part number')
+    part_manufacturer = Column(CaseInsensitiveString(255), nullable=False, comment='Part manufacturer name')
+    manufacturer_part_number = Column(CaseInsensitiveString(255), nullable=False, comment='Manufacturer part number')
+    part_key = Column(BinaryString(512), comment='Normalized manufacturer|part number key (see part_key.py)')
+    content_hash = Column(String(40), comment='Hash of the saved content fields (see content_hash.py)')
     part_description = Column(Text, comment='Part description')
     part_number_ai_modified = Column(String(255), comment='AI modified part number')
     qty_on_machine = Column(DECIMAL(10, 2), default=0, comment='Quantity on machine')
@@ -88,9 +111,11 @@ class Part(Base):
     # Unique constraint on manufacturer + part number
     __table_args__ = (
         UniqueConstraint('part_manufacturer', 'manufacturer_part_number', name='unique_part'),
+        UniqueConstraint('part_key', name='unique_part_key'),
         Index('idx_manufacturer', 'part_manufacturer'),
         Index('idx_part_number', 'manufacturer_part_number'),
         Index('idx_ai_status', 'ai_status'),
+        Index('idx_parts_updated_at', 'updated_at'),
     )
 
     def __repr__(self):
@@ -120,6 +145,7 @@ class MachinePart(Base):
         UniqueConstraint('machine_id', 'part_id', name='unique_machine_part'),
         Index('idx_machine_id', 'machine_id'),
         Index('idx_part_id', 'part_id'),
+        Index('idx_machine_parts_updated_at', 'updated_at'),
     )
 
     def __repr__(self):
@@ -162,3 +188,31 @@ class AnalysisLog(Base):
     def __repr__(self):
         return f"<AnalysisLog(id={self.id}, type='{self.analysis_type}', status='{self.status}', products={self.products_count})>"
 
+
+class DeletedRecord(Base):
+    """Tombstone Model - Records deleted rows for the incremental change feed"""
+    __tablename__ = 'deleted_records'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(64), nullable=False, comment='Table the row was deleted from: parts, machines, machine_parts')
+    record_id = Column(Integer, nullable=False, comment='Primary key of the deleted row')
+    deleted_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+    __table_args__ = (
+        Index('idx_deleted_at', 'deleted_at'),
+    )
+
+    def __repr__(self):
+        return f"<DeletedRecord(table='{self.table_name}', record_id={self.record_id})>"
+
+
+class SchemaVersion(Base):
+    """Schema Version Model - Single row holding the applied migration version"""
+    __tablename__ = 'schema_version'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0, comment='Applied schema migration version')
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+    def __repr__(self):
+        return f"<SchemaVersion(version={self.version})>"
@@ -0,0 +1,72 @@
+"""
+Normalized Part Key
+Formatting variants of the same part (" 45136 ", "045136", "Allen Bradley" vs "ALLEN-BRADLEY")
+map to one persisted parts.part_key, which carries a unique index.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, Optional
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _fold(value: Any) -> str:
+    """
+    Compatibility-normalize (NFKC: full-width forms, ligatures) and case-fold a value.
+    The result is uppercased so keys of ASCII parts keep their stored form.
+    """
+    return unicodedata.normalize('NFKC', str(value)).casefold().upper()
+
+
+def normalize_manufacturer(manufacturer: Optional[str]) -> str:
+    """
+    Normalize a manufacturer name: case-folded, keeping only letters, digits and
+    combining marks of any script.
+    "Allen Bradley", "ALLEN-BRADLEY" and "allen  bradley" all become "ALLENBRADLEY";
+    "Müller" becomes "MÜLLER" and "オムロン" stays "オムロン".
+    """
+    if not manufacturer:
+        return ''
+    return ''.join(
+        char for char in _fold(manufacturer)
+        if char.isalnum() or unicodedata.category(char).startswith('M')
+    )
+
+
+def normalize_part_number(part_number: Optional[str]) -> str:
+    """
+    Normalize a manufacturer part number: case-folded without whitespace, and without
+    leading zeros when the part number is purely numeric ("045136" -> "45136").
+    Hyphens and dots are kept because they are significant in many catalogs.
+    """
+    if not part_number:
+        return ''
+    normalized = _WHITESPACE.sub('', _fold(part_number))
+    if normalized.isdigit():
+        normalized = normalized.lstrip('0') or '0'
+    return normalized
+
+
+def make_part_key(manufacturer: Optional[str], part_number: Optional[str]) -> str:
+    """
+    Build the normalized part key stored in parts.part_key.
+
+    Returns:
+        "<MANUFACTURER>|<PART NUMBER>", or '' when either side is empty
+    """
+    normalized_manufacturer = normalize_manufacturer(manufacturer)
+    normalized_part_number = normalize_part_number(part_number)
+    if not normalized_manufacturer or not normalized_part_number:
+        return ''
+    return f"{normalized_manufacturer}|{normalized_part_number}"
+
+
+def product_part_key(product: Dict[str, Any]) -> str:
+    """
+    Build the part key for a product/result dictionary, accepting both the
+    spreadsheet field names and the short ones used by the analysis results.
+    """
+    manufacturer = product.get('part_manufacturer') or product.get('manufacturer', '')
+    part_number = product.get('manufacturer_part_number') or product.get('part_number', '')
+    return make_part_key(manufacturer, part_number)
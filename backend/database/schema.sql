@@ -1,5 +1,8 @@
 -- MySQL Database Schema for Lifecycle Checker
 -- Machines and Parts with Many-to-Many Relationship
+--
+-- Reference only: the application creates and upgrades the schema itself through the
+-- versioned migrations in database/migrations.py (applied version in schema_version).
 
 -- Create database (uncomment if needed)
 -- CREATE DATABASE IF NOT EXISTS lifecycle_checker CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
@@ -18,7 +21,8 @@ CREATE TABLE IF NOT EXISTS machines (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_equipment_id (equipment_id),
-    INDEX idx_plant (plant)
+    INDEX idx_plant (plant),
+    INDEX idx_machines_updated_at (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Parts Table
@@ -27,6 +31,8 @@ CREATE TABLE IF NOT EXISTS parts (
     id INT AUTO_INCREMENT PRIMARY KEY,
     part_manufacturer VARCHAR(255) NOT NULL COMMENT 'Part manufacturer name',
     manufacturer_part_number VARCHAR(255) NOT NULL COMMENT 'Manufacturer part number',
+    part_key VARCHAR(512) COLLATE utf8mb4_bin COMMENT 'Normalized manufacturer|part number key (see part_key.py)',
+    content_hash VARCHAR(40) COMMENT 'Hash of the saved content fields (see content_hash.py)',
     part_description TEXT COMMENT 'Part description',
     part_number_ai_modified VARCHAR(255) COMMENT 'AI modified part number',
     qty_on_machine DECIMAL(10, 2) DEFAULT 0 COMMENT 'Quantity on machine',
@@ -67,9 +73,11 @@ CREATE TABLE IF NOT EXISTS parts (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     -- Unique constraint on manufacturer + part number combination
     UNIQUE KEY unique_part (part_manufacturer, manufacturer_part_number),
+    UNIQUE KEY unique_part_key (part_key),
     INDEX idx_manufacturer (part_manufacturer),
     INDEX idx_part_number (manufacturer_part_number),
-    INDEX idx_ai_status (ai_status)
+    INDEX idx_ai_status (ai_status),
+    INDEX idx_parts_updated_at (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Machine Parts Junction Table
@@ -90,7 +98,8 @@ CREATE TABLE IF NOT EXISTS machine_parts (
     -- Unique constraint: one part can only be associated once per machine
     UNIQUE KEY unique_machine_part (machine_id, part_id),
     INDEX idx_machine_id (machine_id),
-    INDEX idx_part_id (part_id)
+    INDEX idx_part_id (part_id),
+    INDEX idx_machine_parts_updated_at (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Analysis Logs Table
@@ -115,3 +124,20 @@ CREATE TABLE IF NOT EXISTS analysis_logs (
     INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Deleted Records Table
+-- Tombstones of deleted parts, machines and links for GET /api/parts/changes
+CREATE TABLE IF NOT EXISTS deleted_records (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(64) NOT NULL COMMENT 'Table the row was deleted from: parts, machines, machine_parts',
+    record_id INT NOT NULL COMMENT 'Primary key of the deleted row',
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_deleted_at (deleted_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Schema Version Table
+-- Single row (id = 1) holding the applied migration version
+CREATE TABLE IF NOT EXISTS schema_version (
+    id INT PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0 COMMENT 'Applied schema migration version',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
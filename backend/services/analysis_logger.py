@@ -1,13 +1,39 @@
 """
-Analysis Logger - Log analysis results to .txt files
+Analysis Logger - Debug log and structured run logs written by a background thread
 Works in both development and when packaged as .exe
+
+Request threads only put records on a queue; formatting and file writes happen on
+the writer thread, so logging never blocks analysis on disk.
 """
+import atexit
+import gzip
+import logging
+import logging.handlers
 import os
+import queue
+import shutil
 import sys
-import json
+import threading
+import time
+import uuid
 from datetime import datetime
-from typing import List, Dict, Any
-import logging
+from typing import List, Dict, Any, Optional
+
+from services.json_service import dumps
+from services.tracing_service import record_stage
+from services.run_history import RunHistory, RUN_LOG_MAX_BYTES
+
+
+# Debug log level (DEBUG, INFO, WARNING, ERROR); messages below it are never formatted
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+# debug.log is rotated at this size, keeping this many gzip-compressed backups
+DEBUG_LOG_MAX_BYTES = int(os.getenv('DEBUG_LOG_MAX_BYTES', 10 * 1024 * 1024))
+DEBUG_LOG_BACKUPS = int(os.getenv('DEBUG_LOG_BACKUPS', 5))
+
+# Structured run log: one JSON record per line for every analysis run
+# (rotated and indexed by services/run_history.py)
+RUN_LOG_FILENAME = 'runs.jsonl'
 
 
 def get_log_directory() -> str:
@@ -39,35 +65,109 @@ def setup_debug_logger() -> logging.Logger:
     """
     Setup a file-based logger for debug information.
     This is useful when running in Electron where console output is not visible.
+    Records are handed to a queue and written to debug.log by a listener thread.
     
     Returns:
         Configured logger instance
     """
+    global _debug_listener
+    
     log_dir = get_log_directory()
     log_file = os.path.join(log_dir, 'debug.log')
     
     # Create logger
     logger = logging.getLogger('azure_ai_debug')
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    logger.propagate = False
     
     # Remove existing handlers to avoid duplicates
     logger.handlers = []
-    
-    # Create file handler
-    file_handler = logging.FileHandler(log_file, encoding='utf-8', mode='a')
-    file_handler.setLevel(logging.DEBUG)
+    _stop_debug_listener()
     
     # Create formatter
     formatter = logging.Formatter(
         '%(asctime)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
+    _debug_listener = attach_background_file_handler(logger, log_file, formatter)
+    
+    return logger
+
+
+def attach_background_file_handler(
+    logger: logging.Logger,
+    log_file: str,
+    formatter: logging.Formatter
+) -> logging.handlers.QueueListener:
+    """
+    Send a logger's records through a queue to a rotating, gzip-compressing file
+    handler run by a listener thread; messages are formatted on that thread.
+    
+    Returns:
+        The started listener (stop it to write out queued records)
+    """
+    # Create rotating file handler (used only by the listener thread)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, encoding='utf-8', mode='a', maxBytes=DEBUG_LOG_MAX_BYTES, backupCount=DEBUG_LOG_BACKUPS
+    )
+    file_handler.namer = lambda name: name + '.gz'
+    file_handler.rotator = _gzip_rotator
     file_handler.setFormatter(formatter)
     
-    # Add handler to logger
-    logger.addHandler(file_handler)
+    # Add queue handler to logger
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    return listener
+
+
+def _gzip_rotator(source: str, dest: str):
+    # Compress a rotated log file into its backup name
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _stop_debug_listener():
+    # Write out queued debug records (on shutdown or when the logger is set up again)
+    global _debug_listener
+    if _debug_listener is not None:
+        _debug_listener.stop()
+        _debug_listener = None
+
+
+class _BraceMessage:
+    """
+    Message formatted with str.format only when the record is written.
+    """
+    
+    __slots__ = ('message', 'args', 'kwargs')
     
-    return logger
+    def __init__(self, message: str, args: tuple, kwargs: dict):
+        self.message = message
+        self.args = args
+        self.kwargs = kwargs
+    
+    def __str__(self) -> str:
+        try:
+            return self.message.format(*self.args, **self.kwargs)
+        except Exception as e:
+            return f"{self.message} (format failed: {e})"
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread
+    (the standard QueueHandler formats the message in the calling thread).
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_debug_logger: Optional[logging.Logger] = None
+_debug_listener: Optional[logging.handlers.QueueListener] = None
 
 
 def get_debug_logger() -> logging.Logger:
@@ -77,30 +177,38 @@ def get_debug_logger() -> logging.Logger:
     Returns:
         Logger instance
     """
-    logger = logging.getLogger('azure_ai_debug')
-    if not logger.handlers:
-        logger = setup_debug_logger()
-    return logger
+    global _debug_logger
+    if _debug_logger is None or not _debug_logger.handlers:
+        logger = logging.getLogger('azure_ai_debug')
+        if not logger.handlers:
+            logger = setup_debug_logger()
+        _debug_logger = logger
+    return _debug_logger
+
+
+def _log(level: int, message: str, args: tuple, kwargs: dict):
+    try:
+        logger = get_debug_logger()
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, _BraceMessage(message, args, kwargs) if args or kwargs else message)
+    except Exception as e:
+        # Fallback to print if logging fails
+        print(f"Failed to log message: {e}")
 
 
 def log_debug(message: str, *args, **kwargs):
     """
     Log a debug message to file.
+    Arguments are formatted into the message ({} placeholders) only if DEBUG is enabled,
+    on the writer thread.
     
     Args:
         message: Debug message
         *args: Additional arguments for formatting
         **kwargs: Additional keyword arguments
     """
-    try:
-        logger = get_debug_logger()
-        if args or kwargs:
-            logger.debug(message.format(*args, **kwargs))
-        else:
-            logger.debug(message)
-    except Exception as e:
-        # Fallback to print if logging fails
-        print(f"Failed to log debug message: {e}")
+    _log(logging.DEBUG, message, args, kwargs)
 
 
 def log_info(message: str, *args, **kwargs):
@@ -112,15 +220,7 @@ def log_info(message: str, *args, **kwargs):
         *args: Additional arguments for formatting
         **kwargs: Additional keyword arguments
     """
-    try:
-        logger = get_debug_logger()
-        if args or kwargs:
-            logger.info(message.format(*args, **kwargs))
-        else:
-            logger.info(message)
-    except Exception as e:
-        # Fallback to print if logging fails
-        print(f"Failed to log info message: {e}")
+    _log(logging.INFO, message, args, kwargs)
 
 
 def log_error(message: str, *args, **kwargs):
@@ -132,317 +232,189 @@ def log_error(message: str, *args, **kwargs):
         *args: Additional arguments for formatting
         **kwargs: Additional keyword arguments
     """
-    try:
-        logger = get_debug_logger()
-        if args or kwargs:
-            logger.error(message.format(*args, **kwargs))
-        else:
-            logger.error(message)
-    except Exception as e:
-        # Fallback to print if logging fails
-        print(f"Failed to log error message: {e}")
+    _log(logging.ERROR, message, args, kwargs)
 
 
-def format_analysis_result(result: Dict[str, Any], is_replacement: bool = False) -> str:
+class RunLogWriter:
     """
-    Format a single analysis result for text output.
-    
-    Args:
-        result: Analysis result dictionary
-        is_replacement: Whether this is a replacement finding result
-        
-    Returns:
-        Formatted string representation
+    Background writer appending run records to logs/runs.jsonl.
+    The file stays open; records are serialized and flushed in batches, indexed in
+    the run history, and the file is rotated once it passes RUN_LOG_MAX_BYTES.
     """
-    lines = []
-    lines.append("=" * 80)
     
-    if is_replacement:
-        # Replacement finding format
-        obsolete_part = result.get('obsolete_part_number', 'N/A')
-        manufacturer = result.get('manufacturer', 'N/A')
-        lines.append(f"Obsolete Part Number: {obsolete_part}")
-        lines.append(f"Manufacturer: {manufacturer}")
-        
-        # Replacement information
-        replacement = result.get('recommended_replacement', '')
-        replacement_manufacturer = result.get('replacement_manufacturer', '')
-        if replacement:
-            lines.append(f"\nRecommended Replacement: {replacement}")
-        if replacement_manufacturer:
-            lines.append(f"Replacement Manufacturer: {replacement_manufacturer}")
-        
-        # Price information
-        price = result.get('price')
-        if price is not None:
-            currency = result.get('currency', 'USD')
-            lines.append(f"Price: {price} {currency}")
-        
-        # Source information
-        source_type = result.get('source_type', '')
-        source_url = result.get('source_url', '')
-        if source_type:
-            lines.append(f"Source Type: {source_type}")
-        if source_url:
-            lines.append(f"Source URL: {source_url}")
-        
-        # Confidence
-        confidence = result.get('confidence', 'N/A')
-        if confidence:
-            lines.append(f"Confidence: {confidence}")
-        
-        # Notes
-        notes = result.get('notes', '')
-        if notes:
-            lines.append(f"\nNotes:")
-            # Wrap long notes
-            words = notes.split()
-            current_line = ""
-            for word in words:
-                if len(current_line) + len(word) + 1 > 78:
-                    if current_line:
-                        lines.append(f"  {current_line}")
-                    current_line = word
-                else:
-                    current_line = f"{current_line} {word}" if current_line else word
-            if current_line:
-                lines.append(f"  {current_line}")
-    else:
-        # Standard analysis format
-        manufacturer = result.get('manufacturer', 'N/A')
-        part_number = result.get('part_number', 'N/A')
-        lines.append(f"Manufacturer: {manufacturer}")
-        lines.append(f"Part Number: {part_number}")
-        
-        # AI Status
-        ai_status = result.get('ai_status', 'N/A')
-        lines.append(f"Status: {ai_status}")
-        
-        # AI Confidence
-        ai_confidence = result.get('ai_confidence', 'N/A')
-        if ai_confidence:
-            lines.append(f"Confidence: {ai_confidence}")
-        
-        # Notes
-        notes = result.get('notes_by_ai', '')
-        if notes:
-            lines.append(f"\nNotes:")
-            # Wrap long notes
-            words = notes.split()
-            current_line = ""
-            for word in words:
-                if len(current_line) + len(word) + 1 > 78:
-                    if current_line:
-                        lines.append(f"  {current_line}")
-                    current_line = word
-                else:
-                    current_line = f"{current_line} {word}" if current_line else word
-            if current_line:
-                lines.append(f"  {current_line}")
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._pending = 0
+        self._file = None
     
-    lines.append("")
-    return "\n".join(lines)
-
-
-def log_analysis_results(
-    results: List[Dict[str, Any]],
-    analysis_type: str = "analysis",
-    total_analyzed: int = 0,
-    total_skipped: int = 0
-) -> str:
-    """
-    Log analysis results to a .txt file.
+    def write(self, record: Dict[str, Any]):
+        """
+        Queue a record (never blocks on disk).
+        """
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='run-log-writer', daemon=True)
+                self._worker.start()
+            self._pending += 1
+            self._idle.clear()
+        self._queue.put(record)
     
-    Args:
-        results: List of analysis result dictionaries
-        analysis_type: Type of analysis ("analysis" or "replacements")
-        total_analyzed: Total number of products analyzed
-        total_skipped: Total number of products skipped
-        
-    Returns:
-        Path to the created log file
-    """
-    try:
-        log_dir = get_log_directory()
-        
-        # Create filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{analysis_type}_{timestamp}.txt"
-        log_path = os.path.join(log_dir, filename)
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until every queued record is on disk.
         
-        # Write log file
-        with open(log_path, 'w', encoding='utf-8') as f:
-            # Header
-            f.write("=" * 80 + "\n")
-            f.write(f"Analysis Results Log\n")
-            f.write(f"Analysis Type: {analysis_type.capitalize()}\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 80 + "\n\n")
-            
-            # Summary
-            f.write("SUMMARY\n")
-            f.write("-" * 80 + "\n")
-            f.write(f"Total Products Analyzed: {total_analyzed}\n")
-            f.write(f"Total Products Skipped: {total_skipped}\n")
-            f.write(f"Total Results: {len(results)}\n")
-            f.write("\n" + "=" * 80 + "\n\n")
-            
-            # Results
-            f.write("DETAILED RESULTS\n")
-            f.write("-" * 80 + "\n\n")
-            
-            for idx, result in enumerate(results, 1):
-                f.write(f"Result #{idx}\n")
-                is_replacement = analysis_type == "replacements"
-                f.write(format_analysis_result(result, is_replacement=is_replacement))
-                f.write("\n")
-            
-            # Footer
-            f.write("=" * 80 + "\n")
-            f.write(f"End of Analysis Log\n")
-            f.write(f"Log file: {log_path}\n")
-            f.write("=" * 80 + "\n")
-        
-        return log_path
-        
-    except Exception as e:
-        # Log error but don't crash the application
-        print(f"Error writing analysis log: {e}")
-        import traceback
-        traceback.print_exc()
-        return ""
-
-
-def log_chunk_result(
-    chunk_index: int,
-    chunk_result: Dict[str, Any],
-    chunk_products: List[Dict[str, Any]],
-    analysis_type: str = "analysis",
-    log_file_path: str = None
-) -> str:
-    """
-    Log a single chunk result to a log file (append mode).
-    Logs both success and error cases.
+        Returns:
+            True if the queue drained before the timeout
+        """
+        return self._idle.wait(timeout)
     
-    Args:
-        chunk_index: Index of the chunk (1-based)
-        chunk_result: Result dictionary from chunk processing
-        chunk_products: Original products in this chunk
-        analysis_type: Type of analysis ("analysis" or "replacements")
-        log_file_path: Path to existing log file (if None, creates new one)
-        
-    Returns:
-        Path to the log file
-    """
-    try:
-        if log_file_path is None:
-            log_dir = get_log_directory()
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{analysis_type}_{timestamp}.txt"
-            log_file_path = os.path.join(log_dir, filename)
-            
-            # Create new file with header
-            with open(log_file_path, 'w', encoding='utf-8') as f:
-                f.write("=" * 80 + "\n")
-                f.write(f"Analysis Results Log - Chunk-by-Chunk\n")
-                f.write(f"Analysis Type: {analysis_type.capitalize()}\n")
-                f.write(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write("=" * 80 + "\n\n")
-        
-        # Append chunk result
-        with open(log_file_path, 'a', encoding='utf-8') as f:
-            f.write(f"\n{'=' * 80}\n")
-            f.write(f"CHUNK #{chunk_index} - Processed at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"{'=' * 80}\n\n")
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            # Write whatever else is already waiting before flushing
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
             
-            # Log chunk info
-            f.write(f"Products in chunk: {len(chunk_products)}\n")
-            f.write(f"Success: {chunk_result.get('success', False)}\n")
-            
-            # Log error if present
-            if not chunk_result.get('success', False):
-                error_msg = chunk_result.get('error', 'Unknown error')
-                f.write(f"ERROR: {error_msg}\n\n")
-                
-                # Log the products that failed
-                f.write("Products that failed:\n")
-                for idx, product in enumerate(chunk_products, 1):
-                    manufacturer = product.get('part_manufacturer') or product.get('manufacturer', 'N/A')
-                    part_number = product.get('manufacturer_part_number') or product.get('part_number', 'N/A')
-                    f.write(f"  {idx}. {manufacturer} - {part_number}\n")
-            
-            # Log results if successful
-            if chunk_result.get('success', False) and chunk_result.get('parsed_json'):
-                parsed_json = chunk_result.get('parsed_json', {})
-                results = parsed_json.get('results', [])
+            try:
+                history = get_run_history()
+                if self._file is None:
+                    self._file = open(os.path.join(get_log_directory(), RUN_LOG_FILENAME), 'ab')
+                offset = self._file.tell()
+                lines = [dumps(record) + b'\n' for record in records]
+                self._file.write(b''.join(lines))
+                self._file.flush()
                 
-                f.write(f"\nResults: {len(results)} items\n")
-                f.write("-" * 80 + "\n\n")
+                for record, line in zip(records, lines):
+                    history.add(record, offset, len(line))
+                    offset += len(line)
+                history.save()
                 
-                for idx, result in enumerate(results, 1):
-                    f.write(f"Result #{idx} in Chunk #{chunk_index}\n")
-                    is_replacement = analysis_type == "replacements"
-                    f.write(format_analysis_result(result, is_replacement=is_replacement))
-                    f.write("\n")
+                if offset > RUN_LOG_MAX_BYTES:
+                    self._file.close()
+                    self._file = None
+                    history.rotate()
+            except Exception as e:
+                print(f"Error writing run log: {e}")
+                if self._file is not None:
+                    self._file.close()
+                self._file = None
             
-            f.write(f"\n{'=' * 80}\n")
-        
-        return log_file_path
-        
-    except Exception as e:
-        print(f"Error logging chunk result: {e}")
-        import traceback
-        traceback.print_exc()
-        return log_file_path or ""
-
-
-def log_analysis_results_json(
-    results: List[Dict[str, Any]],
-    analysis_type: str = "analysis",
-    total_analyzed: int = 0,
-    total_skipped: int = 0
-) -> str:
+            with self._lock:
+                self._pending -= len(records)
+                if self._pending == 0:
+                    self._idle.set()
+
+
+run_log_writer = RunLogWriter()
+
+_run_history: Optional[RunHistory] = None
+_run_history_lock = threading.Lock()
+
+
+def get_run_history() -> RunHistory:
     """
-    Log analysis results to a JSON file (for programmatic access).
-    
-    Args:
-        results: List of analysis result dictionaries
-        analysis_type: Type of analysis ("analysis" or "replacements")
-        total_analyzed: Total number of products analyzed
-        total_skipped: Total number of products skipped
-        
-    Returns:
-        Path to the created log file
+    Get the index of logged runs (loaded from logs/runs_index.json on first use).
     """
-    try:
-        log_dir = get_log_directory()
+    global _run_history
+    with _run_history_lock:
+        if _run_history is None:
+            _run_history = RunHistory(get_log_directory(), RUN_LOG_FILENAME)
+        return _run_history
+
+atexit.register(run_log_writer.flush)
+atexit.register(_stop_debug_listener)
+
+
+def _product_identity(product: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "manufacturer": product.get('part_manufacturer') or product.get('manufacturer', 'N/A'),
+        "part_number": product.get('manufacturer_part_number') or product.get('part_number', 'N/A')
+    }
+
+
+class AnalysisRunLog:
+    """
+    Structured log of one analysis or replacement run.
+    Writes a "start" record, one "chunk" record per chunk (with its results) and a
+    "complete" record with the summary, all tagged with the run id.
+    """
+    
+    def __init__(self, analysis_type: str = "analysis", total_products: int = 0):
+        self.analysis_type = analysis_type
+        self.run_id = f"{analysis_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.chunks_logged = 0
+        self.chunks_failed = 0
+        self._started = time.monotonic()
+        self._write("start", total_products=total_products)
+    
+    def _write(self, record_type: str, **fields):
+        started = time.perf_counter()
+        run_log_writer.write({
+            "type": record_type,
+            "run_id": self.run_id,
+            "analysis_type": self.analysis_type,
+            "ts": datetime.now().isoformat(timespec='milliseconds'),
+            **fields
+        })
+        record_stage('log', time.perf_counter() - started)
+    
+    def log_chunk(
+        self,
+        chunk_index: int,
+        chunk_result: Dict[str, Any],
+        chunk_products: List[Dict[str, Any]]
+    ):
+        """
+        Log a single chunk result (success or error).
         
-        # Create filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{analysis_type}_{timestamp}.json"
-        log_path = os.path.join(log_dir, filename)
+        Args:
+            chunk_index: Index of the chunk (1-based)
+            chunk_result: Result dictionary from chunk processing
+            chunk_products: Original products in this chunk
+        """
+        success = bool(chunk_result.get('success', False))
+        parsed_json = chunk_result.get('parsed_json') if success else None
+        results = parsed_json.get('results', []) if isinstance(parsed_json, dict) else []
         
-        # Create log data structure
-        log_data = {
-            "metadata": {
-                "analysis_type": analysis_type,
-                "generated": datetime.now().isoformat(),
-                "total_analyzed": total_analyzed,
-                "total_skipped": total_skipped,
-                "total_results": len(results)
-            },
+        self.chunks_logged += 1
+        fields = {
+            "chunk": chunk_index,
+            "products": len(chunk_products),
+            "success": success,
             "results": results
         }
-        
-        # Write JSON file
-        with open(log_path, 'w', encoding='utf-8') as f:
-            json.dump(log_data, f, indent=2, ensure_ascii=False)
-        
-        return log_path
-        
-    except Exception as e:
-        # Log error but don't crash the application
-        print(f"Error writing analysis JSON log: {e}")
-        import traceback
-        traceback.print_exc()
-        return ""
+        if not success:
+            self.chunks_failed += 1
+            fields["error"] = chunk_result.get('error', 'Unknown error')
+            fields["failed_products"] = [_product_identity(product) for product in chunk_products]
+        self._write("chunk", **fields)
+    
+    def complete(
+        self,
+        total_results: int,
+        total_analyzed: int = 0,
+        total_skipped: int = 0,
+        skipped_results: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        Log the run summary. Results of analyzed products are in the chunk records;
+        results of products skipped from analysis are stored here.
+        """
+        self._write(
+            "complete",
+            total_analyzed=total_analyzed,
+            total_skipped=total_skipped,
+            total_results=total_results,
+            chunks=self.chunks_logged,
+            chunks_failed=self.chunks_failed,
+            duration_seconds=round(time.monotonic() - self._started, 3),
+            skipped_results=skipped_results or []
+        )
+        log_info("Analysis run {} logged to {} ({} results)", self.run_id, RUN_LOG_FILENAME, total_results)
@@ -13,6 +13,16 @@ backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, backend_dir)
 from config import SYSTEM_PROMPT, SYSTEM_PROMPT_FIND_REPLACEMENT
 from services.analysis_logger import log_debug, log_info, log_error
+from services.metrics_service import (
+    LLM_REQUEST_SECONDS, LLM_CHUNK_SECONDS, LLM_CHUNKS_IN_FLIGHT,
+    LLM_CHUNK_RESULTS, LLM_RETRIES, LLM_THROTTLED, LLM_TOKENS, track_in_flight
+)
+from services.chunk_controller import get_chunk_controller
+from services.tracing_service import span
+from services.response_archive import get_response_archive
+
+# Token counters read from the response usage field
+_USAGE_FIELDS = ('input_tokens', 'output_tokens', 'total_tokens')
 
 
 class AzureAIService:
@@ -29,6 +39,25 @@ class AzureAIService:
         agent_name = os.getenv("AZURE_AI_AGENT", "")
         replacement_agent_name = os.getenv("AZURE_AI_REPLACEMENT_AGENT", "")
 
+        self.system_prompt = SYSTEM_PROMPT
+        self.system_prompt_find_replacement = SYSTEM_PROMPT_FIND_REPLACEMENT
+        self.max_retries = 3
+        self.retry_delay = 2  # seconds
+        self.archive = get_response_archive()
+
+        if self.archive.replaying:
+            # Responses come from the archive; agent names only select archive entries
+            if not agent_name:
+                raise RuntimeError("AZURE_AI_AGENT is not set (needed to select archived responses)")
+            log_info("LLM_ARCHIVE_MODE=replay: serving agent responses from {}", self.archive.archive_dir)
+            self.project = None
+            self.openai_client = None
+            self.agent = None
+            self.agent_name = agent_name
+            self.replacement_agent = None
+            self.replacement_agent_name = replacement_agent_name or agent_name
+            return
+
         if not endpoint:
             raise RuntimeError("AZURE_AI_API_ENDPOINT is not set")
         if not agent_name:
@@ -83,7 +112,6 @@ class AzureAIService:
             # Agent identifier configured in env
             self.agent = self.project.agents.get(agent_name=agent_name)
             self.agent_name = agent_name
-            self.system_prompt = SYSTEM_PROMPT
         except Exception as e:
             # If project/client initialization fails, provide helpful error
             error_msg = (
@@ -104,10 +132,6 @@ class AzureAIService:
         else:
             self.replacement_agent = self.agent
             self.replacement_agent_name = agent_name
-        
-        self.system_prompt_find_replacement = SYSTEM_PROMPT_FIND_REPLACEMENT
-        self.max_retries = 3
-        self.retry_delay = 2  # seconds
 
     def _get_assistant_message_text(self, messages) -> Optional[str]:
         """
@@ -204,14 +228,68 @@ class AzureAIService:
         
         return response_text
 
+    def _create_response(self, agent: str, input_messages: List[Dict[str, Any]], extra_body: Dict[str, Any]):
+        """
+        Call the agent, recording call latency and token usage for GET /api/metrics.
+        Responses are archived (LLM_ARCHIVE_MODE=record) or served from the archive
+        (LLM_ARCHIVE_MODE=replay) by agent name and prompt hash.
+        """
+        agent_name = extra_body["agent"]["name"]
+        if self.archive.replaying:
+            with span('llm.request', stage='llm', agent=agent, replayed=True):
+                response = self.archive.replay(agent_name, input_messages)
+        else:
+            with span('llm.request', stage='llm', agent=agent) as request_span:
+                with LLM_REQUEST_SECONDS.time((agent,)):
+                    response = self.openai_client.responses.create(
+                        input=input_messages,
+                        extra_body=extra_body
+                    )
+                if self.archive.recording:
+                    archive_key = self.archive.record(agent_name, input_messages, response)
+                    if request_span is not None:
+                        request_span.set_attribute('llm.archive_key', archive_key)
+                self._record_usage(agent, getattr(response, 'usage', None), request_span)
+        return response
+
+    def _record_usage(self, agent: str, usage: Any, request_span) -> None:
+        """
+        Count the tokens reported in a live response's usage field.
+        """
+        if usage is not None:
+            for field in _USAGE_FIELDS:
+                tokens = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+                if isinstance(tokens, (int, float)):
+                    LLM_TOKENS.inc((agent, field[:-len('_tokens')]), tokens)
+                    if request_span is not None:
+                        request_span.set_attribute(f"llm.usage.{field}", tokens)
+
+    def _report_throttle(self, agent: str, error: Exception) -> bool:
+        """
+        If a failed call was rate limited (429), count it and let the chunk
+        controller lower the concurrency limit.
+        """
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+        message = str(error).lower()
+        if status_code != 429 and '429' not in message and 'rate limit' not in message:
+            return False
+        LLM_THROTTLED.inc((agent,))
+        get_chunk_controller(agent).record_throttle()
+        return True
+
     def _generate_fallback_json(self, products: List[Dict[str, Any]], is_replacement: bool = False) -> Dict[str, Any]:
         """
         Generate a fallback JSON response when no assistant message is found.
         This ensures we always return a deterministic result.
+        The "fallback" flag lets callers tell it apart from a parsed agent response.
         """
+        LLM_CHUNK_RESULTS.inc(('replacement' if is_replacement else 'analysis', 'fallback'))
         if is_replacement:
             from datetime import datetime
             return {
+                "fallback": True,
                 "checked_date": datetime.now().strftime("%Y-%m-%d"),
                 "results": [
                     {
@@ -231,6 +309,7 @@ class AzureAIService:
             }
         else:
             return {
+                "fallback": True,
                 "results": [
                     {
                         "manufacturer": product.get('part_manufacturer') or product.get('manufacturer', ''),
@@ -243,6 +322,8 @@ class AzureAIService:
                 ]
             }
 
+    @track_in_flight(LLM_CHUNKS_IN_FLIGHT, ('analysis',), LLM_CHUNK_SECONDS)
+    @span('llm.chunk', agent='analysis')
     def analyze_product_chunk(self, products: List[Dict[str, Any]], conversation_id: str = None) -> Dict[str, Any]:
         """
         Analyze products using OpenAI client with agent reference.
@@ -270,14 +351,10 @@ class AzureAIService:
                     extra_body["previous_response_id"] = conversation_id
 
                 # Call OpenAI client with agent reference
-                response = self.openai_client.responses.create(
-                    input=input_messages,
-                    extra_body=extra_body
-                )
+                response = self._create_response('analysis', input_messages, extra_body)
 
                 # Debug: Log response object details
                 log_debug("Response object type: {}", type(response))
-                log_debug("Response object attributes: {}", [attr for attr in dir(response) if not attr.startswith('_')])
                 
                 # Try multiple ways to get response text
                 response_text = None
@@ -331,13 +408,8 @@ class AzureAIService:
                     response_text = response_text.strip()
                     log_debug("Final response_text length: {}", len(response_text))
                 else:
-                    log_error("No response text found. Response object: {}", str(response))
-                    # Try to log response as string for debugging
-                    try:
-                        response_str = str(response)[:500]
-                        log_debug("Response str representation: {}", response_str)
-                    except Exception as e:
-                        log_error("Error converting response to string: {}", str(e))
+                    # The response is only converted to a string if the record is written
+                    log_error("No response text found. Response object: {}", response)
 
                 # Get response ID for conversation continuity
                 response_id = getattr(response, 'id', None) or conversation_id
@@ -368,6 +440,7 @@ class AzureAIService:
                         'products_analyzed': len(products)
                     }
 
+                LLM_CHUNK_RESULTS.inc(('analysis', 'parsed'))
                 return {
                     'success': True,
                     'conversation_id': response_id,
@@ -377,12 +450,15 @@ class AzureAIService:
                 }
 
             except Exception as e:
+                self._report_throttle('analysis', e)
                 import traceback
                 error_trace = traceback.format_exc()
                 log_error("Error in analyze_product_chunk (attempt {}): {}", attempt + 1, str(e))
                 log_error("Full traceback:\n{}", error_trace)
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    LLM_RETRIES.inc(('analysis',))
+                    with span('llm.retry_backoff', stage='retry', attempt=attempt + 1):
+                        time.sleep(self.retry_delay)
                     continue
                 # On final attempt failure, return fallback
                 fallback_json = self._generate_fallback_json(products, is_replacement=False)
@@ -405,6 +481,8 @@ class AzureAIService:
             'products_analyzed': len(products)
         }
 
+    @track_in_flight(LLM_CHUNKS_IN_FLIGHT, ('analysis',), LLM_CHUNK_SECONDS)
+    @span('llm.chunk', agent='analysis')
     def analyze_product_chunk_streaming(self, products: List[Dict[str, Any]], conversation_id: str = None) -> Generator[str, None, None]:
         """
         Stream analysis results using OpenAI client with agent reference.
@@ -437,10 +515,7 @@ class AzureAIService:
                     extra_body["previous_response_id"] = conversation_id
 
                 # Call OpenAI client with agent reference
-                response = self.openai_client.responses.create(
-                    input=input_messages,
-                    extra_body=extra_body
-                )
+                response = self._create_response('analysis', input_messages, extra_body)
 
                 # Try multiple ways to get response text (same as analyze_product_chunk)
                 response_text = None
@@ -517,6 +592,7 @@ class AzureAIService:
                     return
 
                 # Success - return parsed JSON
+                LLM_CHUNK_RESULTS.inc(('analysis', 'parsed'))
                 yield json.dumps({
                     'type': 'result',
                     'conversation_id': response_id,
@@ -526,9 +602,12 @@ class AzureAIService:
                 return
 
             except Exception as e:
+                self._report_throttle('analysis', e)
                 print(f"DEBUG: Error in analyze_product_chunk_streaming (attempt {attempt + 1}): {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    LLM_RETRIES.inc(('analysis',))
+                    with span('llm.retry_backoff', stage='retry', attempt=attempt + 1):
+                        time.sleep(self.retry_delay)
                     continue
                 # On final attempt failure, return fallback instead of error
                 fallback_json = self._generate_fallback_json(products, is_replacement=False)
@@ -568,7 +647,7 @@ class AzureAIService:
 
     def _parse_json_from_response(self, response_text: str) -> Dict[str, Any]:
         parsed_json = None
-        print(response_text)
+        log_debug("Agent response text:\n{}", response_text)
         # Strategy 1: JSON code block
         json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', response_text, re.DOTALL)
         if json_match:
@@ -609,6 +688,8 @@ class AzureAIService:
 
         return None
 
+    @track_in_flight(LLM_CHUNKS_IN_FLIGHT, ('replacement',), LLM_CHUNK_SECONDS)
+    @span('llm.chunk', agent='replacement')
     def find_replacement_chunk_streaming(self, products: List[Dict[str, Any]], conversation_id: str = None) -> Generator[str, None, None]:
         """
         Find replacement parts for obsolete products using OpenAI client with agent reference.
@@ -648,10 +729,7 @@ class AzureAIService:
                     extra_body["previous_response_id"] = conversation_id
 
                 # Call OpenAI client with agent reference
-                response = self.openai_client.responses.create(
-                    input=input_messages,
-                    extra_body=extra_body
-                )
+                response = self._create_response('replacement', input_messages, extra_body)
 
                 # Try multiple ways to get response text (same as analyze_product_chunk)
                 response_text = None
@@ -728,6 +806,7 @@ class AzureAIService:
                     return
 
                 # Success - return parsed JSON
+                LLM_CHUNK_RESULTS.inc(('replacement', 'parsed'))
                 yield json.dumps({
                     'type': 'result',
                     'conversation_id': response_id,
@@ -737,9 +816,12 @@ class AzureAIService:
                 return
 
             except Exception as e:
+                self._report_throttle('replacement', e)
                 print(f"DEBUG: Error in find_replacement_chunk_streaming (attempt {attempt + 1}): {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    LLM_RETRIES.inc(('replacement',))
+                    with span('llm.retry_backoff', stage='retry', attempt=attempt + 1):
+                        time.sleep(self.retry_delay)
                     continue
                 # On final attempt failure, return fallback instead of error
                 fallback_json = self._generate_fallback_json(products, is_replacement=True)
@@ -0,0 +1,199 @@
+"""
+Cache Service - In-process caches for database read endpoints
+Entries are invalidated explicitly by the write endpoints (/api/save, /api/parts/update),
+which also bump the data version that stamps cached responses
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, Hashable, Iterable, List, Optional
+
+
+# Data version, bumped by every write endpoint
+_data_version = 0
+_data_version_changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+_data_version_lock = threading.Lock()
+
+
+def get_data_version() -> int:
+    """
+    Get the current data version (changes whenever parts or machines are written).
+    """
+    return _data_version
+
+
+def get_data_version_changed_at() -> datetime:
+    """
+    Get the UTC time of the last data version bump (process start if none yet).
+    """
+    return _data_version_changed_at
+
+
+def bump_data_version() -> int:
+    """
+    Mark all version-stamped cache entries as stale.
+
+    Returns:
+        The new data version
+    """
+    global _data_version, _data_version_changed_at
+
+    with _data_version_lock:
+        _data_version += 1
+        _data_version_changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+        return _data_version
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized JSON responses stamped with the data version.
+    Entries written under an older data version are never served.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Get a cached response entry if it matches the current data version.
+
+        Returns:
+            Dictionary with "body", "etag" and "last_modified", or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["version"] != _data_version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, version: int, body: bytes) -> Dict[str, Any]:
+        """
+        Store a serialized response computed under the given data version.
+        The entry is only kept if no write happened while it was being computed.
+
+        Returns:
+            The response entry (also returned when not stored)
+        """
+        entry = {
+            "version": version,
+            "body": body,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "last_modified": _data_version_changed_at
+        }
+        with self._lock:
+            if version == _data_version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared cache for GET /api/parts and /api/parts/machines*
+response_cache = ResponseCache()
+
+
+# Per-machine summaries keyed by machine id
+_machine_summaries: Dict[int, Dict[str, Any]] = {}
+_machine_summaries_loaded = False
+_dirty_machine_ids = set()
+_machine_summaries_lock = threading.RLock()
+
+
+def get_machine_summaries(
+    loader: Callable[[Optional[List[int]]], Dict[int, Dict[str, Any]]]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Get cached per-machine summaries, loading only what is missing or stale.
+
+    Args:
+        loader: Callable that computes summaries for the given machine ids
+                (None means all machines) and returns {machine_id: summary}
+
+    Returns:
+        Dictionary of machine id to summary (machines without parts are absent)
+    """
+    global _machine_summaries_loaded
+
+    with _machine_summaries_lock:
+        if not _machine_summaries_loaded:
+            _machine_summaries.clear()
+            _machine_summaries.update(loader(None))
+            _machine_summaries_loaded = True
+            _dirty_machine_ids.clear()
+        elif _dirty_machine_ids:
+            dirty_ids = sorted(_dirty_machine_ids)
+            refreshed = loader(dirty_ids)
+            for machine_id in dirty_ids:
+                if machine_id in refreshed:
+                    _machine_summaries[machine_id] = refreshed[machine_id]
+                else:
+                    _machine_summaries.pop(machine_id, None)
+            _dirty_machine_ids.clear()
+
+        return dict(_machine_summaries)
+
+
+def invalidate_machine_summaries(machine_ids: Optional[Iterable[int]] = None):
+    """
+    Mark machine summaries as stale.
+
+    Args:
+        machine_ids: Machine ids to refresh on next read (None invalidates everything)
+    """
+    global _machine_summaries_loaded
+
+    with _machine_summaries_lock:
+        if machine_ids is None:
+            _machine_summaries_loaded = False
+            _dirty_machine_ids.clear()
+            return
+        for machine_id in machine_ids:
+            if machine_id is not None:
+                _dirty_machine_ids.add(int(machine_id))
+
+
+def invalidate_for_parts(session, part_ids: Iterable[int], machine_ids: Optional[Iterable[int]] = None):
+    """
+    Invalidate cached data for every machine linked to the given parts, then bump
+    the data version so cached responses are recomputed.
+    Part-level fields (ai_status, replacement, ...) are shared by all machines using the part.
+
+    Args:
+        session: Database session used to resolve machine links
+        part_ids: Ids of parts that were written
+        machine_ids: Machine ids known to be touched directly (optional)
+    """
+    affected = set(machine_ids or [])
+    part_ids = [part_id for part_id in set(part_ids) if part_id is not None]
+
+    try:
+        if part_ids:
+            try:
+                from database.models import MachinePart
+                rows = session.query(MachinePart.machine_id).filter(
+                    MachinePart.part_id.in_(part_ids)
+                ).distinct().all()
+                affected.update(row[0] for row in rows)
+            except Exception as e:
+                # Fall back to a full refresh rather than serving stale summaries
+                print(f"Warning: Could not resolve machines for invalidation: {e}")
+                invalidate_machine_summaries(None)
+                return
+
+        invalidate_machine_summaries(affected)
+    finally:
+        # Bumped last: a response computed under the new version must not read
+        # summaries that were not yet marked stale
+        bump_data_version()
@@ -0,0 +1,196 @@
+"""
+Chunk Controller - Adapts chunk size and LLM concurrency to observed agent behaviour
+One controller per agent is shared by all runs in the process, since throttling and
+latency are properties of the Azure deployment rather than of a single request.
+
+- Concurrency is AIMD: +1 per round of chunks that finish within the target latency,
+  halved (at most once per cooldown) when the agent throttles with 429s.
+- Chunk size is bounded: it shrinks when the parse-failure rate is high or chunks
+  take longer than CHUNK_TARGET_SECONDS, and grows by one product while both are low.
+- The first chunk of a run is small so the first results come back quickly.
+
+Set ADAPTIVE_CHUNKING=0 to use CHUNK_SIZE_INITIAL and LLM_CONCURRENCY_INITIAL as
+fixed values. LLM_ARCHIVE_MODE=replay implies it: archived responses are looked up by
+prompt hash, so chunk boundaries must not depend on live latency.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from services.metrics_service import LLM_CHUNK_SIZE, LLM_CONCURRENCY_LIMIT, CHUNK_CONTROLLER_DECISIONS
+from services.response_archive import LLM_ARCHIVE_MODE
+
+
+REPLAY_MODE = LLM_ARCHIVE_MODE == 'replay'
+
+ADAPTIVE_CHUNKING = (
+    os.getenv('ADAPTIVE_CHUNKING', '1').strip().lower() not in ('0', 'false', 'no') and not REPLAY_MODE
+)
+
+CHUNK_SIZE_MIN = int(os.getenv('CHUNK_SIZE_MIN', 3))
+CHUNK_SIZE_MAX = int(os.getenv('CHUNK_SIZE_MAX', 25))
+CHUNK_SIZE_INITIAL = int(os.getenv('CHUNK_SIZE_INITIAL', 10))
+FIRST_CHUNK_SIZE = int(os.getenv('FIRST_CHUNK_SIZE', 3))
+
+LLM_CONCURRENCY_MIN = int(os.getenv('LLM_CONCURRENCY_MIN', 1))
+LLM_CONCURRENCY_MAX = int(os.getenv('LLM_CONCURRENCY_MAX', 8))
+LLM_CONCURRENCY_INITIAL = int(os.getenv('LLM_CONCURRENCY_INITIAL', 5))
+
+# Chunks slower than this shrink the chunk size (seconds per agent call)
+CHUNK_TARGET_SECONDS = float(os.getenv('CHUNK_TARGET_SECONDS', 60))
+
+# Chunk size shrinks when more than this share of recent chunks fell back
+FALLBACK_RATE_LIMIT = float(os.getenv('CHUNK_FALLBACK_RATE_LIMIT', 0.2))
+
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = 0.3
+
+# Chunk size multiplier on a high parse-failure rate, concurrency multiplier on throttling
+SHRINK_FACTOR = 0.7
+BACKOFF_FACTOR = 0.5
+
+# Throttles within this many seconds of a decrease are treated as the same episode
+THROTTLE_COOLDOWN_SECONDS = 10.0
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return max(low, min(high, value))
+
+
+class ChunkController:
+    """
+    Chunk size and concurrency limit for one agent.
+    """
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._lock = threading.Lock()
+        self._chunk_size = float(_clamp(CHUNK_SIZE_INITIAL, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX))
+        self._concurrency = float(_clamp(LLM_CONCURRENCY_INITIAL, LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX))
+        self._seconds_per_product: Optional[float] = None
+        self._fallback_rate = 0.0
+        self._last_backoff = 0.0
+        self.version = 0
+        self.last_action = 'initial'
+        if ADAPTIVE_CHUNKING:
+            self.last_reason = 'adaptive'
+        elif REPLAY_MODE:
+            self.last_reason = 'fixed (LLM_ARCHIVE_MODE=replay)'
+        else:
+            self.last_reason = 'fixed (ADAPTIVE_CHUNKING=0)'
+        self._publish()
+
+    @property
+    def chunk_size(self) -> int:
+        return int(round(self._chunk_size))
+
+    @property
+    def concurrency(self) -> int:
+        return int(self._concurrency)
+
+    def first_chunk_size(self) -> int:
+        """
+        Size of a run's first chunk, small so results start streaming quickly.
+        """
+        if not ADAPTIVE_CHUNKING:
+            return self.chunk_size
+        return max(1, min(FIRST_CHUNK_SIZE, self.chunk_size))
+
+    def record_chunk(self, products: int, seconds: float, fallback: bool):
+        """
+        Feed back a finished chunk: its size, agent call duration and whether the
+        response had to be replaced by the fallback result.
+        """
+        if not ADAPTIVE_CHUNKING or products <= 0:
+            return
+        with self._lock:
+            per_product = seconds / products
+            if self._seconds_per_product is None:
+                self._seconds_per_product = per_product
+            else:
+                self._seconds_per_product += EWMA_ALPHA * (per_product - self._seconds_per_product)
+            self._fallback_rate += EWMA_ALPHA * ((1.0 if fallback else 0.0) - self._fallback_rate)
+
+            size_before = self.chunk_size
+            concurrency_before = self.concurrency
+            action = reason = None
+
+            if self._fallback_rate > FALLBACK_RATE_LIMIT:
+                self._chunk_size = _clamp(self._chunk_size * SHRINK_FACTOR, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX)
+                action, reason = 'shrink_chunk', f"parse failure rate {self._fallback_rate:.0%}"
+            elif self._seconds_per_product * self._chunk_size > CHUNK_TARGET_SECONDS:
+                self._chunk_size = _clamp(CHUNK_TARGET_SECONDS / self._seconds_per_product, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX)
+                action, reason = 'shrink_chunk', (f"{self._seconds_per_product:.2f}s per product exceeds the "
+                                                  f"{CHUNK_TARGET_SECONDS:g}s chunk target")
+            elif (self._fallback_rate < FALLBACK_RATE_LIMIT / 2
+                  and self._seconds_per_product * (self._chunk_size + 1) <= CHUNK_TARGET_SECONDS * 0.75):
+                self._chunk_size = _clamp(self._chunk_size + 1, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX)
+                action, reason = 'grow_chunk', 'latency and parse failures are low'
+            if self.chunk_size != size_before:
+                self._decide(action, reason)
+
+            # Additive increase: one more worker per round of on-target chunks
+            if not fallback and seconds <= CHUNK_TARGET_SECONDS:
+                self._concurrency = _clamp(self._concurrency + 1.0 / max(self._concurrency, 1.0),
+                                           LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX)
+                if self.concurrency != concurrency_before:
+                    self._decide('increase_concurrency', 'chunks on target without throttling')
+
+    def record_throttle(self):
+        """
+        Multiplicative decrease of the concurrency limit after a 429 from the agent.
+        """
+        if not ADAPTIVE_CHUNKING:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_backoff < THROTTLE_COOLDOWN_SECONDS:
+                return
+            self._last_backoff = now
+            before = self.concurrency
+            self._concurrency = _clamp(self._concurrency * BACKOFF_FACTOR, LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX)
+            if self.concurrency != before:
+                self._decide('decrease_concurrency', 'agent throttled (429)')
+
+    def _decide(self, action: str, reason: str):
+        self.version += 1
+        self.last_action = action
+        self.last_reason = reason
+        CHUNK_CONTROLLER_DECISIONS.inc((self.agent, action))
+        self._publish()
+
+    def _publish(self):
+        LLM_CHUNK_SIZE.set(self.chunk_size, (self.agent,))
+        LLM_CONCURRENCY_LIMIT.set(self.concurrency, (self.agent,))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current settings and the last decision, as sent in "controller" stream events.
+        """
+        with self._lock:
+            return {
+                "agent": self.agent,
+                "chunk_size": self.chunk_size,
+                "concurrency": self.concurrency,
+                "action": self.last_action,
+                "reason": self.last_reason,
+                "seconds_per_product": round(self._seconds_per_product, 2) if self._seconds_per_product is not None else None,
+                "fallback_rate": round(self._fallback_rate, 3)
+            }
+
+
+_controllers: Dict[str, ChunkController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_chunk_controller(agent: str) -> ChunkController:
+    """
+    Get the process-wide controller for an agent ("analysis" or "replacement").
+    """
+    with _controllers_lock:
+        controller = _controllers.get(agent)
+        if controller is None:
+            controller = ChunkController(agent)
+            _controllers[agent] = controller
+        return controller
@@ -0,0 +1,413 @@
+"""
+Chunk Planner - Criticality-first, token-budget chunking with manufacturer affinity
+Products of a run are deduplicated by normalized part key (identical parts are sent
+to the agent once), ordered by criticality (machine-stopping and likely-to-fail
+parts first, stocked parts ahead within a level), grouped by normalized manufacturer within a criticality level so
+the agent's manufacturer-first lookups are shared within a call, and packed into
+chunks up to a product limit (from the chunk controller) and an estimated token budget.
+Results for a part are fanned back out to its duplicates afterwards.
+
+Chunks are cut on demand, so each one uses the chunk controller's current size, and
+rows a client is viewing can be moved to the front while the run is in progress.
+"""
+import math
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database.part_key import make_part_key, normalize_manufacturer
+
+
+# Estimated prompt + response tokens allowed per agent call
+CHUNK_TOKEN_BUDGET = int(os.getenv('CHUNK_TOKEN_BUDGET', 4000))
+
+# Estimated response tokens per product (status, notes and confidence, or a replacement)
+RESPONSE_TOKENS_PER_PRODUCT = {
+    'analysis': int(os.getenv('CHUNK_RESPONSE_TOKENS_ANALYSIS', 150)),
+    'replacement': int(os.getenv('CHUNK_RESPONSE_TOKENS_REPLACEMENT', 250)),
+}
+
+# Part numbers tokenize densely; about 3 characters per token
+CHARS_PER_TOKEN = 3
+
+# Groups looked ahead to fill a chunk's remaining room before splitting a group
+FILL_LOOKAHEAD = 20
+
+# Criticality weight of each spreadsheet answer counted when it is "yes"
+DEFAULT_CRITICALITY_WEIGHTS = {
+    'will_failure_stop_machine': 3.0,
+    'is_part_likely_to_fail': 2.0,
+}
+
+# Spellings of the criticality fields in saved parts
+_CRITICALITY_ALIASES = {
+    'will_failure_stop_machine': ('will_failure_stop_machine', 'will_failures_stop_machine'),
+}
+
+# Priority of rows a client asked for (above any criticality score)
+BOOSTED_PRIORITY = 1000.0
+
+
+def parse_criticality_weights(spec: str) -> Dict[str, float]:
+    """
+    Parse "field=weight,field=weight" (CRITICALITY_WEIGHTS); unknown fields are ignored.
+    An empty spec keeps the defaults; "none" turns criticality ordering off.
+    """
+    if not spec.strip():
+        return dict(DEFAULT_CRITICALITY_WEIGHTS)
+    if spec.strip().lower() == 'none':
+        return {}
+    weights = {}
+    for item in spec.split(','):
+        field, _, weight = item.partition('=')
+        field = field.strip()
+        if field in DEFAULT_CRITICALITY_WEIGHTS:
+            try:
+                weights[field] = float(weight)
+            except ValueError:
+                continue
+    return weights
+
+
+CRITICALITY_WEIGHTS = parse_criticality_weights(os.getenv('CRITICALITY_WEIGHTS', ''))
+
+
+def criticality(product: Dict[str, Any], weights: Optional[Dict[str, float]] = None) -> float:
+    """
+    Criticality score of a product: the sum of the weights of its "yes" answers.
+    Products scoring above zero are critical.
+    """
+    weights = CRITICALITY_WEIGHTS if weights is None else weights
+    score = 0.0
+    for field, weight in weights.items():
+        value = ''
+        for name in _CRITICALITY_ALIASES.get(field, (field,)):
+            value = str(product.get(name) or '').strip().lower()
+            if value:
+                break
+        if value == 'yes':
+            score += weight
+    return score
+
+
+def _is_stocked(product: Dict[str, Any]) -> bool:
+    """
+    Tie-breaker within a criticality level: any stocking decision except "no".
+    """
+    value = str(product.get('stocking_decision') or '').strip().lower()
+    return bool(value) and value != 'no'
+
+
+def _product_fields(product: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Manufacturer and part number as sent in the agent prompt.
+    """
+    manufacturer = (
+        product.get('part_manufacturer', '') or
+        product.get('manufacture', '') or
+        product.get('manufacturer', '')
+    )
+    part_number = (
+        product.get('manufacturer_part_number', '') or
+        product.get('part_number', '') or
+        product.get('part_number_ai_modified', '')
+    )
+    return str(manufacturer or ''), str(part_number or '')
+
+
+def _result_fields(result: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Manufacturer and part number of an analysis or replacement result.
+    """
+    part_number = result.get('part_number') or result.get('obsolete_part_number') or ''
+    return str(result.get('manufacturer') or ''), str(part_number)
+
+
+def estimate_tokens(product: Dict[str, Any], agent: str = 'analysis') -> int:
+    """
+    Estimate the prompt and response tokens one product adds to a call.
+    The prompt line is echoed back in the result, so it is counted twice.
+    """
+    manufacturer, part_number = _product_fields(product)
+    prompt_tokens = math.ceil((len(manufacturer) + len(part_number) + 2) / CHARS_PER_TOKEN)
+    return 2 * prompt_tokens + RESPONSE_TOKENS_PER_PRODUCT.get(agent, RESPONSE_TOKENS_PER_PRODUCT['analysis'])
+
+
+class _Group:
+    """
+    Products of one manufacturer at one rank: [(product, estimated tokens, part key)].
+    The rank is (priority, stocked), so stocked parts go first within a priority.
+    """
+    __slots__ = ('priority', 'stocked', 'manufacturer', 'items')
+
+    def __init__(self, priority: float, stocked: bool, manufacturer: str):
+        self.priority = priority
+        self.stocked = stocked
+        self.manufacturer = manufacturer
+        self.items: List[Tuple[Dict[str, Any], int, str]] = []
+
+    @property
+    def rank(self) -> Tuple[float, bool]:
+        return self.priority, self.stocked
+
+    def tokens(self) -> int:
+        return sum(tokens for _, tokens, _ in self.items)
+
+
+class ChunkPlan:
+    """
+    Unique products of a run, highest priority first and grouped by manufacturer,
+    cut into chunks on demand. Safe to boost from another thread while chunks are cut.
+    """
+
+    def __init__(
+        self,
+        products: List[Dict[str, Any]],
+        agent: str = 'analysis',
+        token_budget: int = CHUNK_TOKEN_BUDGET,
+        weights: Optional[Dict[str, float]] = None
+    ):
+        self.agent = agent
+        self.token_budget = token_budget
+        self.total_products = len(products)
+        self._lock = threading.Lock()
+
+        # Part key -> duplicates of the product sent to the agent
+        self._duplicates: Dict[str, List[Dict[str, Any]]] = {}
+        # Criticality of each product sent to the agent, by id()
+        self._scores: Dict[int, float] = {}
+        # (criticality, stocked, normalized manufacturer) -> group, in first-seen order
+        groups: Dict[Tuple[float, bool, str], _Group] = {}
+
+        for product in products:
+            manufacturer, part_number = _product_fields(product)
+            key = make_part_key(manufacturer, part_number)
+            if key and key in self._duplicates:
+                self._duplicates[key].append(product)
+                continue
+            if key:
+                self._duplicates[key] = []
+            score = criticality(product, weights)
+            self._scores[id(product)] = score
+            group_key = (score, _is_stocked(product), normalize_manufacturer(manufacturer))
+            group = groups.get(group_key)
+            if group is None:
+                group = _Group(*group_key)
+                groups[group_key] = group
+            group.items.append((product, estimate_tokens(product, agent), key))
+
+        # Stable sort: highest criticality first, stocked parts first within a level,
+        # then first-seen order
+        self._groups: List[_Group] = sorted(
+            groups.values(), key=lambda group: (-group.priority, not group.stocked)
+        )
+        self.unique_products = len(self._scores)
+        self.duplicate_products = self.total_products - self.unique_products
+        self.critical_products = sum(1 for score in self._scores.values() if score > 0)
+        self.estimated_tokens = sum(group.tokens() for group in self._groups)
+
+    def remaining(self) -> int:
+        with self._lock:
+            return sum(len(group.items) for group in self._groups)
+
+    def critical_count(self, chunk: List[Dict[str, Any]]) -> int:
+        """
+        Products in a chunk with a criticality score above zero.
+        """
+        return sum(1 for product in chunk if self._scores.get(id(product), 0.0) > 0)
+
+    def estimate_chunks(self, max_products: int) -> int:
+        """
+        Chunks still needed at the given product limit and the token budget.
+        """
+        with self._lock:
+            remaining = sum(len(group.items) for group in self._groups)
+            if not remaining:
+                return 0
+            remaining_tokens = sum(group.tokens() for group in self._groups)
+        return max(math.ceil(remaining / max(max_products, 1)), math.ceil(remaining_tokens / self.token_budget))
+
+    def next_chunk(self, max_products: int) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Cut the next chunk, starting with the highest-priority group: whole groups of
+        that rank while one fits the remaining room (looking ahead past groups
+        that don't), then part of the first group, so chunks are full and a
+        manufacturer's products stay in consecutive chunks.
+
+        Returns:
+            Tuple of (products, priority of the chunk's first group)
+        """
+        max_products = max(max_products, 1)
+        chunk: List[Dict[str, Any]] = []
+        tokens = 0
+        with self._lock:
+            priority = self._groups[0].priority if self._groups else 0.0
+            while self._groups:
+                room_products = max_products - len(chunk)
+                room_tokens = self.token_budget - tokens
+                if room_products <= 0 or (chunk and room_tokens <= 0):
+                    break
+
+                index = self._first_fitting_group(room_products, room_tokens)
+                if index is not None:
+                    group = self._groups.pop(index)
+                    chunk.extend(product for product, _, _ in group.items)
+                    tokens += group.tokens()
+                    continue
+
+                # No whole group fits: fill the room from the first group, whose
+                # remainder starts the next chunk
+                group = self._groups[0]
+                taken = 0
+                while taken < len(group.items) and taken < room_products:
+                    product_tokens = group.items[taken][1]
+                    if chunk and tokens + product_tokens > self.token_budget:
+                        break
+                    chunk.append(group.items[taken][0])
+                    tokens += product_tokens
+                    taken += 1
+                del group.items[:taken]
+                if not group.items:
+                    self._groups.pop(0)
+                break
+
+        return chunk, priority
+
+    def _first_fitting_group(self, room_products: int, room_tokens: int) -> Optional[int]:
+        # Only groups at the front's rank, so lower-ranked parts never overtake
+        rank = self._groups[0].rank
+        for index, group in enumerate(self._groups[:FILL_LOOKAHEAD]):
+            if group.rank != rank:
+                break
+            if len(group.items) <= room_products and group.tokens() <= room_tokens:
+                return index
+        return None
+
+    def boost(self, part_keys: Iterable[str]) -> int:
+        """
+        Move products with the given part keys ahead of everything not yet sent.
+
+        Returns:
+            Number of products moved
+        """
+        wanted = {key for key in part_keys if key}
+        if not wanted:
+            return 0
+        with self._lock:
+            boosted: Dict[str, _Group] = {}
+            kept: List[_Group] = []
+            for group in self._groups:
+                if group.priority >= BOOSTED_PRIORITY:
+                    kept.append(group)
+                    continue
+                remaining_items = []
+                for item in group.items:
+                    if item[2] in wanted:
+                        target = boosted.get(group.manufacturer)
+                        if target is None:
+                            target = _Group(BOOSTED_PRIORITY, True, group.manufacturer)
+                            boosted[group.manufacturer] = target
+                        target.items.append(item)
+                    else:
+                        remaining_items.append(item)
+                group.items = remaining_items
+                if group.items:
+                    kept.append(group)
+            # Newly boosted rows go after rows boosted earlier, ahead of the rest
+            already_boosted = [group for group in kept if group.priority >= BOOSTED_PRIORITY]
+            others = [group for group in kept if group.priority < BOOSTED_PRIORITY]
+            self._groups = already_boosted + list(boosted.values()) + others
+            return sum(len(group.items) for group in boosted.values())
+
+    def fan_out(
+        self,
+        results: List[Dict[str, Any]],
+        chunk: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Add a copy of each result for the duplicates of its part, carrying the
+        duplicate's own manufacturer and part number spelling.
+
+        Returns:
+            The results followed by the copies
+        """
+        return [result for result, _ in self.pair(results, chunk)]
+
+    def pair(
+        self,
+        results: List[Dict[str, Any]],
+        chunk: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """
+        Pair each result with the submitted product it answers, then add a copy of
+        each result for the duplicates of that product (see fan_out).
+
+        Results are matched to the chunk's products by the part key of the returned
+        manufacturer and part number. When the agent normalized or corrected a part
+        number, the remaining results are paired with the products left without a
+        result in chunk order, but only if the agent returned one result per product.
+        Without a chunk, results are matched by their own part key.
+
+        Returns:
+            [(result, submitted product or None)], the results followed by the copies
+        """
+        if chunk is None:
+            products: List[Optional[Dict[str, Any]]] = [None] * len(results)
+        else:
+            products = _match_products(results, chunk)
+
+        pairs = list(zip(results, products))
+        for result, product in pairs[:len(results)]:
+            if product is not None:
+                fields = _product_fields(product)
+            elif chunk is None:
+                fields = _result_fields(result)
+            else:
+                continue
+            duplicates = self._duplicates.pop(make_part_key(*fields), None)
+            if duplicates:
+                pairs.extend(zip(_copies_for(result, duplicates), duplicates))
+        return pairs
+
+
+def _match_products(results: List[Dict[str, Any]], chunk: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Submitted product answered by each result, or None when it can't be told.
+    """
+    index_by_key: Dict[str, int] = {}
+    for index, product in enumerate(chunk):
+        key = make_part_key(*_product_fields(product))
+        if key:
+            index_by_key.setdefault(key, index)
+
+    products: List[Optional[Dict[str, Any]]] = [None] * len(results)
+    answered = set()
+    unmatched = []
+    for result_index, result in enumerate(results):
+        index = index_by_key.get(make_part_key(*_result_fields(result)))
+        if index is None:
+            unmatched.append(result_index)
+        elif index not in answered:
+            answered.add(index)
+            products[result_index] = chunk[index]
+        # A second result for an answered product matches nothing
+
+    unanswered = [index for index in range(len(chunk)) if index not in answered]
+    if len(results) == len(chunk) and len(unmatched) == len(unanswered):
+        for result_index, index in zip(unmatched, unanswered):
+            products[result_index] = chunk[index]
+    return products
+
+
+def _copies_for(result: Dict[str, Any], duplicates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    copies = []
+    for duplicate in duplicates:
+        manufacturer, part_number = _product_fields(duplicate)
+        copy = dict(result)
+        copy['manufacturer'] = manufacturer
+        if 'obsolete_part_number' in copy:
+            copy['obsolete_part_number'] = part_number
+        else:
+            copy['part_number'] = part_number
+        copies.append(copy)
+    return copies
@@ -6,7 +6,12 @@ from typing import List, Dict, Any
 import io
 import re
 
+from services.metrics_service import EXCEL_PARSE_SECONDS
+from services.tracing_service import span
 
+
+@EXCEL_PARSE_SECONDS.time(('general_info',))
+@span('excel.general_info', stage='parse')
 def extract_general_information(file_content: bytes, filename: str) -> Dict[str, Any]:
     """
     Extract general information from the Excel file
@@ -101,6 +106,8 @@ def extract_general_information(file_content: bytes, filename: str) -> Dict[str,
         raise Exception(f"Error extracting general information: {str(e)}")
 
 
+@EXCEL_PARSE_SECONDS.time(('products',))
+@span('excel.products', stage='parse')
 def extract_products_from_row_18(file_content: bytes, filename: str) -> List[Dict[str, Any]]:
     """
     Extract products list starting from row 18
@@ -227,6 +234,8 @@ def parse_excel_file(file_content: bytes, filename: str) -> List[Dict[str, Any]]
     return extract_products_from_row_18(file_content, filename)
 
 
+@EXCEL_PARSE_SECONDS.time(('complete',))
+@span('excel.parse_complete', stage='parse')
 def parse_excel_file_complete(file_content: bytes, filename: str) -> Dict[str, Any]:
     """
     Parse Excel file and return both general information and products list
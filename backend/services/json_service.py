@@ -0,0 +1,66 @@
+"""
+JSON Service - Fast JSON encoding for API responses
+Uses orjson when installed and falls back to the standard library encoder
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from flask import Response
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(value: Any) -> Any:
+    """
+    Encode types the JSON encoders don't handle natively (DECIMAL columns, dates).
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serialize an object to UTF-8 encoded JSON bytes.
+
+    Args:
+        obj: Object to serialize (dicts, lists, Decimal, date and datetime values)
+
+    Returns:
+        JSON bytes
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Any) -> Any:
+    """
+    Parse JSON from bytes or str.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Build a Flask JSON response using the fast encoder instead of jsonify.
+
+    Args:
+        payload: Response body
+        status: HTTP status code
+        headers: Extra response headers
+
+    Returns:
+        Flask Response with application/json mimetype
+    """
+    return Response(dumps(payload), status=status, mimetype='application/json', headers=headers)
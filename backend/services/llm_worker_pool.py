@@ -0,0 +1,244 @@
+"""
+LLM Worker Pool - Process-wide worker threads for agent calls with fair queuing
+Every run (an analysis or a replacement search) queues its chunks as a flow in one
+of two lanes:
+
+- interactive: runs of up to LLM_INTERACTIVE_MAX_PRODUCTS unique products
+- bulk: larger runs
+
+Queued chunks are dispatched by deficit round robin over the flows, with a chunk
+costing its number of products. Each round, a flow may send chunks worth its quantum
+(LLM_POOL_QUANTUM products times its lane weight), so a 10-row check is not queued
+behind a 3,000-row analysis and concurrent bulk runs share the agent evenly.
+
+Calls in flight per agent are capped for the whole process by the chunk controller's
+concurrency limit, and LLM_INTERACTIVE_RESERVED of those slots are kept free of bulk
+work so a small run starts without waiting for a bulk chunk to finish.
+"""
+import concurrent.futures
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from services.chunk_controller import CHUNK_SIZE_MAX, LLM_CONCURRENCY_MAX, get_chunk_controller
+from services.metrics_service import LLM_POOL_FLOWS, LLM_POOL_QUEUE_DEPTH, LLM_POOL_WAIT_SECONDS
+
+
+# Worker threads shared by all agents; the controllers' limits decide how many are busy
+LLM_POOL_WORKERS = int(os.getenv('LLM_POOL_WORKERS', 2 * LLM_CONCURRENCY_MAX))
+
+# Runs with at most this many unique products use the interactive lane
+LLM_INTERACTIVE_MAX_PRODUCTS = int(os.getenv('LLM_INTERACTIVE_MAX_PRODUCTS', 50))
+
+# Agent call slots that bulk runs leave free for interactive ones
+LLM_INTERACTIVE_RESERVED = int(os.getenv('LLM_INTERACTIVE_RESERVED', 1))
+
+# Products a flow may send per round, times its lane weight (at least one full chunk)
+LLM_POOL_QUANTUM = max(int(os.getenv('LLM_POOL_QUANTUM', CHUNK_SIZE_MAX)), 1)
+
+LANES = ('interactive', 'bulk')
+
+LANE_WEIGHTS = {
+    'interactive': max(int(os.getenv('LLM_INTERACTIVE_WEIGHT', 4)), 1),
+    'bulk': 1,
+}
+
+# Idle workers re-check the queue at this interval, since a controller raising its
+# concurrency limit does not wake them
+IDLE_POLL_SECONDS = 0.5
+
+
+def lane_for(products: int) -> str:
+    """
+    Lane of a run with the given number of unique products.
+    """
+    return 'interactive' if products <= LLM_INTERACTIVE_MAX_PRODUCTS else 'bulk'
+
+
+class _Task:
+    __slots__ = ('flow', 'agent', 'cost', 'func', 'args', 'future', 'submitted')
+
+    def __init__(self, flow: 'Flow', agent: str, cost: int, func: Callable, args: Tuple):
+        self.flow = flow
+        self.agent = agent
+        self.cost = cost
+        self.func = func
+        self.args = args
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.submitted = time.perf_counter()
+
+
+class Flow:
+    """
+    Queue of one run's chunks. Close it when the run ends; chunks still queued
+    are cancelled.
+    """
+
+    def __init__(self, pool: 'LLMWorkerPool', name: str, lane: str):
+        if lane not in LANE_WEIGHTS:
+            raise ValueError(f"lane must be one of {', '.join(LANES)}, got {lane!r}")
+        self.pool = pool
+        self.name = name
+        self.lane = lane
+        self.quantum = LLM_POOL_QUANTUM * LANE_WEIGHTS[lane]
+        self.deficit = 0
+        self.queue: Deque[_Task] = deque()
+        self.scheduled = False  # In the pool's round
+        self.closed = False
+
+    def submit(self, agent: str, cost: int, func: Callable, *args: Any) -> concurrent.futures.Future:
+        """
+        Queue an agent call costing `cost` products.
+        """
+        return self.pool._submit(self, agent, cost, func, args)
+
+    def close(self):
+        self.pool._close(self)
+
+    def __enter__(self) -> 'Flow':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LLMWorkerPool:
+    """
+    Worker threads running queued agent calls, fairly across flows.
+    """
+
+    def __init__(self, workers: int = LLM_POOL_WORKERS):
+        self._cond = threading.Condition()
+        # Flows with queued chunks, in round-robin order
+        self._round: Deque[Flow] = deque()
+        # Agent -> calls running
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._threads = [
+            threading.Thread(target=self._work, name=f'llm-worker-{i}', daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def open_flow(self, name: str, lane: str) -> Flow:
+        flow = Flow(self, name, lane)
+        LLM_POOL_FLOWS.inc((lane,))
+        return flow
+
+    def _submit(self, flow: Flow, agent: str, cost: int, func: Callable, args: Tuple) -> concurrent.futures.Future:
+        task = _Task(flow, agent, max(cost, 1), func, args)
+        with self._cond:
+            if flow.closed:
+                raise RuntimeError(f"Flow {flow.name} is closed")
+            flow.queue.append(task)
+            if not flow.scheduled:
+                flow.scheduled = True
+                self._round.append(flow)
+            LLM_POOL_QUEUE_DEPTH.inc((flow.lane,))
+            self._cond.notify()
+        return task.future
+
+    def _close(self, flow: Flow):
+        with self._cond:
+            if flow.closed:
+                return
+            flow.closed = True
+            for task in flow.queue:
+                task.future.cancel()
+            LLM_POOL_QUEUE_DEPTH.dec((flow.lane,), len(flow.queue))
+            flow.queue.clear()
+            if flow.scheduled:
+                flow.scheduled = False
+                self._round.remove(flow)
+            LLM_POOL_FLOWS.dec((flow.lane,))
+
+    def _has_capacity(self, agent: str, lane: str) -> bool:
+        limit = get_chunk_controller(agent).concurrency
+        if lane == 'bulk' and limit > LLM_INTERACTIVE_RESERVED:
+            limit -= LLM_INTERACTIVE_RESERVED
+        return self._in_flight[agent] < limit
+
+    def _next_task(self) -> Optional[_Task]:
+        """
+        Deficit round robin: the flow at the head of the round sends chunks while its
+        deficit covers the next one, then gets another quantum and moves to the back.
+        Flows whose agent is at its limit are passed over without losing their turn's
+        deficit. Called with the condition held.
+        """
+        passed_over = 0
+        while self._round and passed_over < len(self._round):
+            flow = self._round[0]
+            task = flow.queue[0]
+            if not self._has_capacity(task.agent, flow.lane):
+                self._round.rotate(-1)
+                passed_over += 1
+                continue
+            if flow.deficit >= task.cost:
+                flow.deficit -= task.cost
+                flow.queue.popleft()
+                if not flow.queue:
+                    # An idle flow keeps no credit for the next time it queues work
+                    self._round.popleft()
+                    flow.scheduled = False
+                    flow.deficit = 0
+                return task
+            flow.deficit += flow.quantum
+            self._round.rotate(-1)
+            passed_over = 0
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait(IDLE_POLL_SECONDS)
+                    task = self._next_task()
+                self._in_flight[task.agent] += 1
+                LLM_POOL_QUEUE_DEPTH.dec((task.flow.lane,))
+
+            LLM_POOL_WAIT_SECONDS.observe(time.perf_counter() - task.submitted, (task.flow.lane,))
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        result = task.func(*task.args)
+                    except BaseException as e:
+                        task.future.set_exception(e)
+                    else:
+                        task.future.set_result(result)
+            finally:
+                with self._cond:
+                    self._in_flight[task.agent] -= 1
+                    self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Queued chunks per lane and calls running per agent.
+        """
+        with self._cond:
+            queued = {lane: 0 for lane in LANES}
+            for flow in self._round:
+                queued[flow.lane] += len(flow.queue)
+            return {
+                "workers": len(self._threads),
+                "queued": queued,
+                "in_flight": dict(self._in_flight),
+                "flows": len(self._round)
+            }
+
+
+_llm_worker_pool: Optional[LLMWorkerPool] = None
+_llm_worker_pool_lock = threading.Lock()
+
+
+def get_llm_worker_pool() -> LLMWorkerPool:
+    """
+    Get the process-wide worker pool, starting its threads on first use.
+    """
+    global _llm_worker_pool
+    with _llm_worker_pool_lock:
+        if _llm_worker_pool is None:
+            _llm_worker_pool = LLMWorkerPool()
+        return _llm_worker_pool
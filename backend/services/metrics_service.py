@@ -0,0 +1,310 @@
+"""
+Metrics Service - In-process counters, gauges and histograms in Prometheus text format
+Metrics are plain Python objects updated under a per-metric lock, so instrumenting the
+hot path costs a dictionary update; GET /api/metrics renders them on demand.
+No metrics server or client library is needed.
+"""
+import abc
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import has_request_context, request
+
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# LLM calls take seconds to minutes
+LLM_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0, 300.0)
+
+# Queue waits range from immediate to several LLM calls
+POOL_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _labels(self, values: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """
+        Sample lines of the metric in the Prometheus text format.
+        """
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter, optionally split by label values.
+    """
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(labels))} {_format_value(value)}" for labels, value in values]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down (in-flight work, open connections).
+    """
+    metric_type = 'gauge'
+
+    def dec(self, labels: Tuple = (), amount: float = 1.0):
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Tuple = ()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram of observed values (durations, sizes).
+    """
+    metric_type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, labels: Tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[labels] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, labels: Tuple = ()) -> "_Timer":
+        """
+        Context manager (or decorator) observing the elapsed time in seconds.
+        """
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        lines = []
+        for labels, counts, total, count in values:
+            label_dict = self._labels(labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**label_dict, 'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(label_dict)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(label_dict)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self._start, self.labels)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def track_in_flight(gauge: Gauge, labels: Tuple = (), histogram: Optional[Histogram] = None) -> Callable:
+    """
+    Decorator counting calls in progress on a gauge (and their duration on a histogram).
+    Generator functions count until the generator finishes or is closed.
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                gauge.inc(labels)
+                start = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                finally:
+                    gauge.dec(labels)
+                    if histogram is not None:
+                        histogram.observe(time.perf_counter() - start, labels)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            gauge.inc(labels)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                gauge.dec(labels)
+                if histogram is not None:
+                    histogram.observe(time.perf_counter() - start, labels)
+        return wrapper
+    return decorator
+
+
+def current_endpoint() -> str:
+    """
+    Flask endpoint of the current request, or "background" outside a request.
+    """
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]):
+    """
+    Register a callable returning metrics owned by another module, rendered on each scrape.
+    It yields (name, type, help, [(labels, value), ...]) tuples.
+    """
+    _collectors.append(collector)
+
+
+def render_prometheus() -> str:
+    """
+    Render every metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    for collector in list(_collectors):
+        try:
+            families = list(collector())
+        except Exception as e:
+            lines.append(f"# collector failed: {_escape(e)}")
+            continue
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# Analysis pipeline metrics (label "agent" is "analysis" or "replacement")
+LLM_REQUEST_SECONDS = Histogram(
+    'lifecycle_llm_request_duration_seconds', 'Duration of a single LLM agent call.', ('agent',), LLM_BUCKETS
+)
+LLM_CHUNK_SECONDS = Histogram(
+    'lifecycle_llm_chunk_duration_seconds', 'Duration of a chunk including retries and backoff.', ('agent',), LLM_BUCKETS
+)
+LLM_CHUNKS_IN_FLIGHT = Gauge(
+    'lifecycle_llm_chunks_in_flight', 'Chunks currently being processed by an LLM agent.', ('agent',)
+)
+LLM_CHUNK_RESULTS = Counter(
+    'lifecycle_llm_chunk_results_total', 'Chunks by outcome: parsed agent JSON or generated fallback.', ('agent', 'outcome')
+)
+LLM_RETRIES = Counter(
+    'lifecycle_llm_retries_total', 'LLM calls retried after an error.', ('agent',)
+)
+LLM_TOKENS = Counter(
+    'lifecycle_llm_tokens_total', 'Tokens reported in the response usage field.', ('agent', 'type')
+)
+LLM_THROTTLED = Counter(
+    'lifecycle_llm_throttled_total', 'LLM calls rejected with 429 (rate limited).', ('agent',)
+)
+LLM_CHUNK_SIZE = Gauge(
+    'lifecycle_llm_chunk_size', 'Products per chunk chosen by the chunk controller.', ('agent',)
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    'lifecycle_llm_concurrency_limit', 'Concurrent chunks allowed by the chunk controller.', ('agent',)
+)
+CHUNK_CONTROLLER_DECISIONS = Counter(
+    'lifecycle_chunk_controller_decisions_total', 'Chunk size and concurrency changes by action.', ('agent', 'action')
+)
+CRITICAL_RESULTS_SECONDS = Histogram(
+    'lifecycle_critical_results_seconds', 'Time from the start of a run until all critical products have results.',
+    ('agent',), LLM_BUCKETS
+)
+LLM_POOL_QUEUE_DEPTH = Gauge(
+    'lifecycle_llm_pool_queue_depth', 'Chunks waiting for an LLM worker by lane.', ('lane',)
+)
+LLM_POOL_WAIT_SECONDS = Histogram(
+    'lifecycle_llm_pool_wait_seconds', 'Time a chunk waited for an LLM worker by lane.', ('lane',), POOL_WAIT_BUCKETS
+)
+LLM_POOL_FLOWS = Gauge(
+    'lifecycle_llm_pool_flows', 'Runs queuing chunks on the LLM worker pool by lane.', ('lane',)
+)
+LLM_ARCHIVE = Counter(
+    'lifecycle_llm_archive_total', 'Agent responses recorded to or replayed from the response archive.', ('agent', 'result')
+)
+EXCEL_PARSE_SECONDS = Histogram(
+    'lifecycle_excel_parse_duration_seconds', 'Duration of Excel parsing by operation.', ('operation',)
+)
+DB_QUERY_SECONDS = Histogram(
+    'lifecycle_db_query_duration_seconds', 'Duration of database statements by API endpoint.', ('endpoint',)
+)
+SSE_CONNECTIONS = Gauge(
+    'lifecycle_sse_connections', 'Open Server-Sent Events streams.', ('stream',)
+)
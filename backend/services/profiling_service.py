@@ -0,0 +1,322 @@
+"""
+Profiling Service - Opt-in CPU sampling and allocation profiling of single requests
+A profiled request is sampled by a background thread that reads the request thread's
+stack every PROFILE_INTERVAL_MS, and tracemalloc snapshots taken before and after it
+give the allocation sites that grew. Both are written to logs/profiles/:
+
+- <profile_id>.folded     collapsed stacks ("frame;frame;frame count"), the input of
+                          flamegraph.pl, speedscope and inferno
+- <profile_id>.alloc.txt  top allocation sites near peak memory and still held at the
+                          end of the request
+- <profile_id>.json       summary listed by GET /api/profiles
+
+A request is profiled when its path starts with one of PROFILE_REQUESTS, or when it
+sends an X-Profile header equal to PROFILE_TOKEN. Only one request is profiled at a
+time because tracemalloc is process-wide.
+"""
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from flask import g, request
+
+from services.analysis_logger import get_log_directory, log_error, log_info
+from services.json_service import dumps, loads
+
+
+# Comma-separated path prefixes profiled on every request, e.g. "/api/excel/upload,/api/parts"
+PROFILE_REQUESTS = tuple(
+    prefix.strip() for prefix in os.getenv('PROFILE_REQUESTS', '').split(',') if prefix.strip()
+)
+
+# Requests sending "X-Profile: <token>" are profiled; the profiles API requires it too
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '').strip()
+
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 10))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv('PROFILE_TOP_ALLOCATIONS', 30))
+
+# A peak allocation snapshot is taken once traced memory grows by 1 MiB, then again
+# each time it grows another 25%
+PEAK_SNAPSHOT_MIN_BYTES = 1024 * 1024
+PEAK_SNAPSHOT_GROWTH = 1.25
+
+# Oldest profiles beyond this count are deleted
+PROFILE_MAX_KEEP = int(os.getenv('PROFILE_MAX_KEEP', 50))
+
+PROFILE_KINDS = {
+    'folded': ('.folded', 'text/plain'),
+    'alloc': ('.alloc.txt', 'text/plain'),
+    'json': ('.json', 'application/json'),
+}
+
+_PROFILE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+
+_active_lock = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_REQUESTS or PROFILE_TOKEN)
+
+
+def is_authorized() -> bool:
+    """
+    Whether the current request may trigger profiling or read profiles.
+    With PROFILE_TOKEN set, the X-Profile header must match it.
+    """
+    if PROFILE_TOKEN:
+        return request.headers.get('X-Profile', '') == PROFILE_TOKEN
+    return bool(PROFILE_REQUESTS)
+
+
+def get_profile_directory() -> str:
+    profile_dir = os.path.join(get_log_directory(), 'profiles')
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    """
+    Samples one thread's Python stack at a fixed interval into collapsed stack counts.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._snapshot_size = tracemalloc.get_traced_memory()[0] + PEAK_SNAPSHOT_MIN_BYTES
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+            # Re-snapshot allocations whenever traced memory reaches a new high, so
+            # short-lived buffers freed before the request ends still show up
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self._snapshot_size:
+                self.peak_snapshot = tracemalloc.take_snapshot()
+                self._snapshot_size = current * PEAK_SNAPSHOT_GROWTH
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """
+    CPU samples and allocation growth of a single request.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.profile_id = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now().isoformat(timespec='milliseconds')
+        self._start = time.perf_counter()
+        self._started_tracemalloc = False
+        self._snapshot_before = None
+        self._finished = False
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._memory_before = tracemalloc.get_traced_memory()[0]
+        self._snapshot_before = tracemalloc.take_snapshot()
+
+        self._sampler = _StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000.0)
+        self._sampler.start()
+
+    def finish(self, status_code: Optional[int] = None):
+        """
+        Stop sampling, write the profile files and release the profiler.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            duration = time.perf_counter() - self._start
+            self._sampler.stop()
+            snapshot_after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+            filters = [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            ]
+            before = self._snapshot_before.filter_traces(filters)
+            retained_stats = snapshot_after.filter_traces(filters).compare_to(
+                before, 'lineno'
+            )[:PROFILE_TOP_ALLOCATIONS]
+            peak_stats = []
+            if self._sampler.peak_snapshot is not None:
+                peak_stats = self._sampler.peak_snapshot.filter_traces(filters).compare_to(
+                    before, 'lineno'
+                )[:PROFILE_TOP_ALLOCATIONS]
+            self._snapshot_before = None
+            self._sampler.peak_snapshot = None
+
+            summary = {
+                "profile_id": self.profile_id,
+                "method": self.method,
+                "path": self.path,
+                "status_code": status_code,
+                "started_at": self.started_at,
+                "duration_seconds": round(duration, 3),
+                "cpu_samples": self._sampler.samples,
+                "sample_interval_ms": PROFILE_INTERVAL_MS,
+                "memory_growth_bytes": current - self._memory_before,
+                "memory_peak_bytes": peak,
+            }
+            self._write(summary, peak_stats, retained_stats)
+            log_info("Profile {} written for {} {} ({:.2f}s, {} samples)",
+                     self.profile_id, self.method, self.path, duration, self._sampler.samples)
+        except Exception as e:
+            log_error("Failed to write profile {}: {}", self.profile_id, e)
+        finally:
+            _active_lock.release()
+
+    def _write(
+        self,
+        summary: Dict[str, Any],
+        peak_stats: List[tracemalloc.StatisticDiff],
+        retained_stats: List[tracemalloc.StatisticDiff]
+    ):
+        profile_dir = get_profile_directory()
+        base = os.path.join(profile_dir, self.profile_id)
+
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in self._sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        with open(base + '.alloc.txt', 'w', encoding='utf-8') as f:
+            f.write(f"{self.method} {self.path} at {self.started_at}\n")
+            f.write(f"Memory growth: {summary['memory_growth_bytes'] / 1024:.1f} KiB, "
+                    f"peak traced: {summary['memory_peak_bytes'] / 1024:.1f} KiB\n")
+            sections = (
+                ("Allocation sites near peak memory", peak_stats),
+                ("Allocation sites still held when the request ended", retained_stats),
+            )
+            for title, stats in sections:
+                if not stats:
+                    continue
+                f.write(f"\n{title} (top {len(stats)} by size growth):\n\n")
+                for stat in stats:
+                    f.write(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  "
+                            f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}\n")
+
+        with open(base + '.json', 'wb') as f:
+            f.write(dumps(summary))
+
+        _prune_profiles(profile_dir)
+
+
+def _prune_profiles(profile_dir: str):
+    summaries = sorted(name for name in os.listdir(profile_dir) if name.endswith('.json'))
+    for name in summaries[:max(0, len(summaries) - PROFILE_MAX_KEEP)]:
+        profile_id = name[:-len('.json')]
+        for suffix, _ in PROFILE_KINDS.values():
+            try:
+                os.remove(os.path.join(profile_dir, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """
+    Summaries of the captured profiles, newest first.
+    """
+    profile_dir = get_profile_directory()
+    profiles = []
+    for name in sorted(os.listdir(profile_dir), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(profile_dir, name), 'rb') as f:
+                profiles.append(loads(f.read()))
+        except Exception:
+            continue
+    return profiles
+
+
+def get_profile_path(profile_id: str, kind: str) -> Optional[str]:
+    """
+    Path of a profile file, or None if the id, kind or file is unknown.
+    """
+    if kind not in PROFILE_KINDS or not _PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(get_profile_directory(), profile_id + PROFILE_KINDS[kind][0])
+    return path if os.path.exists(path) else None
+
+
+def _should_profile() -> bool:
+    if PROFILE_TOKEN and request.headers.get('X-Profile', '') == PROFILE_TOKEN:
+        return True
+    return any(request.path.startswith(prefix) for prefix in PROFILE_REQUESTS)
+
+
+def init_profiling(app):
+    """
+    Profile requests selected by PROFILE_REQUESTS or the X-Profile header.
+    Profiles end when the response is closed, so streamed responses are profiled
+    until their last event; the id is returned in the X-Profile-Id header.
+    """
+    if not profiling_enabled():
+        return
+
+    @app.before_request
+    def _start_request_profile():
+        if request.path.startswith('/api/profiles') or not _should_profile():
+            return
+        if not _active_lock.acquire(blocking=False):
+            log_info("Skipping profile of {} {}: another request is being profiled", request.method, request.path)
+            return
+        try:
+            g._profile = RequestProfile(request.method, request.path)
+        except Exception as e:
+            _active_lock.release()
+            log_error("Failed to start profiling {} {}: {}", request.method, request.path, e)
+
+    @app.after_request
+    def _finish_profile_on_close(response):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = profile.profile_id
+            status_code = response.status_code
+            response.call_on_close(lambda: profile.finish(status_code))
+        return response
+
+    @app.teardown_request
+    def _finish_unclosed_profile(error=None):
+        # Only reached with a profile when after_request didn't run
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profile.finish(500)
@@ -0,0 +1,167 @@
+"""
+Response Archive - Record and replay agent responses
+Every agent call is stored as a gzip-compressed JSON entry addressed by the agent
+name and a SHA-256 hash of its input messages:
+
+    <LLM_ARCHIVE_DIR>/<agent>/<hash[:2]>/<hash>.json.gz
+
+With LLM_ARCHIVE_MODE=replay, responses are served from the archive instead of
+Azure, so a whole analysis can be re-run offline and deterministically (parser
+regression checks, benchmarks, reproducing a customer's results).
+The conversation link (previous_response_id) is not part of the key.
+
+Keys depend on how products were chunked, so replay turns adaptive chunking off
+(see chunk_controller.py): a run replays exactly when it was recorded with
+ADAPTIVE_CHUNKING=0 and the same chunk settings.
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from services.analysis_logger import get_log_directory, log_debug, log_error
+from services.json_service import dumps, loads
+from services.metrics_service import LLM_ARCHIVE
+
+
+# record (default): call Azure and archive each response
+# replay: serve responses from the archive without Azure credentials
+# off: call Azure without archiving
+LLM_ARCHIVE_MODE = os.getenv('LLM_ARCHIVE_MODE', 'record').strip().lower()
+
+LLM_ARCHIVE_DIR = os.getenv('LLM_ARCHIVE_DIR', '').strip()
+
+ARCHIVE_MODES = ('record', 'replay', 'off')
+
+_USAGE_FIELDS = ('input_tokens', 'output_tokens', 'total_tokens')
+
+
+class ArchivedResponse:
+    """
+    Stand-in for an agent response served from the archive. Exposes the
+    attributes the response parsing reads (id, output_text, usage).
+    """
+
+    def __init__(self, entry: Dict[str, Any]):
+        response = entry.get('response') or {}
+        self.id = response.get('id')
+        self.output_text = response.get('output_text')
+        self.usage = response.get('usage')
+        self.archive_key = entry.get('key')
+
+
+class ResponseArchive:
+    """
+    Content-addressed store of agent request/response pairs.
+    """
+
+    def __init__(self, archive_dir: str, mode: str):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"LLM_ARCHIVE_MODE must be one of {', '.join(ARCHIVE_MODES)}, got {mode!r}")
+        self.archive_dir = archive_dir
+        self.mode = mode
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    @staticmethod
+    def prompt_key(agent_name: str, input_messages: List[Dict[str, Any]]) -> str:
+        """
+        SHA-256 of the agent name and input messages in canonical JSON.
+        """
+        canonical = {
+            "agent": agent_name,
+            "input": [{"role": message.get('role'), "content": message.get('content')} for message in input_messages]
+        }
+        return hashlib.sha256(dumps(canonical)).hexdigest()
+
+    def _path(self, agent_name: str, key: str) -> str:
+        agent_dir = re.sub(r'[^A-Za-z0-9._-]', '_', agent_name) or '_'
+        return os.path.join(self.archive_dir, agent_dir, key[:2], f"{key}.json.gz")
+
+    def record(self, agent_name: str, input_messages: List[Dict[str, Any]], response: Any) -> Optional[str]:
+        """
+        Archive a response (replacing an earlier one for the same prompt).
+
+        Returns:
+            The archive key, or None if the entry could not be written
+        """
+        key = self.prompt_key(agent_name, input_messages)
+        entry = {
+            "key": key,
+            "agent": agent_name,
+            "recorded_at": datetime.now().isoformat(timespec='milliseconds'),
+            "input": input_messages,
+            "response": {
+                "id": getattr(response, 'id', None),
+                "output_text": getattr(response, 'output_text', None),
+                "usage": _usage_dict(getattr(response, 'usage', None))
+            }
+        }
+        path = self._path(agent_name, key)
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(gzip.compress(dumps(entry), compresslevel=6))
+            os.replace(temp_path, path)
+        except Exception as e:
+            log_error("Failed to archive response for agent {} ({}): {}", agent_name, key, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        LLM_ARCHIVE.inc((agent_name, 'recorded'))
+        log_debug("Archived response for agent {} as {}", agent_name, key)
+        return key
+
+    def replay(self, agent_name: str, input_messages: List[Dict[str, Any]]) -> ArchivedResponse:
+        """
+        Serve the archived response for a prompt. A missing entry returns a response
+        without text, so the caller's fallback result is used rather than retrying.
+        """
+        key = self.prompt_key(agent_name, input_messages)
+        try:
+            with open(self._path(agent_name, key), 'rb') as f:
+                entry = loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            LLM_ARCHIVE.inc((agent_name, 'miss'))
+            log_error("No archived response for agent {} and prompt {}", agent_name, key)
+            return ArchivedResponse({"key": key})
+        LLM_ARCHIVE.inc((agent_name, 'replayed'))
+        return ArchivedResponse(entry)
+
+
+def _usage_dict(usage: Any) -> Optional[Dict[str, Any]]:
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return {field: usage.get(field) for field in _USAGE_FIELDS if field in usage}
+    return {field: getattr(usage, field) for field in _USAGE_FIELDS if hasattr(usage, field)}
+
+
+_response_archive: Optional[ResponseArchive] = None
+_response_archive_lock = threading.Lock()
+
+
+def get_response_archive() -> ResponseArchive:
+    """
+    Get the archive configured by LLM_ARCHIVE_MODE and LLM_ARCHIVE_DIR
+    (default: logs/llm_archive).
+    """
+    global _response_archive
+    with _response_archive_lock:
+        if _response_archive is None:
+            archive_dir = LLM_ARCHIVE_DIR or os.path.join(get_log_directory(), 'llm_archive')
+            _response_archive = ResponseArchive(archive_dir, LLM_ARCHIVE_MODE)
+        return _response_archive
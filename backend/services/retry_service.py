@@ -0,0 +1,131 @@
+"""
+Retry Service - Short database transactions retried on lock contention
+Deadlocks, lock wait timeouts and unique-key races between concurrent writers are
+rolled back and retried with exponential backoff; counters are kept for monitoring.
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from services.metrics_service import register_collector
+from services.tracing_service import span
+
+
+# Retries after the first attempt, and backoff before retry n: base * 2^n (+ jitter)
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 2.0
+
+# MySQL error codes
+_MYSQL_DEADLOCK = 1213
+_MYSQL_LOCK_WAIT_TIMEOUT = 1205
+_MYSQL_DUPLICATE_ENTRY = 1062
+
+_metrics = {
+    "transactions": 0,
+    "retries": 0,
+    "deadlocks": 0,
+    "lock_timeouts": 0,
+    "integrity_conflicts": 0,
+    "failures": 0,
+    "retry_wait_seconds": 0.0,
+}
+_metrics_lock = threading.Lock()
+
+
+def classify_contention_error(error: Exception) -> Optional[str]:
+    """
+    Classify a database error caused by concurrent writers.
+
+    Returns:
+        "deadlocks", "lock_timeouts", "integrity_conflicts", or None if the error isn't retryable
+    """
+    if not isinstance(error, DBAPIError):
+        return None
+    orig = getattr(error, 'orig', None)
+    code = orig.args[0] if orig is not None and orig.args and isinstance(orig.args[0], int) else None
+    message = str(orig if orig is not None else error).lower()
+
+    if code == _MYSQL_DEADLOCK or 'deadlock' in message:
+        return "deadlocks"
+    if code == _MYSQL_LOCK_WAIT_TIMEOUT or 'database is locked' in message or 'database is busy' in message:
+        return "lock_timeouts"
+    # Another transaction inserted the same unique key first; a retry sees its row
+    if isinstance(error, IntegrityError) and (code == _MYSQL_DUPLICATE_ENTRY or 'unique constraint' in message):
+        return "integrity_conflicts"
+    return None
+
+
+def run_in_transaction(
+    session,
+    work: Callable[[Any], Any],
+    max_retries: int = MAX_RETRIES,
+    stats: Optional[Dict[str, int]] = None
+) -> Any:
+    """
+    Run work(session) and commit, retrying the whole transaction on contention errors.
+    work must be safe to re-run: it is called again from scratch after a rollback.
+
+    Args:
+        session: Database session
+        work: Callable doing the writes of one short transaction
+        max_retries: Retries after the first attempt
+        stats: Optional per-caller counters; "retries" is incremented on each retry
+
+    Returns:
+        Whatever work returned on the successful attempt
+    """
+    attempt = 0
+    while True:
+        try:
+            result = work(session)
+            session.commit()
+            _increment("transactions")
+            return result
+        except DBAPIError as e:
+            session.rollback()
+            kind = classify_contention_error(e)
+            if kind is None or attempt >= max_retries:
+                _increment("failures")
+                raise
+            delay = min(RETRY_BASE_DELAY * (2 ** attempt), RETRY_MAX_DELAY)
+            delay += random.uniform(0, delay)
+            _increment(kind)
+            _increment("retries")
+            _increment("retry_wait_seconds", delay)
+            if stats is not None:
+                stats["retries"] = stats.get("retries", 0) + 1
+            attempt += 1
+            with span('db.retry_backoff', stage='retry', cause=kind, attempt=attempt):
+                time.sleep(delay)
+
+
+def _increment(name: str, amount: float = 1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def get_contention_metrics() -> Dict[str, Any]:
+    """
+    Get cumulative transaction and contention counters for this process.
+    """
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    metrics["retry_wait_seconds"] = round(metrics["retry_wait_seconds"], 3)
+    return metrics
+
+
+def _collect_contention_metrics():
+    metrics = get_contention_metrics()
+    yield ('lifecycle_db_transactions_total', 'counter', 'Committed save transactions.', [({}, metrics["transactions"])])
+    yield ('lifecycle_db_transaction_retries_total', 'counter', 'Save transactions retried after contention, by cause.', [
+        ({"cause": cause}, metrics[cause]) for cause in ("deadlocks", "lock_timeouts", "integrity_conflicts")
+    ])
+    yield ('lifecycle_db_transaction_failures_total', 'counter', 'Save transactions that failed after retries.', [({}, metrics["failures"])])
+    yield ('lifecycle_db_retry_wait_seconds_total', 'counter', 'Time spent backing off before retries.', [({}, metrics["retry_wait_seconds"])])
+
+
+register_collector(_collect_contention_metrics)
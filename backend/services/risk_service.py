@@ -0,0 +1,194 @@
+"""
+Risk Service - Vectorized obsolescence risk scoring for the whole fleet
+Part attributes are turned into a factor frame once per data version; weights are
+applied to the whole frame at request time, so ranking doesn't loop over rows.
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.cache_service import get_data_version
+
+
+# Weight of each factor in the score (factors are all scaled to 0..1)
+DEFAULT_RISK_WEIGHTS = {
+    "stops_machine": 3.0,
+    "likely_to_fail": 2.0,
+    "exposure": 2.0,
+    "stock_need": 1.0,
+    "no_replacement": 2.0,
+}
+
+# Multiplier applied to the weighted factors by lifecycle status
+DEFAULT_STATUS_FACTORS = {
+    "obsolete": 1.0,
+    "review": 0.6,
+    "not_analyzed": 0.3,
+    "active": 0.0,
+}
+
+# Columns the loader must provide, in order
+RISK_SOURCE_COLUMNS = (
+    'id',
+    'part_manufacturer',
+    'manufacturer_part_number',
+    'part_description',
+    'ai_status',
+    'will_failures_stop_machine',
+    'is_part_likely_to_fail',
+    'stocking_decision',
+    'min_qty_to_stock',
+    'recommended_replacement',
+    'machines_count',
+    'units',
+)
+
+
+def build_risk_factors(rows: List[Tuple]) -> pd.DataFrame:
+    """
+    Build the factor frame from part rows.
+
+    Args:
+        rows: Tuples in RISK_SOURCE_COLUMNS order (machines_count/units summed over machine_parts)
+
+    Returns:
+        DataFrame indexed by position with the display columns, a status_key column
+        and one 0..1 column per factor in DEFAULT_RISK_WEIGHTS
+    """
+    frame = pd.DataFrame.from_records(rows, columns=list(RISK_SOURCE_COLUMNS))
+
+    def normalized(column: str) -> pd.Series:
+        return frame[column].fillna('').astype(str).str.strip().str.lower()
+
+    status = normalized('ai_status')
+    status_key = np.select(
+        [status.str.contains('obsolete'), status.str.contains('review'), status == ''],
+        ['obsolete', 'review', 'not_analyzed'],
+        default='active'
+    )
+    frame['status_key'] = status_key
+
+    frame['machines_count'] = pd.to_numeric(frame['machines_count'], errors='coerce').fillna(0).astype(int)
+    units = pd.to_numeric(frame['units'], errors='coerce').fillna(0.0).astype(float)
+    frame['units'] = units
+    min_qty = pd.to_numeric(frame['min_qty_to_stock'], errors='coerce').fillna(0.0).clip(lower=0).astype(float)
+    frame['min_qty_to_stock'] = min_qty
+
+    # Log scaling so a handful of very common parts don't flatten everyone else
+    log_units = np.log1p(units.to_numpy())
+    max_log_units = log_units.max() if len(log_units) else 0.0
+    log_min_qty = np.log1p(min_qty.to_numpy())
+    max_log_min_qty = log_min_qty.max() if len(log_min_qty) else 0.0
+
+    stocking_decision = normalized('stocking_decision')
+    stocked = (stocking_decision != '') & (stocking_decision != 'no')
+
+    frame['stops_machine'] = (normalized('will_failures_stop_machine') == 'yes').astype(float)
+    frame['likely_to_fail'] = (normalized('is_part_likely_to_fail') == 'yes').astype(float)
+    frame['exposure'] = log_units / max_log_units if max_log_units > 0 else 0.0
+    # Stocked spares need a replenishment source; larger minimum stock means more need
+    frame['stock_need'] = np.where(
+        stocked,
+        0.5 + 0.5 * (log_min_qty / max_log_min_qty if max_log_min_qty > 0 else 0.0),
+        0.0
+    )
+    frame['no_replacement'] = (normalized('recommended_replacement') == '').astype(float)
+    return frame
+
+
+def score_parts(
+    factors: pd.DataFrame,
+    weights: Optional[Dict[str, float]] = None,
+    status_factors: Optional[Dict[str, float]] = None
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Score every part: status factor x weighted mean of the other factors, scaled to 0..100.
+
+    Returns:
+        Tuple of (scores, per-factor contributions that sum to the score)
+    """
+    weights = {**DEFAULT_RISK_WEIGHTS, **(weights or {})}
+    status_factors = {**DEFAULT_STATUS_FACTORS, **(status_factors or {})}
+    total_weight = sum(weights.values()) or 1.0
+
+    status_multiplier = factors['status_key'].map(status_factors).fillna(0.0).to_numpy(dtype=float)
+    scale = status_multiplier * (100.0 / total_weight)
+
+    contributions = {
+        name: factors[name].to_numpy(dtype=float) * weight * scale
+        for name, weight in weights.items()
+    }
+    scores = np.sum(list(contributions.values()), axis=0) if contributions else np.zeros(len(factors))
+    return scores, contributions
+
+
+def top_risks(
+    factors: pd.DataFrame,
+    limit: int = 50,
+    weights: Optional[Dict[str, float]] = None,
+    status_factors: Optional[Dict[str, float]] = None,
+    min_score: float = 0.0
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Rank parts by risk score and return the top N with their score breakdown.
+
+    Returns:
+        Tuple of (number of parts scoring above min_score, ranked part dictionaries)
+    """
+    if factors.empty:
+        return 0, []
+
+    scores, contributions = score_parts(factors, weights, status_factors)
+    candidates = np.flatnonzero(scores > min_score)
+    if len(candidates) > limit:
+        # Partial selection, then sort only the top N
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+    ranked = candidates[np.lexsort((factors['id'].to_numpy()[candidates], -scores[candidates]))]
+
+    results = []
+    for position in ranked:
+        row = factors.iloc[position]
+        results.append({
+            "id": int(row['id']),
+            "part_manufacturer": row['part_manufacturer'],
+            "manufacturer_part_number": row['manufacturer_part_number'],
+            "part_description": row['part_description'],
+            "ai_status": row['ai_status'],
+            "machines_count": int(row['machines_count']),
+            "units": float(row['units']),
+            "score": round(float(scores[position]), 2),
+            "breakdown": {
+                name: round(float(values[position]), 2)
+                for name, values in contributions.items()
+            }
+        })
+    return int(np.count_nonzero(scores > min_score)), results
+
+
+# Factor frame cached until the next write
+_risk_factors: Optional[pd.DataFrame] = None
+_risk_factors_version: Optional[int] = None
+_risk_factors_lock = threading.Lock()
+
+
+def get_risk_factors(loader: Callable[[], List[Tuple]]) -> pd.DataFrame:
+    """
+    Get the factor frame for the current data version, loading it if stale.
+
+    Args:
+        loader: Callable returning part rows in RISK_SOURCE_COLUMNS order
+    """
+    global _risk_factors, _risk_factors_version
+
+    with _risk_factors_lock:
+        version = get_data_version()
+        if _risk_factors is None or _risk_factors_version != version:
+            factors = build_risk_factors(loader())
+            # Keep the frame only if no write happened while loading
+            if version != get_data_version():
+                return factors
+            _risk_factors = factors
+            _risk_factors_version = version
+        return _risk_factors
@@ -0,0 +1,265 @@
+"""
+Run History - Rotation, compression and index of the structured run log
+The run log writer reports every record it appends to runs.jsonl; the index maps
+each run id to its summary and the byte spans holding its records, so past runs can
+be listed and read back without scanning log files.
+
+When runs.jsonl grows past RUN_LOG_MAX_BYTES it is rotated into a gzip segment with
+one gzip member per run, so a run is still read with a single seek.
+"""
+import gzip
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.json_service import dumps, loads
+
+
+# Rotate runs.jsonl into a compressed segment once it is larger than this
+RUN_LOG_MAX_BYTES = int(os.getenv('RUN_LOG_MAX_BYTES', 20 * 1024 * 1024))
+
+# Compressed segments (and rotated debug logs) older than this are deleted
+LOG_RETENTION_DAYS = float(os.getenv('LOG_RETENTION_DAYS', 90))
+
+INDEX_FILENAME = 'runs_index.json'
+
+# Summary fields copied from "start" and "complete" records into the index
+_SUMMARY_FIELDS = (
+    'total_products',
+    'total_analyzed',
+    'total_skipped',
+    'total_results',
+    'chunks',
+    'chunks_failed',
+    'duration_seconds',
+)
+
+
+class RunHistory:
+    """
+    Index of the runs in the live run log and its compressed segments.
+    Spans are [file name, offset, length, compressed]; compressed spans are whole
+    gzip members.
+    """
+
+    def __init__(self, log_dir: str, live_filename: str):
+        self.log_dir = log_dir
+        self.live_filename = live_filename
+        self._runs: Dict[str, Dict[str, Any]] = {}
+        self._live_bytes = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.log_dir, filename)
+
+    def _load(self):
+        index_path = self._path(INDEX_FILENAME)
+        try:
+            with open(index_path, 'rb') as f:
+                index = loads(f.read())
+            self._runs = {entry['run_id']: entry for entry in index.get('runs', [])}
+            self._live_bytes = int(index.get('live_bytes', 0))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Warning: Run index is unreadable, rebuilding from {self.live_filename}: {e}")
+            self._runs = {}
+            self._live_bytes = 0
+
+        # Runs still open when the process stopped will never complete
+        for entry in self._runs.values():
+            if entry['status'] == 'running':
+                entry['status'] = 'incomplete'
+                self._dirty = True
+
+        live_path = self._path(self.live_filename)
+        live_size = os.path.getsize(live_path) if os.path.exists(live_path) else 0
+        if live_size < self._live_bytes:
+            # The live file was replaced behind our back; index it from the start
+            self._drop_live_spans()
+            self._live_bytes = 0
+        if live_size > self._live_bytes:
+            # Index records written after the index was last saved
+            with open(live_path, 'rb') as f:
+                f.seek(self._live_bytes)
+                offset = self._live_bytes
+                for line in f:
+                    if line.endswith(b'\n'):
+                        try:
+                            self.add(loads(line), offset, len(line))
+                        except Exception:
+                            pass
+                    offset += len(line)
+            for entry in self._runs.values():
+                if entry['status'] == 'running':
+                    entry['status'] = 'incomplete'
+            self._dirty = True
+        self.save()
+
+    def _drop_live_spans(self):
+        for run_id in list(self._runs):
+            entry = self._runs[run_id]
+            entry['spans'] = [span for span in entry['spans'] if span[0] != self.live_filename]
+            if not entry['spans']:
+                del self._runs[run_id]
+        self._dirty = True
+
+    def add(self, record: Dict[str, Any], offset: int, length: int):
+        """
+        Index a record appended to the live run log at offset.
+        """
+        run_id = record.get('run_id')
+        if not run_id:
+            return
+        with self._lock:
+            entry = self._runs.get(run_id)
+            if entry is None:
+                entry = {
+                    "run_id": run_id,
+                    "analysis_type": record.get('analysis_type'),
+                    "status": 'running',
+                    "started_at": record.get('ts'),
+                    "completed_at": None,
+                    "spans": []
+                }
+                self._runs[run_id] = entry
+                self._dirty = True
+
+            record_type = record.get('type')
+            if record_type in ('start', 'complete'):
+                for field in _SUMMARY_FIELDS:
+                    if field in record:
+                        entry[field] = record[field]
+                if record_type == 'complete':
+                    entry['status'] = 'completed'
+                    entry['completed_at'] = record.get('ts')
+                self._dirty = True
+
+            # Extend the last span when records of a run are contiguous
+            spans = entry['spans']
+            last = spans[-1] if spans else None
+            if last and last[0] == self.live_filename and not last[3] and last[1] + last[2] == offset:
+                last[2] += length
+            else:
+                spans.append([self.live_filename, offset, length, False])
+            self._live_bytes = max(self._live_bytes, offset + length)
+
+    def save(self, force: bool = False):
+        """
+        Write the index if it changed (atomically, via a temporary file).
+        Chunk records alone don't mark it dirty; they are re-indexed from the live
+        file tail on startup.
+        """
+        with self._lock:
+            if not (self._dirty or force):
+                return
+            payload = dumps({
+                "version": 1,
+                "live_bytes": self._live_bytes,
+                "runs": list(self._runs.values())
+            })
+            self._dirty = False
+        index_path = self._path(INDEX_FILENAME)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, index_path)
+
+    def rotate(self):
+        """
+        Compress the (closed) live run log into a segment, one gzip member per run,
+        and delete segments past the retention period.
+        """
+        live_path = self._path(self.live_filename)
+        segment_name = f"runs-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl.gz"
+        with self._lock:
+            with open(live_path, 'rb') as f:
+                data = f.read()
+            with open(self._path(segment_name), 'wb') as segment:
+                for entry in self._runs.values():
+                    live_spans = [span for span in entry['spans'] if span[0] == self.live_filename]
+                    if not live_spans:
+                        continue
+                    member = gzip.compress(b''.join(data[offset:offset + length] for _, offset, length, _ in live_spans))
+                    entry['spans'] = [span for span in entry['spans'] if span[0] != self.live_filename]
+                    entry['spans'].append([segment_name, segment.tell(), len(member), True])
+                    segment.write(member)
+            os.remove(live_path)
+            self._live_bytes = 0
+            self._prune_segments()
+            self.save(force=True)
+
+    def _prune_segments(self):
+        cutoff = time.time() - LOG_RETENTION_DAYS * 86400
+        removed = set()
+        for filename in os.listdir(self.log_dir):
+            if filename.startswith('runs-') and filename.endswith('.jsonl.gz'):
+                path = self._path(filename)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed.add(filename)
+        if removed:
+            for run_id in list(self._runs):
+                entry = self._runs[run_id]
+                entry['spans'] = [span for span in entry['spans'] if span[0] not in removed]
+                if not entry['spans']:
+                    del self._runs[run_id]
+
+    def list_runs(
+        self,
+        limit: int = 50,
+        offset: int = 0,
+        analysis_type: Optional[str] = None
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Page through run summaries, newest first.
+
+        Returns:
+            Tuple of (total matching runs, summaries without spans)
+        """
+        with self._lock:
+            entries = [
+                entry for entry in reversed(list(self._runs.values()))
+                if analysis_type is None or entry['analysis_type'] == analysis_type
+            ]
+            page = [_summary(entry) for entry in entries[offset:offset + limit]]
+        return len(entries), page
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._runs.get(run_id)
+            return _summary(entry) if entry else None
+
+    def read_records(self, run_id: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Read every record of a run by seeking to its indexed spans.
+
+        Returns:
+            Records in write order, or None if the run isn't indexed
+        """
+        with self._lock:
+            entry = self._runs.get(run_id)
+            if entry is None:
+                return None
+            chunks = []
+            for filename, offset, length, compressed in entry['spans']:
+                with open(self._path(filename), 'rb') as f:
+                    f.seek(offset)
+                    data = f.read(length)
+                chunks.append(gzip.decompress(data) if compressed else data)
+
+        records = []
+        for data in chunks:
+            for line in data.splitlines():
+                record = loads(line)
+                if record.get('run_id') == run_id:
+                    records.append(record)
+        return records
+
+
+def _summary(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in entry.items() if key != 'spans'}
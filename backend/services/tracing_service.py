@@ -0,0 +1,436 @@
+"""
+Tracing Service - Request-scoped trace spans exported as OTLP JSON
+Every API request gets a trace tagged with a run id (the X-Run-Id request header, or
+the analysis run id once one is assigned). Spans are opened with span() around the
+parse, queue, LLM, retry and database stages; the current span lives in a context
+variable, and traced_task() carries it into thread pool workers.
+
+Finished traces are written to logs/traces.jsonl by the background log writer, one
+OTLP/JSON ExportTraceServiceRequest per line (the format of the OpenTelemetry
+collector's file exporter). Time spent per stage is summarized in the Server-Timing
+response header.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import g, request
+
+from services.json_service import dumps
+
+
+# Set TRACE_EXPORT=0 to keep Server-Timing headers but skip writing traces.jsonl
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', '1').strip().lower() not in ('0', 'false', 'no')
+
+TRACE_LOG_FILENAME = 'traces.jsonl'
+
+SERVICE_NAME = 'lifecycle-checker-backend'
+
+# Stages summarized in Server-Timing, in header order
+STAGES = ('parse', 'queue', 'llm', 'retry', 'log', 'db')
+
+# OTLP span kinds and status codes
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar('current_span', default=None)
+
+
+class Trace:
+    """
+    Spans of one request. Exported once every span has ended
+    (streamed responses keep spans open after the request itself returns).
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.stage_seconds: Dict[str, float] = {}
+        self._spans: List["Span"] = []
+        self._open = 0
+        self._lock = threading.Lock()
+
+    def set_run_id(self, run_id: str):
+        self.run_id = run_id
+
+    def add_stage_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def stage_milliseconds(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(seconds * 1000, 1) for stage, seconds in self.stage_seconds.items()}
+
+    def server_timing(self, total_seconds: Optional[float] = None) -> str:
+        """
+        Server-Timing header value, e.g. "parse;dur=812.4, db;dur=35.0, total;dur=901.2".
+        """
+        milliseconds = self.stage_milliseconds()
+        entries = [f"{stage};dur={milliseconds[stage]}" for stage in STAGES if stage in milliseconds]
+        if total_seconds is not None:
+            entries.append(f"total;dur={round(total_seconds * 1000, 1)}")
+        return ', '.join(entries)
+
+    def _opened(self):
+        with self._lock:
+            self._open += 1
+
+    def _closed(self, span: "Span"):
+        with self._lock:
+            self._spans.append(span)
+            self._open -= 1
+            finished = self._open == 0
+            spans = self._spans if finished else None
+            if finished:
+                self._spans = []
+        if finished:
+            _export(self, spans)
+
+
+class Span:
+    """
+    A timed operation in a trace. Durations of spans with a stage count toward that
+    stage, unless an enclosing span already counts the same stage.
+    """
+
+    def __init__(
+        self,
+        trace: Trace,
+        name: str,
+        parent: Optional["Span"] = None,
+        stage: Optional[str] = None,
+        kind: int = _KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None
+    ):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status_code = _STATUS_OK
+        self.status_message = ''
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._start = time.perf_counter()
+        self.duration = 0.0
+
+        # Count the stage once, at the outermost span of that stage
+        self.stage = stage
+        self.stage_counted = False
+        if stage:
+            ancestor = parent
+            while ancestor is not None and ancestor.stage != stage:
+                ancestor = ancestor.parent
+            self.stage_counted = ancestor is None
+        trace._opened()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.status_code = _STATUS_ERROR
+        self.status_message = str(error).strip().split('\n')[0][:500]
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        self.end_ns = time.time_ns()
+        if self.stage_counted:
+            self.trace.add_stage_time(self.stage, self.duration)
+        self.trace._closed(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes({
+                **({"lifecycle.stage": self.stage} if self.stage else {}),
+                **({"lifecycle.run_id": self.trace.run_id} if self.parent is None else {}),
+                **self.attributes
+            }),
+            "status": {"code": self.status_code, **({"message": self.status_message} if self.status_message else {})}
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class _OtlpRequest:
+    """
+    ExportTraceServiceRequest for one trace, serialized only by the writer thread.
+    """
+
+    __slots__ = ('trace', 'spans')
+
+    def __init__(self, trace: Trace, spans: List[Span]):
+        self.trace = trace
+        self.spans = spans
+
+    def __str__(self) -> str:
+        return dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{
+                    "scope": {"name": "lifecycle.tracing"},
+                    "spans": [span.to_otlp() for span in self.spans]
+                }]
+            }]
+        }).decode('utf-8')
+
+
+_trace_logger: Optional[logging.Logger] = None
+_trace_listener: Optional[logging.handlers.QueueListener] = None
+_trace_logger_lock = threading.Lock()
+
+
+def _get_trace_logger() -> logging.Logger:
+    global _trace_logger, _trace_listener
+    with _trace_logger_lock:
+        if _trace_logger is None:
+            # Imported here: analysis_logger records its own time through this module
+            from services.analysis_logger import get_log_directory, attach_background_file_handler
+
+            logger = logging.getLogger('lifecycle_traces')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.handlers = []
+
+            # Same rotation and compression as debug.log
+            _trace_listener = attach_background_file_handler(
+                logger, os.path.join(get_log_directory(), TRACE_LOG_FILENAME), logging.Formatter('%(message)s')
+            )
+            atexit.register(_trace_listener.stop)
+            _trace_logger = logger
+        return _trace_logger
+
+
+def _export(trace: Trace, spans: List[Span]):
+    if not TRACE_EXPORT or not spans:
+        return
+    try:
+        _get_trace_logger().info(_OtlpRequest(trace, spans))
+    except Exception as e:
+        print(f"Failed to export trace: {e}")
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace() -> Optional[Trace]:
+    span = _current_span.get()
+    return span.trace if span is not None else None
+
+
+class span:
+    """
+    Context manager (or decorator) timing a child of the current span.
+    Does nothing when there is no active trace.
+
+    Usage:
+        with span('excel.parse', stage='parse', filename=filename):
+            ...
+    """
+
+    def __init__(self, name: str, stage: Optional[str] = None, **attributes):
+        self.name = name
+        self.stage = stage
+        self.attributes = attributes
+        self._span: Optional[Span] = None
+        self._token = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        self._span = Span(parent.trace, self.name, parent, self.stage, attributes=self.attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is None:
+            return False
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self._span.set_error(exc)
+        self._span.end()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Generators can resume in another context; fall back to the parent
+            _current_span.set(self._span.parent)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        name, stage, attributes = self.name, self.stage, self.attributes
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with span(name, stage, **attributes):
+                    yield from func(*args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, stage, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class activate:
+    """
+    Make a span current (e.g. a request's root span inside its SSE generator,
+    which runs after the request context is gone).
+    """
+
+    def __init__(self, parent: Optional[Span]):
+        self.parent = parent
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self.parent)
+        return self.parent
+
+    def __exit__(self, *exc_info):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            _current_span.set(None)
+        return False
+
+
+def record_stage(stage: str, seconds: float):
+    """
+    Add time to a stage of the current trace without creating a span
+    (for frequent, short operations like single database statements).
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.trace.add_stage_time(stage, seconds)
+
+
+def stage_timing() -> Dict[str, float]:
+    """
+    Milliseconds per stage so far in the current trace (for the final event of a stream,
+    whose headers were sent before the work ran).
+    """
+    trace = current_trace()
+    return trace.stage_milliseconds() if trace is not None else {}
+
+
+def stream_in_span(generator, name: str, **attributes):
+    """
+    Run a streamed response's generator under the request's span, in a span of its own.
+    Flask pops the request context before the stream is consumed, so the parent span
+    is captured here, while the request is still active.
+    """
+    parent = current_span()
+
+    def traced_stream():
+        with activate(parent):
+            with span(name, **attributes):
+                yield from generator
+    return traced_stream()
+
+
+def traced_task(func: Callable) -> Callable:
+    """
+    Wrap a function submitted to a thread pool so it runs under the submitting
+    span, recording the time it waited for a worker as a "queue" span.
+    """
+    context = contextvars.copy_context()
+    parent = context.get(_current_span)
+    submitted_ns = time.time_ns()
+    submitted = time.perf_counter()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if parent is not None:
+            waited = Span(parent.trace, 'queue.wait', parent, 'queue')
+            waited.start_ns = submitted_ns
+            waited._start = submitted
+            waited.end()
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def set_run_id(run_id: str):
+    """
+    Tag the current trace with a run id (e.g. the analysis run id).
+    """
+    trace = current_trace()
+    if trace is not None:
+        trace.set_run_id(run_id)
+
+
+def init_tracing(app):
+    """
+    Open a trace per request and add Server-Timing and X-Run-Id response headers.
+    """
+
+    @app.before_request
+    def _start_request_trace():
+        trace = Trace(request.headers.get('X-Run-Id'))
+        root = Span(trace, f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+                    kind=_KIND_SERVER, attributes={
+                        "http.request.method": request.method,
+                        "url.path": request.path,
+                        "http.route": request.url_rule.rule if request.url_rule else None
+                    })
+        g._trace_root = root
+        g._trace_token = _current_span.set(root)
+
+    @app.after_request
+    def _add_timing_headers(response):
+        root = g.get('_trace_root')
+        if root is not None:
+            response.headers['Server-Timing'] = root.trace.server_timing(time.perf_counter() - root._start)
+            response.headers['Timing-Allow-Origin'] = '*'
+            response.headers['X-Run-Id'] = root.trace.run_id
+            root.set_attribute('http.response.status_code', response.status_code)
+        return response
+
+    @app.teardown_request
+    def _end_request_trace(error=None):
+        root = g.pop('_trace_root', None)
+        if root is None:
+            return
+        if error is not None:
+            root.set_error(error)
+        root.end()
+        token = g.pop('_trace_token', None)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                _current_span.set(None)
@@ -0,0 +1,296 @@
+"""
+Write-Behind Service - Persists analysis results from the pipeline in the background
+Chunks are queued as they complete and a single worker thread writes them to the
+parts table with batched updates on part_key, so the analysis stream never waits on
+the database and results are kept even if the user never clicks Save.
+
+Rows are keyed by the product the user submitted, not the part number the agent
+returned, and only parts that already exist are updated: a result never creates a
+part, since it would have no machine link.
+"""
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services.cache_service import invalidate_for_parts
+from services.metrics_service import Counter, Histogram, register_collector
+
+try:
+    from sqlalchemy import bindparam, select, update
+    from database.db_config import get_db_session
+    from database.models import Part
+    from database.part_key import product_part_key
+    DB_AVAILABLE = True
+except ImportError:
+    DB_AVAILABLE = False
+
+
+# Rows per update statement or key lookup
+UPDATE_BATCH_SIZE = 500
+
+# Maximum rows the worker coalesces from the queue into one transaction
+MAX_ROWS_PER_FLUSH = 2000
+
+WRITE_BEHIND_ROWS = Counter(
+    'lifecycle_write_behind_rows_total', 'Result rows handled by the write-behind worker, by outcome.', ('outcome',)
+)
+WRITE_BEHIND_FLUSH_SECONDS = Histogram(
+    'lifecycle_write_behind_flush_duration_seconds', 'Duration of one write-behind flush transaction.'
+)
+
+# Result fields written for each analysis type: {part column: result key}
+ANALYSIS_COLUMNS = {
+    'ai_status': 'ai_status',
+    'notes_by_ai': 'notes_by_ai',
+    'ai_confidence': 'ai_confidence',
+}
+
+REPLACEMENT_COLUMNS = {
+    'recommended_replacement': 'recommended_replacement',
+    'replacement_manufacturer': 'replacement_manufacturer',
+    'replacement_price': 'price',
+    'replacement_currency': 'currency',
+    'replacement_source_type': 'source_type',
+    'replacement_source_url': 'source_url',
+    'replacement_notes': 'notes',
+    'replacement_confidence': 'confidence',
+}
+
+
+# Row keys that identify the part rather than carry a result
+ROW_IDENTITY_COLUMNS = frozenset(('part_key',))
+
+
+def _result_to_row(
+    result: Dict[str, Any],
+    product: Optional[Dict[str, Any]],
+    columns: Dict[str, str]
+) -> Optional[Dict[str, Any]]:
+    """
+    Map an analysis or replacement result to a parts row keyed by the part key of
+    the submitted product it answers.
+    Result fields without a value are left out, so they never clear saved data.
+    Returns None when the product is unknown or has no key, or the result has no values.
+    """
+    part_key = product_part_key(product) if product is not None else ''
+    if not part_key:
+        return None
+
+    values = {column: result.get(key) for column, key in columns.items() if result.get(key) is not None}
+    if 'replacement_price' in values:
+        try:
+            values['replacement_price'] = float(values['replacement_price'])
+        except (TypeError, ValueError):
+            del values['replacement_price']
+    if not values:
+        return None
+
+    return {'part_key': part_key, **values}
+
+
+class WriteBehindRun:
+    """
+    Tracks the results one analysis request handed to the write-behind queue.
+    """
+
+    def __init__(self, analysis_type: str):
+        self.analysis_type = analysis_type
+        self.columns = REPLACEMENT_COLUMNS if analysis_type == 'replacements' else ANALYSIS_COLUMNS
+        self.submitted_rows = 0
+        self.persisted_rows = 0
+        self.failed_rows = 0
+        self.skipped_rows = 0
+        self.errors: List[str] = []
+        self._pending: Dict[int, Tuple[float, int]] = {}
+        self._next_job_id = 0
+        self._condition = threading.Condition()
+
+    def submit(self, pairs: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]):
+        """
+        Queue a completed chunk's results for persistence (never blocks on the database).
+
+        Args:
+            pairs: (result, submitted product it answers), as from ChunkPlan.pair
+        """
+        rows = []
+        for result, product in pairs or []:
+            row = _result_to_row(result, product, self.columns) if isinstance(result, dict) else None
+            if row is None:
+                self.skipped_rows += 1
+            else:
+                rows.append(row)
+        if not rows:
+            return
+
+        with self._condition:
+            self._next_job_id += 1
+            job_id = self._next_job_id
+            self._pending[job_id] = (time.monotonic(), len(rows))
+            self.submitted_rows += len(rows)
+        write_behind_queue.put(self, job_id, rows)
+
+    def _complete(self, job_id: int, error: Optional[str] = None, unknown_rows: int = 0):
+        with self._condition:
+            _, row_count = self._pending.pop(job_id, (None, 0))
+            if error:
+                self.failed_rows += row_count
+                self.errors.append(error)
+            else:
+                # Rows of parts that aren't in the database yet are skipped
+                self.persisted_rows += row_count - unknown_rows
+                self.skipped_rows += unknown_rows
+            self._condition.notify_all()
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Get persistence progress; lag_seconds is the age of the oldest unwritten chunk.
+        """
+        with self._condition:
+            oldest = min((queued_at for queued_at, _ in self._pending.values()), default=None)
+            return {
+                "submitted_rows": self.submitted_rows,
+                "persisted_rows": self.persisted_rows,
+                "pending_rows": sum(row_count for _, row_count in self._pending.values()),
+                "failed_rows": self.failed_rows,
+                "skipped_rows": self.skipped_rows,
+                "lag_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                "errors": list(self.errors[-5:])
+            }
+
+    def wait(self, timeout: float = 30.0) -> Dict[str, Any]:
+        """
+        Wait until every submitted chunk has been written (or the timeout expires).
+
+        Returns:
+            Final status
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        return self.status()
+
+
+class WriteBehindQueue:
+    """
+    Single background worker that drains queued chunks into batched updates.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[WriteBehindRun, int, List[Dict[str, Any]]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def put(self, run: WriteBehindRun, job_id: int, rows: List[Dict[str, Any]]):
+        self._ensure_worker()
+        self._queue.put((run, job_id, rows))
+
+    def pending_jobs(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            row_count = len(jobs[0][2])
+            # Coalesce whatever else is already waiting into the same transaction
+            while row_count < MAX_ROWS_PER_FLUSH:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                row_count += len(job[2])
+
+            error = None
+            unknown_keys: Set[str] = set()
+            try:
+                with WRITE_BEHIND_FLUSH_SECONDS.time():
+                    unknown_keys = self._write(jobs)
+                unknown_count = sum(1 for _, _, rows in jobs for row in rows if row['part_key'] in unknown_keys)
+                WRITE_BEHIND_ROWS.inc(('persisted',), row_count - unknown_count)
+                WRITE_BEHIND_ROWS.inc(('unknown_part',), unknown_count)
+            except Exception as e:
+                message = str(e).strip().splitlines()
+                error = f"Write-behind persistence failed: {message[0] if message else type(e).__name__}"
+                print(f"Warning: {error}")
+                WRITE_BEHIND_ROWS.inc(('failed',), row_count)
+
+            for run, job_id, rows in jobs:
+                run._complete(job_id, error, sum(1 for row in rows if row['part_key'] in unknown_keys))
+
+    def _write(self, jobs: List[Tuple[WriteBehindRun, int, List[Dict[str, Any]]]]) -> Set[str]:
+        """
+        Update the parts the rows belong to.
+
+        Returns:
+            Part keys with no part in the database (their rows are not written)
+        """
+        if not DB_AVAILABLE:
+            raise RuntimeError("Database not available")
+
+        # Merge rows per part (later results win column by column)
+        rows_by_key: Dict[str, Dict[str, Any]] = {}
+        for _, _, rows in jobs:
+            for row in rows:
+                rows_by_key.setdefault(row['part_key'], {}).update(row)
+        part_keys = list(rows_by_key)
+
+        parts = Part.__table__
+        session = get_db_session()
+        try:
+            ids_by_key: Dict[str, int] = {}
+            for start in range(0, len(part_keys), UPDATE_BATCH_SIZE):
+                ids_by_key.update(session.execute(
+                    select(parts.c.part_key, parts.c.id)
+                    .where(parts.c.part_key.in_(part_keys[start:start + UPDATE_BATCH_SIZE]))
+                ).all())
+
+            # One executemany UPDATE per column set, so only the columns a result
+            # has values for are overwritten
+            rows_by_columns: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+            for part_key, row in rows_by_key.items():
+                if part_key not in ids_by_key:
+                    continue
+                columns = tuple(sorted(set(row) - ROW_IDENTITY_COLUMNS))
+                rows_by_columns.setdefault(columns, []).append(
+                    {"b_id": ids_by_key[part_key], **{f"b_{column}": row[column] for column in columns}}
+                )
+            for columns, rows in rows_by_columns.items():
+                # Invalidate the saved-content fingerprint (see database/content_hash.py)
+                stmt = update(parts).where(parts.c.id == bindparam('b_id')).values(
+                    content_hash=None, **{column: bindparam(f"b_{column}") for column in columns}
+                )
+                for start in range(0, len(rows), UPDATE_BATCH_SIZE):
+                    session.execute(stmt, rows[start:start + UPDATE_BATCH_SIZE])
+            session.commit()
+
+            if ids_by_key:
+                invalidate_for_parts(session, list(ids_by_key.values()))
+            return set(part_keys) - set(ids_by_key)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+write_behind_queue = WriteBehindQueue()
+
+
+def _collect_write_behind_metrics():
+    yield ('lifecycle_write_behind_queued_jobs', 'gauge', 'Chunks waiting for the write-behind worker.', [
+        ({}, write_behind_queue.pending_jobs())
+    ])
+
+
+register_collector(_collect_write_behind_metrics)
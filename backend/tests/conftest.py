@@ -0,0 +1,8 @@
+"""
+Shared test setup: make the backend packages importable as they are from app.py
+"""
+import os
+import sys
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, backend_dir)
@@ -0,0 +1,116 @@
+"""
+Tests for cache invalidation order in services/cache_service.py
+"""
+import pytest
+
+from services import cache_service
+
+
+class _FakeQuery:
+    def __init__(self, rows, error=None):
+        self.rows = rows
+        self.error = error
+
+    def filter(self, *args):
+        return self
+
+    def distinct(self):
+        return self
+
+    def all(self):
+        if self.error:
+            raise self.error
+        return self.rows
+
+
+class _FakeSession:
+    def __init__(self, machine_ids, error=None):
+        self.machine_ids = machine_ids
+        self.error = error
+
+    def query(self, *columns):
+        return _FakeQuery([(machine_id,) for machine_id in self.machine_ids], self.error)
+
+
+@pytest.fixture(autouse=True)
+def loaded_summaries():
+    with cache_service._machine_summaries_lock:
+        cache_service._machine_summaries.clear()
+        cache_service._machine_summaries_loaded = True
+        cache_service._dirty_machine_ids.clear()
+    yield
+
+
+@pytest.fixture
+def bump_observer(monkeypatch):
+    """
+    Record the summary invalidation state at the moment the data version is bumped.
+    """
+    seen = []
+    original = cache_service.bump_data_version
+
+    def observe():
+        seen.append((set(cache_service._dirty_machine_ids), cache_service._machine_summaries_loaded))
+        return original()
+
+    monkeypatch.setattr(cache_service, 'bump_data_version', observe)
+    return seen
+
+
+def test_summaries_are_dirty_before_the_version_bump(bump_observer):
+    version = cache_service.get_data_version()
+
+    cache_service.invalidate_for_parts(_FakeSession([3, 4]), [10, 11], machine_ids=[7])
+
+    assert bump_observer == [({3, 4, 7}, True)]
+    assert cache_service.get_data_version() == version + 1
+
+
+def test_failed_machine_lookup_invalidates_everything_then_bumps(bump_observer):
+    version = cache_service.get_data_version()
+
+    cache_service.invalidate_for_parts(_FakeSession([], error=RuntimeError('db down')), [10])
+
+    assert bump_observer == [(set(), False)]
+    assert cache_service.get_data_version() == version + 1
+
+
+def test_bump_without_parts_only_marks_given_machines(bump_observer):
+    cache_service.invalidate_for_parts(_FakeSession([99]), [], machine_ids=[5])
+
+    assert bump_observer == [({5}, True)]
+
+
+def test_dirty_summaries_are_reloaded_on_next_read():
+    cache_service._machine_summaries.update({1: {"parts_count": 1}, 2: {"parts_count": 2}})
+    cache_service.invalidate_machine_summaries([2])
+    requested = []
+
+    def loader(machine_ids):
+        requested.append(machine_ids)
+        return {2: {"parts_count": 20}}
+
+    summaries = cache_service.get_machine_summaries(loader)
+
+    assert requested == [[2]]
+    assert summaries == {1: {"parts_count": 1}, 2: {"parts_count": 20}}
+
+
+def test_response_computed_before_a_write_is_not_cached():
+    cache = cache_service.ResponseCache()
+    version = cache_service.get_data_version()
+    cache_service.bump_data_version()
+
+    entry = cache.set('key', version, b'{"stale": true}')
+
+    assert entry["etag"]
+    assert cache.get('key') is None
+
+
+def test_response_is_served_until_the_next_write():
+    cache = cache_service.ResponseCache()
+    cache.set('key', cache_service.get_data_version(), b'{}')
+
+    assert cache.get('key')["body"] == b'{}'
+    cache_service.bump_data_version()
+    assert cache.get('key') is None
@@ -0,0 +1,121 @@
+"""
+Tests for services/chunk_controller.py
+"""
+import pytest
+
+from services import chunk_controller
+from services.chunk_controller import (
+    CHUNK_SIZE_INITIAL,
+    CHUNK_SIZE_MIN,
+    CHUNK_TARGET_SECONDS,
+    LLM_CONCURRENCY_INITIAL,
+    LLM_CONCURRENCY_MAX,
+    ChunkController,
+)
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    monkeypatch.setattr(chunk_controller, 'ADAPTIVE_CHUNKING', True)
+    return ChunkController('test')
+
+
+@pytest.fixture
+def fixed(monkeypatch):
+    monkeypatch.setattr(chunk_controller, 'ADAPTIVE_CHUNKING', False)
+    return ChunkController('test')
+
+
+def test_first_chunk_is_small(adaptive):
+    assert adaptive.chunk_size == CHUNK_SIZE_INITIAL
+    assert adaptive.first_chunk_size() == min(chunk_controller.FIRST_CHUNK_SIZE, CHUNK_SIZE_INITIAL)
+
+
+def test_fast_chunks_grow_the_chunk_size(adaptive):
+    adaptive.record_chunk(10, 5.0, fallback=False)
+
+    assert adaptive.chunk_size == CHUNK_SIZE_INITIAL + 1
+    assert adaptive.last_action == 'grow_chunk'
+
+
+def test_slow_chunks_shrink_to_the_latency_target(adaptive):
+    seconds_per_product = 10.0
+    adaptive.record_chunk(10, 10 * seconds_per_product, fallback=False)
+
+    assert adaptive.chunk_size == max(round(CHUNK_TARGET_SECONDS / seconds_per_product), CHUNK_SIZE_MIN)
+    assert adaptive.last_action == 'shrink_chunk'
+
+
+def test_parse_failures_shrink_the_chunk_size(adaptive):
+    adaptive.record_chunk(10, 5.0, fallback=True)
+
+    assert adaptive.chunk_size == round(CHUNK_SIZE_INITIAL * chunk_controller.SHRINK_FACTOR)
+    assert 'parse failure rate' in adaptive.last_reason
+
+
+def test_chunk_size_stays_within_bounds(adaptive):
+    for _ in range(20):
+        adaptive.record_chunk(adaptive.chunk_size, 1000.0, fallback=True)
+
+    assert adaptive.chunk_size == CHUNK_SIZE_MIN
+
+
+def test_concurrency_increases_additively(adaptive):
+    chunks = 0
+    while adaptive.concurrency == LLM_CONCURRENCY_INITIAL:
+        adaptive.record_chunk(10, 5.0, fallback=False)
+        chunks += 1
+
+    # About one more worker per round of on-target chunks
+    assert adaptive.concurrency == LLM_CONCURRENCY_INITIAL + 1
+    assert chunks <= LLM_CONCURRENCY_INITIAL + 1
+
+    for _ in range(200):
+        adaptive.record_chunk(10, 5.0, fallback=False)
+    assert adaptive.concurrency == LLM_CONCURRENCY_MAX
+
+
+def test_fallback_chunks_do_not_increase_concurrency(adaptive):
+    for _ in range(10):
+        adaptive.record_chunk(3, 1.0, fallback=True)
+
+    assert adaptive.concurrency == LLM_CONCURRENCY_INITIAL
+
+
+def test_throttle_halves_concurrency_once_per_cooldown(adaptive, monkeypatch):
+    adaptive.record_throttle()
+    halved = adaptive.concurrency
+    adaptive.record_throttle()
+
+    assert halved == int(LLM_CONCURRENCY_INITIAL * chunk_controller.BACKOFF_FACTOR)
+    assert adaptive.concurrency == halved
+    assert adaptive.last_action == 'decrease_concurrency'
+
+    monkeypatch.setattr(chunk_controller, 'THROTTLE_COOLDOWN_SECONDS', 0.0)
+    adaptive.record_throttle()
+    assert adaptive.concurrency < halved
+
+
+def test_decisions_bump_the_version(adaptive):
+    version = adaptive.version
+    adaptive.record_chunk(10, 5.0, fallback=False)
+
+    assert adaptive.version > version
+    assert adaptive.snapshot()["action"] == adaptive.last_action
+
+
+def test_fixed_mode_ignores_feedback(fixed):
+    fixed.record_chunk(10, 1000.0, fallback=True)
+    fixed.record_throttle()
+
+    assert fixed.chunk_size == CHUNK_SIZE_INITIAL
+    assert fixed.first_chunk_size() == CHUNK_SIZE_INITIAL
+    assert fixed.concurrency == LLM_CONCURRENCY_INITIAL
+    assert fixed.version == 0
+
+
+def test_replay_mode_reports_why_chunking_is_fixed(monkeypatch):
+    monkeypatch.setattr(chunk_controller, 'ADAPTIVE_CHUNKING', False)
+    monkeypatch.setattr(chunk_controller, 'REPLAY_MODE', True)
+
+    assert ChunkController('test').last_reason == 'fixed (LLM_ARCHIVE_MODE=replay)'
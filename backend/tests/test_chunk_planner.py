@@ -0,0 +1,235 @@
+"""
+Tests for services/chunk_planner.py
+"""
+from database.part_key import make_part_key
+from services.chunk_planner import (
+    BOOSTED_PRIORITY,
+    DEFAULT_CRITICALITY_WEIGHTS,
+    ChunkPlan,
+    criticality,
+    estimate_tokens,
+    parse_criticality_weights,
+)
+
+
+def _product(manufacturer, part_number, **fields):
+    return dict(fields, part_manufacturer=manufacturer, manufacturer_part_number=part_number)
+
+
+def _parts(chunk):
+    return [product['manufacturer_part_number'] for product in chunk]
+
+
+def _drain(plan, max_products):
+    chunks = []
+    while plan.remaining():
+        chunk, _ = plan.next_chunk(max_products)
+        chunks.append(chunk)
+    return chunks
+
+
+def test_duplicates_are_sent_once():
+    products = [
+        _product('Allen Bradley', '045136'),
+        _product('ALLEN-BRADLEY', '45136'),
+        _product('Siemens', '6ES7-214'),
+        _product('allen bradley', ' 45136 '),
+    ]
+    plan = ChunkPlan(products)
+
+    assert plan.unique_products == 2
+    assert plan.duplicate_products == 2
+    assert [product is products[0] for product in plan.next_chunk(10)[0]] == [True, False]
+
+
+def test_products_without_a_key_are_never_merged():
+    plan = ChunkPlan([_product('', '1'), _product('', '1'), _product('SMC', '')])
+
+    assert plan.unique_products == 3
+
+
+def test_manufacturers_stay_in_consecutive_chunks():
+    products = [_product('ABB' if i % 2 else 'SMC', str(1000 + i)) for i in range(8)]
+    plan = ChunkPlan(products)
+
+    chunks = _drain(plan, 4)
+
+    assert [{product['part_manufacturer'] for product in chunk} for chunk in chunks] == [{'SMC'}, {'ABB'}]
+
+
+def test_small_groups_fill_the_room_left_in_a_chunk():
+    products = [_product('SMC', str(1000 + i)) for i in range(3)] + [
+        _product('ABB', str(2000 + i)) for i in range(5)] + [_product('Festo', '3000')]
+    plan = ChunkPlan(products)
+
+    first, _ = plan.next_chunk(4)
+
+    # The Festo part fits beside the SMC group; the ABB group does not
+    assert _parts(first) == ['1000', '1001', '1002', '3000']
+    assert [_parts(chunk) for chunk in _drain(plan, 4)] == [['2000', '2001', '2002', '2003'], ['2004']]
+
+
+def test_chunks_respect_the_token_budget():
+    products = [_product('ABB', str(1000 + i)) for i in range(7)]
+    per_product = estimate_tokens(products[0])
+    plan = ChunkPlan(products, token_budget=3 * per_product)
+
+    assert plan.estimate_chunks(25) == 3
+    assert [len(chunk) for chunk in _drain(plan, 25)] == [3, 3, 1]
+
+
+def test_a_product_over_budget_is_still_sent():
+    plan = ChunkPlan([_product('ABB', '1000'), _product('ABB', '1001')], token_budget=1)
+
+    assert [len(chunk) for chunk in _drain(plan, 25)] == [1, 1]
+
+
+def test_results_fan_out_to_duplicates_with_their_own_spelling():
+    products = [_product('Allen Bradley', '045136'), _product('ALLEN-BRADLEY', '45136'), _product('SMC', 'X1')]
+    plan = ChunkPlan(products)
+    chunk, _ = plan.next_chunk(10)
+    results = [
+        {'manufacturer': 'Allen Bradley', 'part_number': '045136', 'ai_status': 'Active'},
+        {'manufacturer': 'SMC', 'part_number': 'X1', 'ai_status': 'Obsolete'},
+    ]
+
+    fanned = plan.fan_out(results, chunk)
+
+    assert fanned[:2] == results
+    assert fanned[2] == {'manufacturer': 'ALLEN-BRADLEY', 'part_number': '45136', 'ai_status': 'Active'}
+
+
+def test_replacement_results_keep_their_obsolete_part_field():
+    plan = ChunkPlan([_product('SMC', '0042'), _product('SMC', '42')], agent='replacement')
+    result = {'manufacturer': 'SMC', 'obsolete_part_number': '0042', 'recommended_replacement': 'X2'}
+
+    copy = plan.fan_out([result])[1]
+
+    assert copy['obsolete_part_number'] == '42'
+    assert 'part_number' not in copy
+
+
+def test_rewritten_part_numbers_fan_out_by_chunk_position():
+    products = [_product('SMC', 'ab 12'), _product('SMC', 'AB12'), _product('ABB', 'Q-1'), _product('ABB', 'q-1')]
+    plan = ChunkPlan(products)
+    chunk, _ = plan.next_chunk(10)
+    # The agent returned corrected part numbers for both parts
+    results = [
+        {'manufacturer': 'SMC', 'part_number': 'AB-12', 'ai_status': 'Active'},
+        {'manufacturer': 'ABB', 'part_number': 'Q1', 'ai_status': 'Obsolete'},
+    ]
+
+    fanned = plan.fan_out(results, chunk)
+
+    assert [(copy['part_number'], copy['ai_status']) for copy in fanned[2:]] == [('AB12', 'Active'), ('q-1', 'Obsolete')]
+
+
+def test_unmatched_results_are_not_guessed_when_counts_differ():
+    products = [_product('SMC', 'A1'), _product('SMC', 'a1'), _product('SMC', 'B2'), _product('SMC', 'b2')]
+    plan = ChunkPlan(products)
+    chunk, _ = plan.next_chunk(10)
+    results = [{'manufacturer': 'SMC', 'part_number': 'A-1'}]
+
+    assert plan.fan_out(results, chunk) == results
+
+
+def test_criticality_counts_only_yes_answers():
+    assert criticality(_product('SMC', '1', will_failure_stop_machine='Yes')) == 3.0
+    assert criticality(_product('SMC', '1', will_failures_stop_machine='yes', is_part_likely_to_fail='YES')) == 5.0
+    assert criticality(_product('SMC', '1', will_failure_stop_machine='No', is_part_likely_to_fail='maybe')) == 0.0
+    # Stocking decisions only break ties
+    assert criticality(_product('SMC', '1', stocking_decision='Yes')) == 0.0
+
+
+def test_weights_spec():
+    assert parse_criticality_weights('') == DEFAULT_CRITICALITY_WEIGHTS
+    assert parse_criticality_weights('none') == {}
+    assert parse_criticality_weights('is_part_likely_to_fail=5, unknown=1, will_failure_stop_machine=x') == {
+        'is_part_likely_to_fail': 5.0
+    }
+
+
+def test_critical_parts_go_first_and_stocked_parts_break_ties():
+    products = [
+        _product('SMC', '1'),
+        _product('SMC', '2', stocking_decision='Yes'),
+        _product('SMC', '3', is_part_likely_to_fail='Yes'),
+        _product('SMC', '4', will_failure_stop_machine='Yes'),
+        _product('SMC', '5', is_part_likely_to_fail='Yes', stocking_decision='Stock'),
+        _product('SMC', '6', will_failure_stop_machine='Yes', is_part_likely_to_fail='Yes'),
+    ]
+    plan = ChunkPlan(products)
+
+    assert plan.critical_products == 4
+    chunk, priority = plan.next_chunk(10)
+
+    assert _parts(chunk) == ['6', '4', '5', '3', '2', '1']
+    assert priority == 5.0
+    assert plan.critical_count(chunk) == 4
+
+
+def test_lower_ranks_never_overtake_a_split_group():
+    products = [_product('SMC', str(i), is_part_likely_to_fail='Yes') for i in range(3)] + [_product('ABB', '9')]
+    plan = ChunkPlan(products)
+
+    assert [(_parts(chunk), priority) for chunk, priority in (plan.next_chunk(2), plan.next_chunk(2))] == [
+        (['0', '1'], 2.0), (['2', '9'], 2.0)
+    ]
+
+
+def test_boosted_rows_go_ahead_of_critical_ones():
+    products = [
+        _product('ABB', '1', will_failure_stop_machine='Yes'),
+        _product('SMC', '2'),
+        _product('Festo', '3'),
+        _product('SMC', '4'),
+    ]
+    plan = ChunkPlan(products)
+
+    assert plan.boost([make_part_key('SMC', '4'), make_part_key('Nobody', '9'), '']) == 1
+    assert plan.boost([make_part_key('Festo', '3')]) == 1
+    assert plan.next_chunk(1) == ([products[3]], BOOSTED_PRIORITY)
+    assert plan.next_chunk(1) == ([products[2]], BOOSTED_PRIORITY)
+    assert _parts(plan.next_chunk(10)[0]) == ['1', '2']
+
+
+def test_boosting_sent_rows_does_nothing():
+    plan = ChunkPlan([_product('SMC', '1'), _product('SMC', '2')])
+    plan.next_chunk(1)
+
+    assert plan.boost([make_part_key('SMC', '1')]) == 0
+    assert plan.boost([make_part_key('SMC', '2')]) == 1
+
+
+def test_rewritten_result_is_not_copied_to_another_parts_duplicates():
+    products = [_product('SMC', 'A1'), _product('SMC', 'B2'), _product('SMC', 'b2')]
+    plan = ChunkPlan(products)
+    chunk, _ = plan.next_chunk(10)
+    # A's part number was rewritten and B's result is missing
+    results = [{'manufacturer': 'SMC', 'part_number': 'A-1', 'ai_status': 'Active'}]
+
+    assert plan.fan_out(results, chunk) == results
+
+
+def test_results_are_paired_with_the_products_they_answer():
+    products = [_product('SMC', 'A1'), _product('SMC', 'B2'), _product('SMC', 'b2')]
+    plan = ChunkPlan(products)
+    chunk, _ = plan.next_chunk(10)
+    results = [
+        {'manufacturer': 'SMC', 'part_number': 'B-2', 'ai_status': 'Obsolete'},
+        {'manufacturer': 'SMC', 'part_number': 'A1', 'ai_status': 'Active'},
+    ]
+
+    pairs = plan.pair(results, chunk)
+
+    assert [product for _, product in pairs] == [products[1], products[0], products[2]]
+    assert pairs[2][0]['ai_status'] == 'Obsolete'
+
+
+def test_repeated_result_for_one_product_is_not_guessed():
+    products = [_product('SMC', 'A1'), _product('SMC', 'B2'), _product('SMC', 'b2')]
+    plan = ChunkPlan(products)
+    chunk, _ = plan.next_chunk(10)
+    results = [{'manufacturer': 'SMC', 'part_number': 'A1'}, {'manufacturer': 'SMC', 'part_number': 'A1'}]
+
+    assert [product for _, product in plan.pair(results, chunk)] == [products[0], None]
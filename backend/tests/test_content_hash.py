@@ -0,0 +1,52 @@
+"""
+Tests for database/content_hash.py
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from database.content_hash import PART_CONTENT_FIELDS, canonical_value, part_content_hash
+
+
+@pytest.mark.parametrize('written, read_back', [
+    (12.5, Decimal('12.50')),
+    (3, Decimal('3.00')),
+    ('12.50', '12.50'),
+    (date(2024, 5, 1), date(2024, 5, 1)),
+    (datetime(2024, 5, 1, 8, 30), datetime(2024, 5, 1, 8, 30)),
+])
+def test_value_read_back_compares_equal(written, read_back):
+    assert canonical_value(written) == canonical_value(read_back)
+
+
+def test_booleans_are_not_numbers():
+    assert canonical_value(True) == 'True'
+    assert canonical_value(True) != canonical_value(1)
+
+
+def test_none_stays_distinct_from_empty():
+    assert canonical_value(None) is None
+    assert canonical_value('') == ''
+
+
+def test_missing_fields_hash_as_null():
+    assert part_content_hash({}) == part_content_hash({field: None for field in PART_CONTENT_FIELDS})
+
+
+def test_unrelated_fields_do_not_change_the_hash():
+    values = {'part_description': 'Valve', 'min_qty_to_stock': 2}
+
+    assert part_content_hash(values) == part_content_hash(dict(values, id=7, part_key='SMC|1'))
+
+
+def test_content_change_changes_the_hash():
+    values = {'part_description': 'Valve', 'replacement_price': 10}
+
+    assert part_content_hash(values) == part_content_hash({'part_description': 'Valve', 'replacement_price': Decimal('10.00')})
+    assert part_content_hash(values) != part_content_hash(dict(values, replacement_price=10.01))
+    assert part_content_hash(values) != part_content_hash(dict(values, part_description=None))
+
+
+def test_empty_string_and_null_hash_differently():
+    assert part_content_hash({'notes': ''}) != part_content_hash({'notes': None})
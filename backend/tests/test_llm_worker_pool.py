@@ -0,0 +1,161 @@
+"""
+Tests for services/llm_worker_pool.py
+"""
+import threading
+from collections import defaultdict, deque
+
+import pytest
+
+from services import llm_worker_pool
+from services.llm_worker_pool import LANE_WEIGHTS, LLM_POOL_QUANTUM, LLMWorkerPool, lane_for
+
+
+class _Controller:
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    """
+    Concurrency limit per agent, as the chunk controllers would report it.
+    """
+    limits = defaultdict(lambda: 4)
+    monkeypatch.setattr(llm_worker_pool, 'get_chunk_controller', lambda agent: _Controller(limits[agent]))
+    monkeypatch.setattr(llm_worker_pool, 'LLM_INTERACTIVE_RESERVED', 1)
+    return limits
+
+
+@pytest.fixture
+def pool(limits):
+    """
+    Pool without worker threads, so tests dispatch with _next_task() themselves.
+    """
+    pool = LLMWorkerPool.__new__(LLMWorkerPool)
+    pool._cond = threading.Condition()
+    pool._round = deque()
+    pool._in_flight = defaultdict(int)
+    pool._threads = []
+    return pool
+
+
+def _queue(flow, count, cost, agent='analysis'):
+    return [flow.submit(agent, cost, lambda: None) for _ in range(count)]
+
+
+def _dispatch(pool, count):
+    names = []
+    for _ in range(count):
+        task = pool._next_task()
+        names.append(task.flow.name if task else None)
+    return names
+
+
+def test_lane_for_run_size(monkeypatch):
+    monkeypatch.setattr(llm_worker_pool, 'LLM_INTERACTIVE_MAX_PRODUCTS', 50)
+
+    assert lane_for(50) == 'interactive'
+    assert lane_for(51) == 'bulk'
+
+
+def test_bulk_flows_share_the_agent_evenly(pool):
+    first = pool.open_flow('first', 'bulk')
+    second = pool.open_flow('second', 'bulk')
+    cost = max(LLM_POOL_QUANTUM // 2, 1)
+    _queue(first, 20, cost)
+    _queue(second, 20, cost)
+
+    order = _dispatch(pool, 40)
+
+    sent = {'first': 0, 'second': 0}
+    for name in order:
+        sent[name] += cost
+        assert abs(sent['first'] - sent['second']) <= LLM_POOL_QUANTUM
+    assert sent['first'] == sent['second']
+
+
+def test_interactive_flow_is_not_queued_behind_bulk_work(pool):
+    bulk = pool.open_flow('bulk', 'bulk')
+    _queue(bulk, 50, LLM_POOL_QUANTUM)
+    interactive = pool.open_flow('interactive', 'interactive')
+    _queue(interactive, LANE_WEIGHTS['interactive'], LLM_POOL_QUANTUM)
+
+    order = _dispatch(pool, LANE_WEIGHTS['interactive'] + 1)
+
+    assert order.count('interactive') == LANE_WEIGHTS['interactive']
+
+
+def test_bulk_leaves_reserved_slots_for_interactive_runs(pool, limits):
+    limits['analysis'] = 2
+    bulk = pool.open_flow('bulk', 'bulk')
+    _queue(bulk, 3, 1)
+    pool._in_flight['analysis'] = 1
+
+    assert pool._next_task() is None
+
+    interactive = pool.open_flow('interactive', 'interactive')
+    _queue(interactive, 1, 1)
+    assert _dispatch(pool, 1) == ['interactive']
+
+
+def test_reservation_never_blocks_a_single_slot_agent(pool, limits):
+    limits['analysis'] = 1
+    bulk = pool.open_flow('bulk', 'bulk')
+    _queue(bulk, 1, 1)
+
+    assert _dispatch(pool, 1) == ['bulk']
+
+
+def test_flow_at_its_agent_limit_keeps_its_turn(pool, limits):
+    limits['replacement'] = 0
+    blocked = pool.open_flow('blocked', 'bulk')
+    _queue(blocked, 2, 1, agent='replacement')
+    other = pool.open_flow('other', 'bulk')
+    _queue(other, 2, 1)
+
+    assert _dispatch(pool, 3) == ['other', 'other', None]
+    assert list(pool._round) == [blocked]
+
+    limits['replacement'] = 4
+    assert _dispatch(pool, 2) == ['blocked', 'blocked']
+
+
+def test_drained_flow_keeps_no_credit(pool):
+    flow = pool.open_flow('flow', 'interactive')
+    _queue(flow, 1, 1)
+    _dispatch(pool, 1)
+
+    assert flow.deficit == 0
+    assert not flow.scheduled
+    assert not pool._round
+
+
+def test_closing_a_flow_cancels_its_queued_chunks(pool):
+    flow = pool.open_flow('flow', 'bulk')
+    futures = _queue(flow, 3, 1)
+    _dispatch(pool, 1)
+
+    flow.close()
+
+    assert [future.cancelled() for future in futures] == [False, True, True]
+    assert not pool._round
+    with pytest.raises(RuntimeError):
+        flow.submit('analysis', 1, lambda: None)
+
+
+def test_unknown_lane_is_rejected(pool):
+    with pytest.raises(ValueError):
+        pool.open_flow('flow', 'urgent')
+
+
+def test_workers_run_queued_calls(limits):
+    pool = LLMWorkerPool(workers=2)
+
+    with pool.open_flow('flow', 'bulk') as flow:
+        futures = [flow.submit('analysis', 1, pow, 2, n) for n in range(5)]
+        assert [future.result(timeout=5) for future in futures] == [1, 2, 4, 8, 16]
+
+    with pytest.raises(ZeroDivisionError):
+        with pool.open_flow('failing', 'interactive') as flow:
+            flow.submit('analysis', 1, divmod, 1, 0).result(timeout=5)
+    assert pool.snapshot()["queued"] == {'interactive': 0, 'bulk': 0}
@@ -0,0 +1,102 @@
+"""
+Tests for database/migrations.py on a database created before the first migration
+"""
+import pytest
+from sqlalchemy import MetaData, Table, UniqueConstraint, create_engine, inspect, text
+
+from database.migrations import LATEST_VERSION, run_migrations
+from database.models import Base
+
+
+# Tables and parts columns added by migrations after the baseline schema
+LATER_TABLES = ('deleted_records', 'schema_version')
+LATER_PART_COLUMNS = ('part_key', 'content_hash')
+
+BASELINE_CONSTRAINTS = {
+    'parts': [('part_manufacturer', 'manufacturer_part_number')],
+    'machine_parts': [('machine_id', 'part_id')],
+}
+
+
+def _create_baseline_schema(engine):
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        if table.name in LATER_TABLES:
+            continue
+        columns = [
+            column._copy() for column in table.columns
+            if not (table.name == 'parts' and column.name in LATER_PART_COLUMNS)
+        ]
+        constraints = [UniqueConstraint(*names) for names in BASELINE_CONSTRAINTS.get(table.name, [])]
+        Table(table.name, metadata, *columns, *constraints)
+    metadata.create_all(engine)
+
+
+@pytest.fixture
+def baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    _create_baseline_schema(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO machines (id, equipment_id) VALUES (1, 'M1'), (2, 'M2')"))
+        conn.execute(text(
+            "INSERT INTO parts (id, part_manufacturer, manufacturer_part_number, part_description, notes, updated_at) VALUES "
+            "(1, 'Allen Bradley', ' 45136 ', 'Relay', NULL, '2024-01-01 00:00:00'), "
+            "(2, 'ALLEN-BRADLEY', '45136', NULL, 'Keep two spares', '2024-02-01 00:00:00'), "
+            "(3, 'Siemens', '6ES7-214', NULL, NULL, '2024-01-01 00:00:00')"
+        ))
+        conn.execute(text(
+            "INSERT INTO machine_parts (id, machine_id, part_id) VALUES (1, 1, 1), (2, 2, 1), (3, 1, 2), (4, 1, 3)"
+        ))
+    yield engine
+    engine.dispose()
+
+
+def test_baseline_database_with_duplicates_migrates(baseline_engine):
+    assert run_migrations(baseline_engine) == LATEST_VERSION
+
+    with baseline_engine.connect() as conn:
+        parts = conn.execute(text(
+            "SELECT id, part_key, part_description, notes, content_hash FROM parts ORDER BY id"
+        )).all()
+        links = conn.execute(text("SELECT machine_id, part_id FROM machine_parts ORDER BY machine_id")).all()
+
+    # The most recently updated duplicate survives and inherits the missing description
+    assert [tuple(part) for part in parts] == [
+        (2, 'ALLENBRADLEY|45136', 'Relay', 'Keep two spares', None),
+        (3, 'SIEMENS|6ES7-214', None, None, None),
+    ]
+    assert sorted(tuple(link) for link in links) == [(1, 2), (1, 3), (2, 2)]
+    columns = {column['name'] for column in inspect(baseline_engine).get_columns('parts')}
+    assert set(LATER_PART_COLUMNS) <= columns
+
+
+def test_current_schema_skips_migrations(baseline_engine):
+    run_migrations(baseline_engine)
+
+    assert run_migrations(baseline_engine) == LATEST_VERSION
+
+
+def test_keys_from_the_ascii_only_normalization_are_recomputed(baseline_engine):
+    run_migrations(baseline_engine)
+    with baseline_engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO parts (id, part_manufacturer, manufacturer_part_number, part_key, notes, updated_at) VALUES "
+            "(10, 'Müller', 'A1', 'MLLER|A1', NULL, '2024-01-01 00:00:00'), "
+            "(11, 'オムロン', 'X1', NULL, NULL, '2024-01-01 00:00:00'), "
+            "(12, 'Straße', '1', 'STRAE|1', 'Old notes', '2024-01-01 00:00:00'), "
+            "(13, 'STRASSE', '1', 'STRASSE|1', NULL, '2024-03-01 00:00:00')"
+        ))
+        conn.execute(text("INSERT INTO machine_parts (machine_id, part_id) VALUES (2, 12)"))
+        conn.execute(text("UPDATE schema_version SET version = 4"))
+
+    assert run_migrations(baseline_engine) == LATEST_VERSION
+
+    with baseline_engine.connect() as conn:
+        parts = conn.execute(text("SELECT id, part_key, notes FROM parts WHERE id >= 10 ORDER BY id")).all()
+        links = conn.execute(text("SELECT machine_id FROM machine_parts WHERE part_id = 13")).all()
+    assert [tuple(part) for part in parts] == [
+        (10, 'MÜLLER|A1', None),
+        (11, 'オムロン|X1', None),
+        (13, 'STRASSE|1', 'Old notes'),
+    ]
+    assert [tuple(link) for link in links] == [(2,)]
@@ -0,0 +1,76 @@
+"""
+Tests for database/part_key.py
+"""
+import pytest
+
+from database.part_key import make_part_key, normalize_manufacturer, normalize_part_number, product_part_key
+
+
+@pytest.mark.parametrize('manufacturer', ['Allen Bradley', 'ALLEN-BRADLEY', 'allen  bradley', ' Allen.Bradley '])
+def test_manufacturer_variants_share_a_key(manufacturer):
+    assert normalize_manufacturer(manufacturer) == 'ALLENBRADLEY'
+
+
+@pytest.mark.parametrize('part_number, expected', [
+    (' 45136 ', '45136'),
+    ('045136', '45136'),
+    ('000', '0'),
+    ('1756-if8', '1756-IF8'),
+    ('0123-A', '0123-A'),
+    ('6ES7 214-1AG40', '6ES7214-1AG40'),
+])
+def test_part_number_normalization(part_number, expected):
+    assert normalize_part_number(part_number) == expected
+
+
+def test_hyphens_and_dots_stay_significant():
+    assert make_part_key('SMC', 'AB-12') != make_part_key('SMC', 'AB12')
+    assert make_part_key('SMC', 'AB.12') != make_part_key('SMC', 'AB12')
+
+
+@pytest.mark.parametrize('manufacturer, part_number', [
+    ('', '45136'),
+    (None, '45136'),
+    ('Siemens', ''),
+    ('Siemens', None),
+    ('--', '45136'),
+])
+def test_key_is_empty_without_both_sides(manufacturer, part_number):
+    assert make_part_key(manufacturer, part_number) == ''
+
+
+def test_make_part_key_format():
+    assert make_part_key('Allen Bradley', ' 045136 ') == 'ALLENBRADLEY|45136'
+
+
+def test_product_part_key_accepts_both_field_sets():
+    sheet_row = {'part_manufacturer': 'Allen-Bradley', 'manufacturer_part_number': '045136'}
+    result = {'manufacturer': 'allen bradley', 'part_number': '45136'}
+
+    assert product_part_key(sheet_row) == product_part_key(result) == 'ALLENBRADLEY|45136'
+
+
+@pytest.mark.parametrize('manufacturer, expected', [
+    ('オムロン', 'オムロン'),
+    ('Müller', 'MÜLLER'),
+    ('Mu\u0308ller', 'MÜLLER'),
+    ('Straße', 'STRASSE'),
+    ('ＡＢＢ', 'ABB'),
+    ('हिन्दी', 'हिन्दी'),
+])
+def test_non_latin_and_accented_manufacturers_are_kept(manufacturer, expected):
+    assert normalize_manufacturer(manufacturer) == expected
+
+
+def test_accented_names_do_not_collide_with_stripped_ones():
+    assert make_part_key('Müller', 'A1') != make_part_key('Mller', 'A1')
+    assert make_part_key('Müller', 'A1') != make_part_key('Muller', 'A1')
+
+
+def test_non_latin_parts_get_a_key():
+    assert make_part_key('オムロン', 'X1') == 'オムロン|X1'
+    assert make_part_key('オムロン', '０４５１３６') == 'オムロン|45136'
+
+
+def test_case_variants_of_non_latin_letters_share_a_key():
+    assert make_part_key('ΣΙΕΜΕΝΣ', 'ab-1') == make_part_key('σιεμενς', 'AB-1')
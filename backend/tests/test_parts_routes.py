@@ -0,0 +1,30 @@
+"""
+Tests for the request validation in api/parts_routes.py
+"""
+from api.parts_routes import _validate_part_updates
+
+
+def test_rows_without_fields_are_rejected():
+    updates, errors, failed_ids = _validate_part_updates([
+        {'id': 1},
+        {'id': 2, 'replacement_notes': 'x'},
+        {'id': 3},
+        {'id': 3, 'replacement_notes': 'y'},
+    ])
+
+    assert updates == {2: {'replacement_notes': 'x'}, 3: {'replacement_notes': 'y'}}
+    assert failed_ids == [1]
+    assert errors == ['Part with id 1 has no fields to update']
+
+
+def test_an_invalid_row_rejects_its_id_once():
+    updates, errors, failed_ids = _validate_part_updates([
+        {'id': 4, 'replacement_notes': 'ok'},
+        {'id': 4, 'replacement_price': 'ten'},
+        {'id': 4, 'unknown': 1},
+        {'id': 5, 'replacement_price': '12.5'},
+    ])
+
+    assert updates == {5: {'replacement_price': 12.5}}
+    assert failed_ids == [4]
+    assert len(errors) == 2
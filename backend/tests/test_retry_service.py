@@ -0,0 +1,103 @@
+"""
+Tests for services/retry_service.py
+"""
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from services import retry_service
+from services.retry_service import classify_contention_error, run_in_transaction
+
+
+def _operational(*args):
+    return OperationalError('UPDATE parts', {}, Exception(*args))
+
+
+def _integrity(*args):
+    return IntegrityError('INSERT INTO parts', {}, Exception(*args))
+
+
+class _FakeSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retry_service, 'RETRY_BASE_DELAY', 0)
+
+
+@pytest.mark.parametrize('error, kind', [
+    (_operational(1213, 'Deadlock found when trying to get lock'), 'deadlocks'),
+    (_operational('deadlock detected'), 'deadlocks'),
+    (_operational(1205, 'Lock wait timeout exceeded'), 'lock_timeouts'),
+    (_operational('database is locked'), 'lock_timeouts'),
+    (_integrity(1062, "Duplicate entry 'SMC|1' for key 'part_key'"), 'integrity_conflicts'),
+    (_integrity('UNIQUE constraint failed: parts.part_key'), 'integrity_conflicts'),
+])
+def test_contention_errors_are_classified(error, kind):
+    assert classify_contention_error(error) == kind
+
+
+@pytest.mark.parametrize('error', [
+    _operational(2006, 'MySQL server has gone away'),
+    _integrity(1452, 'Cannot add or update a child row: a foreign key constraint fails'),
+    _operational(1062, 'Duplicate entry'),
+    ValueError('deadlock'),
+])
+def test_other_errors_are_not_retryable(error):
+    assert classify_contention_error(error) is None
+
+
+def test_deadlock_is_retried_until_commit():
+    session = _FakeSession()
+    stats = {}
+    attempts = []
+
+    def work(s):
+        attempts.append(s)
+        if len(attempts) < 3:
+            raise _operational(1213, 'Deadlock found')
+        return 'saved'
+
+    assert run_in_transaction(session, work, stats=stats) == 'saved'
+    assert len(attempts) == 3
+    assert session.rollbacks == 2
+    assert session.commits == 1
+    assert stats == {"retries": 2}
+
+
+def test_non_retryable_error_is_raised_after_rollback():
+    session = _FakeSession()
+    calls = []
+
+    def work(s):
+        calls.append(s)
+        raise _operational(2006, 'MySQL server has gone away')
+
+    with pytest.raises(OperationalError):
+        run_in_transaction(session, work)
+    assert len(calls) == 1
+    assert session.rollbacks == 1
+    assert session.commits == 0
+
+
+def test_retries_stop_at_max_retries():
+    session = _FakeSession()
+    calls = []
+    failures = retry_service.get_contention_metrics()["failures"]
+
+    def work(s):
+        calls.append(s)
+        raise _operational(1205, 'Lock wait timeout exceeded')
+
+    with pytest.raises(OperationalError):
+        run_in_transaction(session, work, max_retries=2)
+    assert len(calls) == 3
+    assert retry_service.get_contention_metrics()["failures"] == failures + 1
@@ -0,0 +1,66 @@
+"""
+Tests for services/write_behind_service.py
+"""
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, Part
+from services import write_behind_service
+from services.write_behind_service import WriteBehindRun
+
+
+parts = Part.__table__
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'parts.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(parts.insert().values(part_manufacturer='SMC', manufacturer_part_number='AB12',
+                                           part_key='SMC|AB12', notes_by_ai='Saved notes', content_hash='0' * 40))
+    monkeypatch.setattr(write_behind_service, 'get_db_session', factory)
+    monkeypatch.setattr(write_behind_service, 'invalidate_for_parts', lambda session, part_ids: None)
+    yield factory
+    engine.dispose()
+
+
+def _parts(factory):
+    with factory() as session:
+        return [tuple(row) for row in session.execute(
+            select(parts.c.part_key, parts.c.ai_status, parts.c.notes_by_ai, parts.c.content_hash).order_by(parts.c.id)
+        )]
+
+
+def test_rewritten_part_number_updates_the_submitted_part(session_factory):
+    run = WriteBehindRun('analysis')
+    product = {'part_manufacturer': 'SMC', 'manufacturer_part_number': 'AB12'}
+    result = {'manufacturer': 'SMC', 'part_number': 'AB-12', 'ai_status': 'Active', 'notes_by_ai': None}
+
+    run.submit([(result, product)])
+    status = run.wait(5)
+
+    assert status["persisted_rows"] == 1
+    assert _parts(session_factory) == [('SMC|AB12', 'Active', 'Saved notes', None)]
+
+
+def test_results_never_create_parts(session_factory):
+    run = WriteBehindRun('analysis')
+    product = {'part_manufacturer': 'Festo', 'manufacturer_part_number': '1'}
+
+    run.submit([({'manufacturer': 'Festo', 'part_number': '1', 'ai_status': 'Obsolete'}, product)])
+    status = run.wait(5)
+
+    assert (status["persisted_rows"], status["skipped_rows"]) == (0, 1)
+    assert len(_parts(session_factory)) == 1
+
+
+def test_results_without_a_submitted_product_are_skipped(session_factory):
+    run = WriteBehindRun('analysis')
+
+    run.submit([({'manufacturer': 'SMC', 'part_number': 'AB12', 'ai_status': 'Active'}, None)])
+
+    assert run.status()["skipped_rows"] == 1
+    assert run.status()["submitted_rows"] == 0
@@ -2,7 +2,7 @@
 
 import { useState, useRef, useCallback, useEffect } from 'react';
 import { Product, AnalysisResult, GeneralInfo as GeneralInfoType } from '@/types';
-import { uploadExcelFile, analyzeProductsStream, findReplacementsStream, exportExcelFile, saveData } from '@/lib/api';
+import { uploadExcelFile, analyzeProductsStream, findReplacementsStream, exportExcelFile, saveData, raiseAnalysisPriority } from '@/lib/api';
 import Table from '@/components/Table';
 import FieldSelector from '@/components/FieldSelector';
 import FilterBar from '@/components/FilterBar';
@@ -22,6 +22,8 @@ export default function CriticalPage() {
   const [visibleFields, setVisibleFields] = useState<Set<string>>(CRITICAL_DEFAULT_VISIBLE_FIELDS);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const abortControllerRef = useRef<(() => void) | null>(null);
+  // Run in progress, whose rows matching the filter are analyzed next
+  const activeRunRef = useRef<{ runId: string; totalProducts: number } | null>(null);
   const [isAnalyzed, setIsAnalyzed] = useState(false);
   const [isLookingForReplacements, setIsLookingForReplacements] = useState(false);
 
@@ -94,6 +96,18 @@ export default function CriticalPage() {
   // Handle filtering - memoized callback to prevent infinite loops
   const handleFilterChange = useCallback((filtered: Product[]) => {
     setFilteredProducts(filtered);
+
+    // While a run is in progress, ask for the filtered rows to be analyzed next
+    const activeRun = activeRunRef.current;
+    if (activeRun && filtered.length > 0 && filtered.length < activeRun.totalProducts) {
+      raiseAnalysisPriority(
+        activeRun.runId,
+        filtered.map((product) => ({
+          manufacturer: product.part_manufacturer || product.manufacturer || '',
+          part_number: product.manufacturer_part_number || product.part_number_ai_modified || '',
+        }))
+      ).catch((err) => console.error('Failed to raise priority:', err));
+    }
   }, []);
 
   const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -140,6 +154,7 @@ export default function CriticalPage() {
         products,
         (event) => {
           if (event.type === 'start') {
+            activeRunRef.current = event.run_id ? { runId: event.run_id, totalProducts: event.total_products } : null;
             const skippedMsg = event.total_skipped > 0 ? ` (${event.total_skipped} skipped - no stocking decision)` : '';
             setProgress(`Processing ${event.total_products} parts in ${event.total_chunks} chunks...${skippedMsg}`);
           } else if (event.type === 'chunk_start') {
@@ -154,10 +169,12 @@ export default function CriticalPage() {
             setProducts((prev) => mergeResultsIntoProducts(prev, event.results));
             const skippedMsg = event.total_skipped > 0 ? ` (${event.total_skipped} skipped - no stocking decision)` : '';
             setProgress(`Analysis complete! Analyzed ${event.total_analyzed} products.${skippedMsg}`);
+            activeRunRef.current = null;
             setAnalyzing(false);
             setIsAnalyzed(true);
           } else if (event.type === 'error') {
             setError(event.message || 'Analysis error occurred');
+            activeRunRef.current = null;
             setAnalyzing(false);
           }
         },
@@ -200,6 +217,7 @@ export default function CriticalPage() {
         obsoleteProducts,
         (event) => {
           if (event.type === 'start') {
+            activeRunRef.current = event.run_id ? { runId: event.run_id, totalProducts: event.total_products } : null;
             setProgress(`Finding replacements for ${event.total_products} obsolete products in ${event.total_chunks} chunks...`);
           } else if (event.type === 'chunk_start') {
             setProgress(`Processing chunk ${event.chunk}/${event.total_chunks} (${event.products_in_chunk} products)...`);
@@ -260,9 +278,11 @@ export default function CriticalPage() {
               })
             );
             setProgress(`Replacement search complete! Processed ${event.total_analyzed} products.`);
+            activeRunRef.current = null;
             setIsLookingForReplacements(false);
           } else if (event.type === 'error') {
             setError(event.message || 'Replacement search error occurred');
+            activeRunRef.current = null;
             setIsLookingForReplacements(false);
           }
         },
@@ -362,6 +382,7 @@ export default function CriticalPage() {
       abortControllerRef.current();
       abortControllerRef.current = null;
     }
+    activeRunRef.current = null;
     setAnalyzing(false);
     setProgress('');
   };
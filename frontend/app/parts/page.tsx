@@ -8,6 +8,20 @@ import PartsFilterBar from '@/components/PartsFilterBar';
 import FieldSelector from '@/components/FieldSelector';
 import { FIELD_CONFIGS, CRITICAL_DEFAULT_VISIBLE_FIELDS } from '@/lib/fieldConfig';
 
+// Part fields the page needs whatever columns are visible: row identity, the
+// filter bar, the replacement lookup and the machines column
+const REQUIRED_PART_FIELDS = [
+  'id',
+  'part_manufacturer',
+  'manufacturer_part_number',
+  'part_number_ai_modified',
+  'part_description',
+  'notes',
+  'notes_by_ai',
+  'ai_status',
+  'machines',
+];
+
 export default function PartsPage() {
   const [parts, setParts] = useState<Part[]>([]);
   const [filteredParts, setFilteredParts] = useState<Part[]>([]);
@@ -19,6 +33,8 @@ export default function PartsPage() {
   const [isLookingForReplacements, setIsLookingForReplacements] = useState(false);
   const [progress, setProgress] = useState<string>('');
   const abortControllerRef = useRef<(() => void) | null>(null);
+  // Fields the loaded parts carry; columns shown later are fetched on demand
+  const loadedFieldsRef = useRef<Set<string>>(new Set());
 
   const normalize = useCallback((value?: string) => value?.trim().toUpperCase() || '', []);
 
@@ -31,13 +47,15 @@ export default function PartsPage() {
     setLoading(true);
     setError('');
     try {
-      // Fetch parts and machines in parallel
+      // Fetch parts (only the fields in use) and machines in parallel
+      const fields = Array.from(new Set([...REQUIRED_PART_FIELDS, ...Array.from(visibleFields)]));
       const [partsResponse, machinesResponse] = await Promise.all([
-        getParts({ limit: 10000 }), // Get all parts
+        getParts({ fields, limit: 10000 }), // Get all parts
         getMachines()
       ]);
 
       if (partsResponse.success) {
+        loadedFieldsRef.current = new Set(fields);
         setParts(partsResponse.parts);
         setFilteredParts(partsResponse.parts);
         setTotal(partsResponse.total);
@@ -55,6 +73,29 @@ export default function PartsPage() {
     }
   };
 
+  // Fetch the columns of newly shown fields and merge them into the loaded parts
+  useEffect(() => {
+    if (loading) return;
+    const missing = Array.from(visibleFields).filter((field) => !loadedFieldsRef.current.has(field));
+    if (missing.length === 0) return;
+    missing.forEach((field) => loadedFieldsRef.current.add(field));
+
+    getParts({ fields: ['id', ...missing], limit: 10000 })
+      .then((response) => {
+        if (!response.success) {
+          throw new Error(response.error || 'Failed to fetch part fields');
+        }
+        const fieldsById = new Map(response.parts.map((part): [number, Part] => [part.id, part]));
+        const merge = (part: Part) => ({ ...part, ...fieldsById.get(part.id) });
+        setParts((prev) => prev.map(merge));
+        setFilteredParts((prev) => prev.map(merge));
+      })
+      .catch((err) => {
+        missing.forEach((field) => loadedFieldsRef.current.delete(field));
+        setError(err instanceof Error ? err.message : 'Failed to fetch part fields');
+      });
+  }, [visibleFields, loading]);
+
   // Handle filtering - memoized callback to prevent infinite loops
   const handleFilterChange = useCallback((filtered: Part[]) => {
     setFilteredParts(filtered);
@@ -47,10 +47,12 @@ export async function analyzeProducts(
   return response.json();
 }
 
+// persist: write results to the database as chunks complete; "persistence" events report the lag
 export function analyzeProductsStream(
   products: Product[],
   onEvent: (event: any) => void,
-  onError?: (error: Error) => void
+  onError?: (error: Error) => void,
+  options?: { persist?: boolean }
 ): () => void {
   const abortController = new AbortController();
 
@@ -62,6 +64,7 @@ export function analyzeProductsStream(
     body: JSON.stringify({
       products,
       stream: true,
+      persist: options?.persist ?? false,
     }),
     signal: abortController.signal,
   })
@@ -110,10 +113,12 @@ export function analyzeProductsStream(
   };
 }
 
+// persist: write results to the database as chunks complete; "persistence" events report the lag
 export function findReplacementsStream(
   products: Product[],
   onEvent: (event: any) => void,
-  onError?: (error: Error) => void
+  onError?: (error: Error) => void,
+  options?: { persist?: boolean }
 ): () => void {
   const abortController = new AbortController();
   fetch(`${API_BASE_URL}/api/find_replacements`, {
@@ -123,6 +128,7 @@ export function findReplacementsStream(
     },
     body: JSON.stringify({
       products,
+      persist: options?.persist ?? false,
     }),
     signal: abortController.signal,
   })
@@ -168,6 +174,25 @@ export function findReplacementsStream(
     abortController.abort();
   }
 }
+// Analyze the given rows of a running analysis or replacement search next (run_id from its "start" event)
+export async function raiseAnalysisPriority(
+  runId: string,
+  products: { manufacturer: string; part_number: string }[]
+): Promise<{ success: boolean; boosted?: number; error?: string }> {
+  const response = await fetch(`${API_BASE_URL}/api/analyze/priority`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      run_id: runId,
+      products,
+    }),
+  });
+
+  return response.json();
+}
+
 export async function exportExcelFile({cols, products}: {cols: FieldConfig[], products: any[]}): Promise<void> {
   const response = await fetch(`${API_BASE_URL}/api/excel/export`, {
     method: 'POST',
@@ -272,6 +297,7 @@ export interface GetPartsRequest {
   ai_status?: string;
   machine_id?: number;
   search?: string;
+  fields?: string[];
   limit?: number;
   offset?: number;
 }
@@ -312,6 +338,7 @@ export async function getParts(filters?: GetPartsRequest): Promise<GetPartsRespo
   if (filters?.ai_status) params.append('ai_status', filters.ai_status);
   if (filters?.machine_id) params.append('machine_id', filters.machine_id.toString());
   if (filters?.search) params.append('search', filters.search);
+  if (filters?.fields?.length) params.append('fields', filters.fields.join(','));
   if (filters?.limit) params.append('limit', filters.limit.toString());
   if (filters?.offset) params.append('offset', filters.offset.toString());
 
@@ -325,6 +352,88 @@ export async function getParts(filters?: GetPartsRequest): Promise<GetPartsRespo
   return response.json();
 }
 
+export interface PartsStreamTrailer {
+  trailer: true;
+  success: boolean;
+  count: number;
+  offset: number;
+  limit: number | null;
+  error?: string;
+}
+
+export function getPartsStream(
+  filters: GetPartsRequest | undefined,
+  onParts: (parts: Part[]) => void,
+  onComplete?: (trailer: PartsStreamTrailer) => void,
+  onError?: (error: Error) => void
+): () => void {
+  const abortController = new AbortController();
+  const params = new URLSearchParams();
+  if (filters?.ai_status) params.append('ai_status', filters.ai_status);
+  if (filters?.machine_id) params.append('machine_id', filters.machine_id.toString());
+  if (filters?.search) params.append('search', filters.search);
+  if (filters?.fields?.length) params.append('fields', filters.fields.join(','));
+  if (filters?.limit) params.append('limit', filters.limit.toString());
+  if (filters?.offset) params.append('offset', filters.offset.toString());
+
+  fetch(`${API_BASE_URL}/api/parts?${params.toString()}`, {
+    headers: {
+      Accept: 'application/x-ndjson',
+    },
+    signal: abortController.signal,
+  })
+    .then(async (response) => {
+      if (!response.ok) {
+        throw new Error('Failed to fetch parts');
+      }
+
+      const reader = response.body?.getReader();
+      const decoder = new TextDecoder();
+
+      if (!reader) {
+        throw new Error('No response body');
+      }
+
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+
+        // Hand over every complete line of this read as one batch
+        const batch: Part[] = [];
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const data = JSON.parse(line);
+          if (data.trailer) {
+            if (!data.success && onError) {
+              onError(new Error(data.error || 'Failed to fetch parts'));
+            }
+            onComplete?.(data);
+          } else {
+            batch.push(data);
+          }
+        }
+        if (batch.length) {
+          onParts(batch);
+        }
+      }
+    })
+    .catch((error) => {
+      if (error.name !== 'AbortError' && onError) {
+        onError(error);
+      }
+    });
+
+  return () => {
+    abortController.abort();
+  };
+}
+
 export async function getMachines(): Promise<GetMachinesResponse> {
   const response = await fetch(`${API_BASE_URL}/api/parts/machines`);
 
@@ -336,6 +445,160 @@ export async function getMachines(): Promise<GetMachinesResponse> {
   return response.json();
 }
 
+export interface PartsChangesResponse {
+  success: boolean;
+  since: string | null;
+  next_since: string | null;
+  parts: Part[];
+  machines: Array<Omit<Machine, 'parts_count'> & { eam_equipment_id?: string; updated_at?: string }>;
+  machine_parts: Array<{
+    id: number;
+    machine_id: number;
+    part_id: number;
+    quantity: number;
+    cspl_line_number?: string;
+    original_order?: string;
+    parent_folder?: string;
+    updated_at?: string;
+  }>;
+  deleted: {
+    parts: number[];
+    machines: number[];
+    machine_parts: number[];
+  };
+  error?: string;
+}
+
+// Rows changed since the previous call's next_since (omit since for a full snapshot).
+// Rows may repeat across calls, so merge them by id.
+export async function getPartsChanges(since?: string | null, fields?: string[]): Promise<PartsChangesResponse> {
+  const params = new URLSearchParams();
+  if (since) params.append('since', since);
+  if (fields?.length) params.append('fields', fields.join(','));
+
+  const response = await fetch(`${API_BASE_URL}/api/parts/changes?${params.toString()}`);
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({ error: 'Failed to fetch part changes' }));
+    throw new Error(error.error || 'Failed to fetch part changes');
+  }
+
+  return response.json();
+}
+
+export interface PartLookupResult {
+  index: number;
+  found: boolean;
+  stale: boolean;
+  part: {
+    id: number;
+    ai_status?: string;
+    ai_confidence?: string;
+    ai_confidence_confirmed?: string;
+    notes_by_ai?: string;
+    recommended_replacement?: string;
+    replacement_manufacturer?: string;
+    replacement_price?: number;
+    replacement_currency?: string;
+    replacement_source_type?: string;
+    replacement_source_url?: string;
+    replacement_notes?: string;
+    replacement_confidence?: string;
+    updated_at?: string;
+  } | null;
+}
+
+export interface LookupPartsResponse {
+  success: boolean;
+  results: PartLookupResult[];
+  summary: {
+    total: number;
+    known: number;
+    unknown: number;
+    stale: number;
+  };
+  error?: string;
+}
+
+export async function lookupParts(products: any[], maxAgeDays?: number): Promise<LookupPartsResponse> {
+  const response = await fetch(`${API_BASE_URL}/api/parts/lookup`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ products, max_age_days: maxAgeDays }),
+  });
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({ error: 'Failed to look up parts' }));
+    throw new Error(error.error || 'Failed to look up parts');
+  }
+
+  return response.json();
+}
+
+export interface RunSummary {
+  run_id: string;
+  analysis_type: 'analysis' | 'replacements';
+  status: 'running' | 'completed' | 'incomplete';
+  started_at: string;
+  completed_at: string | null;
+  total_products?: number;
+  total_analyzed?: number;
+  total_skipped?: number;
+  total_results?: number;
+  chunks?: number;
+  chunks_failed?: number;
+  duration_seconds?: number;
+}
+
+export interface RunsResponse {
+  success: boolean;
+  runs: RunSummary[];
+  total: number;
+  limit: number;
+  offset: number;
+  error?: string;
+}
+
+export interface RunDetailResponse {
+  success: boolean;
+  run: RunSummary;
+  results: any[];
+  errors: Array<{
+    chunk: number;
+    error: string;
+    failed_products: Array<{ manufacturer: string; part_number: string }>;
+  }>;
+  error?: string;
+}
+
+// Past analysis and replacement runs, newest first
+export async function getRuns(limit: number = 50, offset: number = 0, analysisType?: string): Promise<RunsResponse> {
+  const params = new URLSearchParams({ limit: String(limit), offset: String(offset) });
+  if (analysisType) params.append('analysis_type', analysisType);
+
+  const response = await fetch(`${API_BASE_URL}/api/runs?${params.toString()}`);
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({ error: 'Failed to fetch runs' }));
+    throw new Error(error.error || 'Failed to fetch runs');
+  }
+
+  return response.json();
+}
+
+export async function getRun(runId: string): Promise<RunDetailResponse> {
+  const response = await fetch(`${API_BASE_URL}/api/runs/${encodeURIComponent(runId)}`);
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({ error: 'Failed to fetch run' }));
+    throw new Error(error.error || 'Failed to fetch run');
+  }
+
+  return response.json();
+}
+
 export interface UpdatePartsRequest {
   parts: Array<{
     id: number;
@@ -354,6 +617,7 @@ export interface UpdatePartsResponse {
   success: boolean;
   updated: number;
   errors: string[];
+  failed_ids?: number[];
   error?: string;
 }
 
@@ -96,16 +96,27 @@ export interface AnalyzeResponse {
 }
 
 export interface StreamEvent {
-  type: 'start' | 'chunk_start' | 'chunk_complete' | 'progress' | 'result' | 'complete' | 'error';
+  type: 'start' | 'chunk_start' | 'chunk_complete' | 'progress' | 'result' | 'complete' | 'error' | 'controller' | 'critical_complete';
   message?: string;
+  run_id?: string;
+  lane?: 'interactive' | 'bulk';
   chunk?: number;
   total_chunks?: number;
   products_in_chunk?: number;
   total_products?: number;
+  // Critical products are analyzed first; "critical_complete" reports when all have results
+  total_critical?: number;
+  priority?: number;
+  seconds?: number;
   data?: {
     results: AnalysisResult[];
   };
   results?: AnalysisResult[];
   total_analyzed?: number;
+  // "controller" events: chunk size and concurrency chosen by the backend
+  chunk_size?: number;
+  concurrency?: number;
+  action?: string;
+  reason?: string;
 }
 